@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""Memory benchmark for Scheme lists.
+
+Usage: python3 benchmarks/cons_memory.py [LENGTH]
+
+Builds lists of LENGTH elements (default 1000000) with scm_list and
+scm_append and reports the number of bytes allocated per cons cell, both
+for cells alone (every element is the same Number) and for cells whose
+elements are freshly boxed Numbers.
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheme_primitives import Number, scm_append, scm_list
+from ucb import main
+
+def allocated_per_item(build, n):
+    """The number of bytes still allocated after calling BUILD(), divided
+    by N, together with BUILD's result (kept alive while measuring)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n, result
+
+@main
+def run(n = 1000000):
+    n = int(n)
+    one = Number(1)
+    shared = [one] * n
+    chunks = 10
+    chunk = [one] * (n // chunks)
+
+    def list_of_shared():
+        return scm_list(*shared)
+
+    def append_of_chunks():
+        return scm_append(*[scm_list(*chunk) for _ in range(chunks)])
+
+    def list_of_numbers():
+        return scm_list(*[Number(i) for i in range(n)])
+
+    print("{0} elements per list".format(n))
+    for name, build in (("scm_list, cells only", list_of_shared),
+                        ("scm_append, cells only", append_of_chunks),
+                        ("scm_list, cells + Numbers", list_of_numbers)):
+        per_item, result = allocated_per_item(build, n)
+        print("{0:28} {1:7.1f} bytes per cons cell".format(name, per_item))
+        del result
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Benchmark for equal? on large, shared and cyclic structures.
+
+Usage: python3 benchmarks/equal.py [LENGTH]
+
+Times equal? on two distinct lists of LENGTH numbers (default 1000000),
+on two such lists that differ only in their last element, on two trees of
+depth 1000 in which each node's car and cdr are the same subtree (2**1000
+leaves when unfolded), and on cyclic lists of LENGTH pairs, with the same
+period and with periods 1 and 2.  Comparison runs with the Python
+recursion limit lowered to RECURSION_LIMIT, so it fails if equal?'s stack
+use depends on the input.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheme_primitives import NULL, Pair, Symbol, make_number, scm_equalp
+from ucb import main
+
+RECURSION_LIMIT = 200
+
+def number_list(n, last = None):
+    """A list of N numbers, the last of them LAST if given.  The numbers
+    are too large to be cached by make_number, so that no two lists share
+    them."""
+    result = NULL
+    if last is not None:
+        result, n = Pair(make_number(last), result), n - 1
+    for i in range(n, 0, -1):
+        result = Pair(make_number(i + 10000), result)
+    return result
+
+def shared_tree(depth):
+    tree = Symbol.string_to_symbol("leaf")
+    for _ in range(depth):
+        tree = Pair(tree, tree)
+    return tree
+
+def cycle(n, period):
+    """A list of N pairs whose cdrs, after the last, start again PERIOD
+    pairs from the end."""
+    result = number_list(n)
+    last = result
+    while last.cdr is not NULL:
+        last = last.cdr
+    target = result
+    for _ in range(n - period):
+        target = target.cdr
+    last.cdr = target
+    return result
+
+def timed(x, y):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    try:
+        start = time.perf_counter()
+        result = scm_equalp(x, y)
+        return time.perf_counter() - start, result
+    finally:
+        sys.setrecursionlimit(limit)
+
+@main
+def run(length = 1000000):
+    n = int(length)
+    cases = (
+        ("equal lists", number_list(n), number_list(n)),
+        ("lists differing at end", number_list(n), number_list(n, -1)),
+        ("shared trees", shared_tree(1000), shared_tree(1000)),
+        ("equal cycles", cycle(n, 2), cycle(n, 2)),
+        ("cycles, periods 1 and 2", cycle(n, 1), cycle(n, 2)),
+    )
+    for name, x, y in cases:
+        elapsed, result = timed(x, y)
+        print("{0:24} {1:3} {2:8.3f} s".format(name, str(result), elapsed))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Scaling benchmark for parallel-map.
+
+Usage: python3 benchmarks/parallel.py [ITEMS [WORKERS ...]]
+
+Counts the ways to change each of ITEMS (default 32) amounts of money
+with map, and then with parallel-map using each number of WORKERS
+processes (by default 1, 2, 4, ... up to the number of CPUs), and
+reports the times and the speedups over map.  The pool of workers is
+started before it is timed.  Run it from the directory containing
+scheme_prelude.scm.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheme
+from ucb import main
+
+PROGRAM = """
+(define (count-change amount coins)
+  (cond ((= amount 0) 1)
+        ((or (< amount 0) (null? coins)) 0)
+        (else (+ (count-change amount (cdr coins))
+                 (count-change (- amount (car coins)) coins)))))
+(define (change amount) (count-change amount '(50 25 10 5 1)))
+"""
+
+def worker_counts():
+    """1, 2, 4, ... up to the number of CPUs, and that number itself."""
+    cpus = os.cpu_count() or 1
+    counts = []
+    n = 1
+    while n < cpus:
+        counts.append(n)
+        n *= 2
+    return counts + [cpus]
+
+def timed(interp, source):
+    start = time.perf_counter()
+    value = interp.eval_string(source)
+    return time.perf_counter() - start, str(value)
+
+@main
+def run(items = 32, *workers):
+    items = int(items)
+    workers = [int(n) for n in workers] or worker_counts()
+    interp = scheme.Interpreter()
+    interp.eval_string(PROGRAM)
+    amounts = "'({0})".format(" ".join(str(150 + i % 8) for i in range(items)))
+
+    base, expected = timed(interp, "(map change {0})".format(amounts))
+    print("{0:>8} {1:>10} {2:>8}".format("workers", "time (s)", "speedup"))
+    print("{0:>8} {1:10.3f} {2:8.2f}".format("map", base, 1))
+    for n in workers:
+        interp.set_parallel_workers(n)
+        interp.eval_string("(parallel-map change '(1))")
+        elapsed, value = timed(interp,
+                               "(parallel-map change {0})".format(amounts))
+        if value != expected:
+            print("parallel-map with {0} workers returned {1}, expected {2}"
+                  .format(n, value, expected))
+            sys.exit(1)
+        print("{0:>8} {1:10.3f} {2:8.2f}".format(n, elapsed, base / elapsed))
+    interp.close()
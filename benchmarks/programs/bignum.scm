@@ -0,0 +1,13 @@
+;;; Arithmetic on integers far beyond the machine word.
+
+(define (factorial n)
+  (define (loop i acc)
+    (if (> i n) acc (loop (+ i 1) (* acc i))))
+  (loop 1 1))
+
+(define (expo base power)
+  (if (= power 0) 1 (* base (expo base (- power 1)))))
+
+(define (benchmark)
+  (remainder (quotient (factorial 4000) (expo 3 900)) 1000003))
+; expect 590933
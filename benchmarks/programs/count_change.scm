@@ -0,0 +1,19 @@
+;;; count-change from tests.scm: cond dispatch over a tree of calls.
+
+(define (count-change total denoms max-coins)
+	(cond ((= max-coins 0) (if (= total 0) 1 0))
+		  ((= total 0) 1)
+		  ((< total 0) 0)
+		  ((null? denoms) 0)
+		  (else (+
+				(count-change (- total (car denoms)) denoms (- max-coins 1))
+				(count-change total (cdr denoms) max-coins)
+				)
+			)
+	)
+)
+
+(define us-coins '(50 25 10 5 1))
+
+(define (benchmark) (count-change 100 us-coins 100))
+; expect 292
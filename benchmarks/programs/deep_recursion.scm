@@ -0,0 +1,14 @@
+;;; Non-tail recursion 1000 calls deep, repeated.
+
+(define (sum-to n)
+  (if (= n 0)
+      0
+      (+ n (sum-to (- n 1)))))
+
+(define (repeat k)
+  (if (= k 1)
+      (sum-to 1000)
+      (begin (sum-to 1000) (repeat (- k 1)))))
+
+(define (benchmark) (repeat 15))
+; expect 500500
@@ -0,0 +1,9 @@
+;;; Doubly recursive Fibonacci: non-tail calls and small-number arithmetic.
+
+(define (fib n)
+  (if (< n 2)
+      n
+      (+ (fib (- n 1)) (fib (- n 2)))))
+
+(define (benchmark) (fib 20))
+; expect 6765
@@ -0,0 +1,45 @@
+;;; filter! and reverse! from tests.scm on a long list: pair allocation
+;;; and destructive list surgery.
+
+(define (reverse! L)
+  (define (inner_reverse! L previous)
+    (cond ((null? L) L)
+		  ((null? (cdr L))(set-cdr! L previous) L)
+	      (else
+                (define old-cdr (cdr L))
+                (set-cdr! L previous)
+                (inner_reverse! old-cdr L)
+           )
+    )
+  )
+  (inner_reverse! L '())
+)
+
+(define (filter! f L)
+   (define (inner-filter! L previous)
+		(cond ((null? L) L)
+			  ((null? (cdr L)) (cond ((f (car L)) (set-cdr! L previous) L)
+									 (else previous)
+								)
+				)
+			  (else
+					(define old-cdr (cdr L))
+					(set-cdr! L previous)
+					(cond ((f (car L)) (inner-filter! old-cdr L))
+						  (else (inner-filter! old-cdr (cdr L))))
+				)
+		)
+	)
+	(reverse! (inner-filter! L '()))
+)
+
+(define (iota n)
+  (define (loop i result)
+    (if (= i 0) result (loop (- i 1) (cons i result))))
+  (loop n '()))
+
+(define (multiple-of-3? x) (= (remainder x 3) 0))
+
+(define (benchmark)
+  (length (reverse! (filter! multiple-of-3? (iota 10000)))))
+; expect 3333
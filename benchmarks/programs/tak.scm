@@ -0,0 +1,11 @@
+;;; The Takeuchi function: procedure calls and integer comparisons.
+
+(define (tak x y z)
+  (if (not (< y x))
+      z
+      (tak (tak (- x 1) y z)
+           (tak (- y 1) z x)
+           (tak (- z 1) x y))))
+
+(define (benchmark) (tak 18 12 6))
+; expect 7
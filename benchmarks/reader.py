@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""Reader benchmark: long and deeply nested lists.
+
+Usage: python3 benchmarks/reader.py [LENGTH [DEPTH]]
+
+Reads a quoted list of LENGTH numbers (default 1000000) and a list nested
+DEPTH levels deep (default 100000), each at full size and at a tenth of
+it, with both the interactive reader (scm_read on a token Buffer) and the
+bulk Reader.  Reading runs with the Python recursion limit lowered to
+RECURSION_LIMIT, so it fails if the readers' stack use depends on the
+input, and the ratio of the two timings shows whether time is linear.
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheme
+from scheme_reader import Reader
+from ucb import main
+
+RECURSION_LIMIT = 200
+
+def long_list(n):
+    return "'(" + " ".join(map(str, range(n))) + ")\n"
+
+def nested_list(n):
+    return "(" * n + "x" + ")" * n + "\n"
+
+def read_interactive(text):
+    result = []
+    scheme.call_with_input_source(text.splitlines(True),
+                                  lambda: result.append(scheme.scm_read()))
+    return result[0]
+
+def read_bulk(text):
+    return Reader(io.StringIO(text), "<benchmark>").read()
+
+def timed(read, text):
+    """The time taken by READ(TEXT), with the recursion limit lowered."""
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    try:
+        start = time.perf_counter()
+        datum = read(text)
+        return time.perf_counter() - start, datum
+    finally:
+        sys.setrecursionlimit(limit)
+
+@main
+def run(length = 1000000, depth = 100000):
+    length, depth = int(length), int(depth)
+    for shape, make, size in (("list of", long_list, length),
+                              ("nesting", nested_list, depth)):
+        small, large = make(size // 10), make(size)
+        for name, read in (("scm_read", read_interactive),
+                           ("Reader", read_bulk)):
+            t_small, _ = timed(read, small)
+            t_large, datum = timed(read, large)
+            print("{0:8} {1} {2:>8}: {3:7.3f}s  ({4:.1f}x the time for {5})"
+                  .format(name, shape, size, t_large, t_large / t_small,
+                          size // 10))
+            del datum
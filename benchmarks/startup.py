@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""Startup-time benchmark for the Scheme interpreter.
+
+Usage: python3 benchmarks/startup.py [REPEAT]
+
+Times create_global_environment, which loads the prelude and defines the
+primitives, REPEAT times (default 20) with the parsed-prelude cache
+disabled and again with it warm, and reports the mean time of each.  Run
+it from the directory containing scheme_prelude.scm.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheme
+from ucb import main
+
+def mean_time(repeat):
+    """The mean time in seconds taken by create_global_environment."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        scheme.create_global_environment()
+    return (time.perf_counter() - start) / repeat
+
+@main
+def run(repeat = 20):
+    repeat = int(repeat)
+    cache_dir = scheme.PRELUDE_CACHE_DIR
+
+    scheme.PRELUDE_CACHE_DIR = None
+    uncached = mean_time(repeat)
+
+    scheme.PRELUDE_CACHE_DIR = cache_dir
+    scheme.create_global_environment()    # Make sure the cache is written.
+    cached = mean_time(repeat)
+
+    print("{0:24} {1:8.2f} ms".format("prelude read each time", uncached * 1e3))
+    print("{0:24} {1:8.2f} ms".format("prelude from cache", cached * 1e3))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""Benchmark suite of Scheme programs, with regression baselines.
+
+Usage: python3 benchmarks/suite.py [NAME ...] [--engine ENGINE] [--repeat N]
+                                   [--baseline FILE] [--save-baseline]
+                                   [--check] [--threshold FRACTION]
+
+Each program in benchmarks/programs (or just those NAMEd) defines a
+procedure benchmark of no arguments, followed by a "; expect" comment
+giving the value it must return.  For each engine (or just ENGINE), the
+program is loaded into a fresh global environment and (benchmark) is
+evaluated with scm_eval once to check its value and count its steps (with
+runtime statistics on, see scheme_stats) and then REPEAT more times
+(default 5) to time it.  The minimum and median times and the steps per
+second (at the minimum time) are reported.
+
+So that runs on a busy or different machine can be compared, the suite
+first times a fixed amount of plain Python work (see calibrate), and each
+program's times are also taken in units of that calibration time.  If the
+JSON baseline FILE (default benchmarks/baseline.json, which is part of
+the repository) exists, the median of each program's calibrated times is
+compared with the one stored there; --save-baseline stores this run's
+instead.  The exit status is 1 if a program returned the wrong value or,
+with --check, if its calibrated median exceeded the baseline's by more
+than FRACTION (default 0.25) or the baseline has no times for it.
+Run it from the directory containing scheme_prelude.scm.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import scheme
+from scheme_primitives import NULL, Pair, Symbol
+from ucb import main
+
+PROGRAMS_DIR = os.path.join(BENCHMARKS_DIR, "programs")
+BASELINE_FILE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+# The analyze engine uses the Python stack for Scheme calls, so the
+# deep_recursion program needs more of it than Python allows by default.
+RECURSION_LIMIT = 20000
+
+# The number of iterations of calibrate's loop, a tenth of a second or so.
+CALIBRATION_LOOPS = 100000
+
+_BENCHMARK_CALL = Pair(Symbol.string_to_symbol("benchmark"), NULL)
+
+def calibrate(repeat):
+    """The median time in seconds of REPEAT runs of a loop of Python calls,
+    attribute and dict accesses and arithmetic, the operations that the
+    interpreter's own time is mostly spent on."""
+    class Box:
+        def __init__(self, n):
+            self.n = n
+    def step(box, table, i):
+        table[i & 255] = box.n + i
+        return Box(table[i & 255] % 7)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        box, table = Box(0), {}
+        for i in range(CALIBRATION_LOOPS):
+            box = step(box, table, i)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def program_names():
+    """The names of the programs in PROGRAMS_DIR, in order."""
+    return sorted(name[:-4] for name in os.listdir(PROGRAMS_DIR)
+                  if name.endswith(".scm"))
+
+def expected_value(filename):
+    """The value given by the first "; expect" comment in FILENAME."""
+    with open(filename) as src:
+        for line in src:
+            if line.startswith("; expect "):
+                return line[len("; expect "):].rstrip("\n")
+    return None
+
+def load(filename, engine):
+    """Load FILENAME into a fresh global environment, evaluating with the
+    named engine."""
+    scheme.set_engine(engine)
+    scheme.set_turtle_backend("record")
+    scheme.create_global_environment()
+    scheme.call_with_input_file(filename, scheme.read_eval_print)
+
+def count_steps(filename, engine):
+    """The value of (benchmark) in FILENAME, as a string, and the number of
+    expressions evaluated to compute it."""
+    stats = scheme.enable_runtime_stats()
+    try:
+        load(filename, engine)
+        stats.reset()
+        value = str(scheme.scm_eval(_BENCHMARK_CALL))
+        return value, sum(stats.steps.values())
+    finally:
+        scheme.disable_runtime_stats()
+
+def time_runs(filename, engine, repeat):
+    """The times in seconds of REPEAT evaluations of (benchmark) in
+    FILENAME, after one to warm up."""
+    load(filename, engine)
+    scheme.scm_eval(_BENCHMARK_CALL)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scheme.scm_eval(_BENCHMARK_CALL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def read_baseline(filename):
+    """The baseline in FILENAME: the calibrated times of each program,
+    keyed by "NAME/ENGINE".  None if there is no such file."""
+    try:
+        with open(filename) as inp:
+            return json.load(inp)
+    except FileNotFoundError:
+        return None
+
+@main
+def run(*argv):
+    parser = argparse.ArgumentParser(description="Scheme benchmark suite")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="programs to run (default: all)")
+    parser.add_argument("--engine", choices=sorted(scheme.ENGINES),
+                        help="engine to run them with (default: each)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timed runs of each (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, metavar="FILE",
+                        help="JSON baseline to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these times in the baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 if a program is slower "
+                             "than its baseline by more than the threshold")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        metavar="FRACTION",
+                        help="slowdown relative to the baseline that counts "
+                             "as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    names = args.names or program_names()
+    engines = [args.engine] if args.engine else sorted(scheme.ENGINES)
+    baseline = read_baseline(args.baseline)
+    if args.save_baseline:
+        baseline = baseline or {}
+    elif baseline is None:
+        message = ("No baseline in {0}; record one with --save-baseline."
+                   .format(args.baseline))
+        if args.check:
+            print("--check: " + message, file=sys.stderr)
+            sys.exit(1)
+        print(message)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+    unit = calibrate(max(args.repeat, 5))
+    print("Calibration: {0:.1f} ms".format(unit * 1e3))
+
+    failed = False
+    print("{0:16} {1:8} {2:>10} {3:>11} {4:>12} {5:>12}".format(
+        "program", "engine", "min (ms)", "median (ms)", "steps/s",
+        "vs baseline"))
+    for name in names:
+        filename = os.path.join(PROGRAMS_DIR, name + ".scm")
+        expected = expected_value(filename)
+        for engine in engines:
+            key = "{0}/{1}".format(name, engine)
+            value, steps = count_steps(filename, engine)
+            if value != expected:
+                print("{0:16} {1:8} returned {2}, expected {3}"
+                      .format(name, engine, value, expected))
+                failed = True
+                continue
+            times = time_runs(filename, engine, args.repeat)
+            best, median = min(times), statistics.median(times)
+            comparison = ""
+            if args.save_baseline:
+                baseline[key] = {"min": best / unit, "median": median / unit}
+            elif baseline is not None and key in baseline:
+                change = median / unit / baseline[key]["median"] - 1
+                comparison = "{0:+.0%}".format(change)
+                if change > args.threshold:
+                    comparison += " SLOWER"
+                    failed = failed or args.check
+            elif baseline is not None:
+                comparison = "none"
+                failed = failed or args.check
+            print("{0:16} {1:8} {2:10.1f} {3:11.1f} {4:12,.0f} {5:>12}".format(
+                name, engine, best * 1e3, median * 1e3, steps / best,
+                comparison))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(baseline, out, indent=2, sort_keys=True)
+            out.write("\n")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Soak benchmark for the symbol table.
+
+Usage: python3 benchmarks/symbols.py [COUNT [ROUNDS]]
+
+Makes COUNT (default 5000000) symbols that are dropped as soon as they
+are made, as text processing with the Simply Scheme word procedures does,
+in ROUNDS (default 10) equal rounds, and reports the resident set size
+(RSS) and the number of entries in the symbol table after each.  Both
+should stay level after the first round.  For comparison, the same is
+then done for a tenth of COUNT symbols that are all kept, as they were
+when the table referred to them strongly, and the memory each symbol then
+costs is reported.
+"""
+
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheme_primitives import Symbol, make_number, sscm_word
+from ucb import main
+
+def rss():
+    """The current resident set size in bytes, or the peak if the current
+    size is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def soak(count, rounds, kept = None):
+    """Make COUNT symbols in ROUNDS rounds, printing the RSS and table size
+    after each, and appending the symbols to the list KEPT if given.
+    Returns the RSS before and after."""
+    prefix = Symbol.string_to_symbol("word")
+    per_round = count // rounds
+    start_rss = rss()
+    made = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for i in range(made, made + per_round):
+            sym = sscm_word(prefix, make_number(i))
+            if kept is not None:
+                kept.append(sym)
+        made += per_round
+        elapsed = time.perf_counter() - start
+        print("{0:>10,} symbols  {1:8.1f} MB RSS  {2:>10,} in table  "
+              "{3:6.2f} s".format(made, rss() / 2**20, len(Symbol.symbols),
+                                  elapsed))
+    return start_rss, rss()
+
+@main
+def run(count = 5000000, rounds = 10):
+    count, rounds = int(count), int(rounds)
+    print("Transient symbols:")
+    start, end = soak(count, rounds)
+    print("RSS grew by {0:.1f} MB".format((end - start) / 2**20))
+
+    print("Kept symbols:")
+    start, end = soak(count // 10, rounds, [])
+    print("RSS grew by {0:.1f} MB, {1:.0f} bytes per symbol".format(
+        (end - start) / 2**20, (end - start) / (count // 10)))
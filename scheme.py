@@ -6,35 +6,58 @@ Author: Siyuan (Jack) He
 
 """
 
+import argparse
+import hashlib
+import multiprocessing
+import os
+import pickle
 import re
 import sys
+import threading
 import traceback
-from io import StringIO
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO, StringIO
 from ucb import main, trace
 from scheme_tokens import *
 from scheme_utils import *
 from scheme_primitives import *
+from scheme_reader import INCOMPLETE, Reader, read_token, scan_lines
+from scheme_profile import Profiler
+from scheme_stats import RuntimeStats
 from ucb import interact
 
 # Name of file containing Scheme definitions.
 SCHEME_PRELUDE_FILE = "scheme_prelude.scm"
 
+# Directory, relative to the prelude, in which its parsed form is cached
+# (None to disable the cache), and the version of the cache's format.
+PRELUDE_CACHE_DIR = "__pycache__"
+PRELUDE_CACHE_VERSION = 1
+
 class PrimitiveFunction(SchemeValue):
     """A Scheme function implemented directly in Python."""
 
-    def __init__(self, func):
-        """The function that applies Python function FUNC to its operands."""
+    def __init__(self, func, name = None):
+        """The function that applies Python function FUNC to its operands.
+        NAME (a string) is the name it is defined under."""
         self.func = func
+        self.name = name or func.__name__
 
     def type_name(self):
         return "primitive procedure"
 
     def apply_step(self, args, evaluation):
         #Jack 5:00PM.14.April.2012
+        evaluation.set_value(self.apply(args))
+
+    def apply(self, args):
+        """The value of FUNC applied to ARGS (a Python list of SchemeValues)."""
         try:
-            evaluation.set_value(self.func(*args))
-        except SystemExit as code:
-            raise sys.exit(code)
+            return self.func(*args)
+        except SystemExit:
+            raise
         except BaseException as err:
             raise SchemeError(err)
 
@@ -44,22 +67,33 @@ class PrimitiveFunction(SchemeValue):
 class LambdaFunction(SchemeValue):
     """A function defined by lambda expression or the complex define form."""
 
-    def __init__(self, formals, body, env):
+    def __init__(self, formals, body, env, code = None, scope = None,
+                 name = None):
         """A function whose formal parameter list is FORMALS (in Scheme format),
         whose body is the single Scheme expression BODY, and whose environment
         is the EnvironFrame ENV.  A lambda expression containing multiple expressions,
         such as (lambda (x) (set! y x) (+ x 1)) can be handled by
-        using (begin (set! y x) (+ x 1)) as the body."""
+        using (begin (set! y x) (+ x 1)) as the body.  CODE is the compiled
+        node for BODY (see analyze) and SCOPE the layout of the frames it
+        runs in (see lambda_scope); both are computed from BODY if not
+        given.  NAME is the name (a string) of the variable the function
+        was defined as, if any."""
         self.formals = formals
         self.body = body
         self.env = env
+        if code is None:
+            scope = lambda_scope(formals, scm_list(body), DYNAMIC_SCOPE)
+            code = analyze(body, scope, True)
+        self.code = code
+        self.scope = scope
+        self.name = name
 
     def type_name(self):
         return "closure"
 
     def apply_step(self, args, evaluation):
         #Jack 5:00PM.14.April.2012
-        evaluation.set_expr(self.body, self.env.make_call_frame(self.formals, args))
+        evaluation.set_expr(self.body, self.env.make_frame(self.scope, args))
         
         
 
@@ -74,21 +108,129 @@ class LambdaFunction(SchemeValue):
         return "LambdaFunction({0}, {1}, {2})" \
                .format(repr(self.formals), repr(self.body), repr(self.env))
 
+# The number of argument lists a memoized function remembers by default.
+MEMO_DEFAULT_SIZE = 100000
+
+# Memoized functions do not remember calls whose arguments contain more
+# pairs than this in all (which includes all cyclic arguments).
+MEMO_KEY_LIMIT = 10000
+
+class MemoFunction(SchemeValue):
+    """A function that calls PROC but remembers the values returned for the
+    MAX_SIZE argument lists it was most recently called with, so that a
+    call with equal? arguments returns the remembered value instead.  HITS
+    and MISSES count the calls that did and did not find one."""
+
+    def __init__(self, proc, max_size = MEMO_DEFAULT_SIZE, name = None):
+        self.proc = proc
+        self.max_size = max_size
+        self.name = name or getattr(proc, "name", None)
+        self.cache = OrderedDict()    # Least recently used first.
+        self.hits = self.misses = 0
+
+    def type_name(self):
+        return "memoized procedure"
+
+    def apply_step(self, args, evaluation):
+        evaluation.set_value(self.apply(args))
+
+    def apply(self, args):
+        """The value of PROC applied to ARGS, remembered or computed."""
+        key = memo_key(args)
+        cache = self.cache
+        if key is not None and key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses += 1
+        val = apply_procedure(self.proc, args)
+        if key is not None:
+            cache[key] = val
+            if len(cache) > self.max_size:
+                cache.popitem(last=False)
+        return val
+
+    def __repr__(self):
+        return "MemoFunction({0})".format(repr(self.proc))
+
+# Stand for a pair and a vector in the keys made by memo_key.
+_PAIR_KEY = object()
+_VECTOR_KEY = object()
+
+def memo_key(args):
+    """A hashable key for the Python list of SchemeValues ARGS, such that
+    lists of equal? values have equal keys, or None if ARGS contain more
+    than MEMO_KEY_LIMIT pairs and vector elements in all, or a value that
+    cannot be hashed.  The key is the values in ARGS and all their pairs'
+    cars and cdrs and vectors' elements in preorder, with each pair
+    replaced by _PAIR_KEY, each vector by _VECTOR_KEY and its length, each
+    f64vector by _VECTOR_KEY and its contents, each string by String and
+    its text, and each Number by its value."""
+    key = []
+    size = 0
+    pending = list(reversed(args))
+    while pending:
+        val = pending.pop()
+        if type(val) is Pair:
+            size += 1
+            if size > MEMO_KEY_LIMIT:
+                return None
+            key.append(_PAIR_KEY)
+            pending.append(val.cdr)
+            pending.append(val.car)
+        elif type(val) is Number:
+            num = val.num_val
+            # 1 and 1.0 are equal Python values but not equal? Numbers.
+            key.append(num if type(num) is int else (type(num), num))
+        elif type(val) is Vector:
+            size += len(val.items) + 1
+            if size > MEMO_KEY_LIMIT:
+                return None
+            key.append(_VECTOR_KEY)
+            key.append(len(val.items))
+            pending.extend(reversed(val.items))
+        elif type(val) is String:
+            key.append((String, val.text))
+        elif type(val) is F64Vector:
+            size += len(val.items) + 1
+            if size > MEMO_KEY_LIMIT:
+                return None
+            key.append(_VECTOR_KEY)
+            key.append(tuple(val.items))
+        else:
+            key.append(val)
+    key = tuple(key)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+# The contents of a frame slot whose symbol has not been defined yet.
+UNASSIGNED = object()
+
 class EnvironFrame:
 
     """An environment frame, representing a mapping from Scheme symbols to
-    Scheme values, possibly enclosed within another frame."""
-
-    def __init__(self, enclosing):
-        """An empty frame that is attached to the frame ENCLOSING."""
-        self.inner = {}
+    Scheme values, possibly enclosed within another frame.  The symbols in
+    the tuple NAMES are bound to the values in the same positions of the
+    list SLOTS, where analyzed code can find them by position (see Scope).
+    Any other symbols defined in the frame, such as all of those in the
+    global frame, are kept in the dictionary INNER."""
+
+    def __init__(self, enclosing, names = (), slots = None):
+        """A frame attached to the frame ENCLOSING that binds the symbols
+        in NAMES to the values in SLOTS, which may be UNASSIGNED."""
         self.enclosing = enclosing
+        self.names = names
+        self.slots = slots
+        self.inner = None if names else {}
 
     def __getitem__(self, sym):
-        return self.find(sym).inner[sym]
+        return self.lookup(sym)
 
     def __setitem__(self, sym, val):
-        self.find(sym).inner[sym] = val
+        self.find(sym).define(sym, val)
 
     def __repr__(self):
         if self.enclosing is None:
@@ -102,42 +244,58 @@ class EnvironFrame:
         is an error if it does not exist."""
         e = self
         while e is not None:
-            if sym in e.inner:
+            if e.binds(sym):
                 return e
             e = e.enclosing
         raise SchemeError("unknown identifier: {0}".format(str(sym)))
 
-    def make_call_frame(self, formals, vals):
-        """A new local frame attached to SELF in which the symbols in
-        the Scheme formal parameter list FORMALS are bound to the
-        Scheme values in the Python list VALS.  FORMALS has either of the
-        formats allowed by the Evaluation.check_formals method.  If
-        the last cdr in FORMALS is a null list (that is, if FORMALS is
-        an ordinary Scheme list), then the number of formals must be the same
-        as the number of VALS, and each symbol in FORMALS is bound to the
-        corresponding value in VALS.  If the last cdr in FORMALS is a
-        symbol, then the number of values in VALS  must be at least as large as
-        the number of preceding ("normal") formal symbols, and the last
-        formal symbol is bound to a Scheme list containing the remaining
-        values in VALS (which may be 0)."""
-        "*** YOUR CODE HERE ***"
-        #Jack 6:52PM.14.April.2012
-        env = EnvironFrame(self)
-        while formals.pairp():
-            if len(vals) == 0:
-                raise SchemeError('Too few arguments given')
-            env.define(formals.car, vals.pop(0))
-            formals = formals.cdr
-        if formals.nullp():
-            if len(vals) != 0:
-                raise SchemeError('Too many arguments given')
+    def binds(self, sym):
+        """True iff SYM is defined in SELF itself."""
+        if sym in self.names:
+            return self.slots[self.names.index(sym)] is not UNASSIGNED
+        return self.inner is not None and sym in self.inner
+
+    def get(self, sym):
+        """The value of SYM in SELF itself, which must define it."""
+        if sym in self.names:
+            return self.slots[self.names.index(sym)]
+        return self.inner[sym]
+
+    def lookup(self, sym):
+        """The value of SYM in SELF or the frames enclosing it."""
+        return self.find(sym).get(sym)
+
+    def make_frame(self, scope, vals):
+        """A new local frame attached to SELF, laid out as described by the
+        Scope SCOPE, in which its formals are bound to the values in the
+        Python list VALS.  The new frame takes over VALS as its list of
+        slots, so the caller must not use it afterwards."""
+        required = scope.num_required
+        if not scope.rest:
+            if len(vals) != required:
+                raise SchemeError('Too few arguments given'
+                                  if len(vals) < required else
+                                  'Too many arguments given')
         else:
-            env.define(formals, scm_list(*vals))
-        return env
+            if len(vals) < required:
+                raise SchemeError('Too few arguments given')
+            rest = NULL
+            for i in range(len(vals) - 1, required - 1, -1):
+                rest = Pair(vals[i], rest)
+            del vals[required:]
+            vals.append(rest)
+        if scope.padding:
+            vals.extend(scope.padding)
+        return EnvironFrame(self, scope.names, vals)
 
     def define(self, sym, val):
         """Define Scheme symbol SYM to have value VAL in SELF."""
-        self.inner[sym] = val
+        if sym in self.names:
+            self.slots[self.names.index(sym)] = val
+        else:
+            if self.inner is None:
+                self.inner = {}
+            self.inner[sym] = val
 
 class Evaluation:
     """An Evaluation represents the information needed to evaluate an
@@ -179,7 +337,7 @@ class Evaluation:
         if expr.symbolp():
             #Joey 11:30PM.13.April.2012
             #Jack 08:00PM.14.April.2012
-            self.set_value(self.env.find(expr).inner[expr])
+            self.set_value(self.env.lookup(expr))
         elif expr.atomp():
             self.set_value(expr)
         elif not scm_listp(expr):
@@ -313,6 +471,14 @@ class Evaluation:
             self.env.define(target.car, LambdaFunction(formals, body, self.env))
             self.set_value(UNSPEC)
 
+    def do_define_memo_form(self):
+        target = check_define_memo(self.expr)
+        body = Pair(Symbol.string_to_symbol('begin'), self.expr.cdr.cdr)
+        self.env.define(target.car,
+                        MemoFunction(LambdaFunction(target.cdr, body, self.env),
+                                     name=str(target.car)))
+        self.set_value(UNSPEC)
+
     def do_begin_form(self):
         self.check_form(2)
         for k in range(1, self.expr.length()-1):
@@ -325,14 +491,15 @@ class Evaluation:
         exprs = self.expr.cdr.cdr
         if not scm_listp(bindings):
             raise SchemeError("bad bindings list in let form")
-        symbols = NULL
+        symbols = []
         vals = []
         #Jack 04:18PM.14.April.2012
         while bindings.pairp():
-            symbols = Pair(bindings.car.car, symbols)
-            vals.insert(0,self.full_eval(bindings.car.cdr.car))
+            symbols.append(bindings.car.car)
+            vals.append(self.full_eval(bindings.car.cdr.car))
             bindings = bindings.cdr
-        let_frame = self.env.make_call_frame(symbols, vals)
+        let_frame = self.env.make_frame(Scope(tuple(symbols), len(symbols),
+                                              None), vals)
         for i in range(0, exprs.length()-1):
             self.full_eval(exprs.car, let_frame)
             exprs = exprs.cdr
@@ -351,7 +518,8 @@ class Evaluation:
             symbol = bindings.car.car
             value = self.full_eval(bindings.car.cdr.car, let_frame)
             bindings = bindings.cdr
-            let_frame = let_frame.make_call_frame(Pair(symbol,NULL), [value])
+            let_frame = let_frame.make_frame(Scope((symbol,), 1, None),
+                                             [value])
         for i in range(0, exprs.length()-1):
             self.full_eval(exprs.car, let_frame)
             exprs = exprs.cdr
@@ -389,6 +557,7 @@ class Evaluation:
     _CASE_SYM = Symbol.string_to_symbol("case")
     _COND_SYM = Symbol.string_to_symbol("cond")
     _DEFINE_SYM = Symbol.string_to_symbol("define")
+    _DEFINE_MEMO_SYM = Symbol.string_to_symbol("define-memo")
     _ELSE_SYM = Symbol.string_to_symbol("else")
     _IF_SYM = Symbol.string_to_symbol("if")
     _LAMBDA_SYM = Symbol.string_to_symbol("lambda")
@@ -406,6 +575,7 @@ class Evaluation:
         _CASE_SYM :    do_case_form,
         _COND_SYM :    do_cond_form,
         _DEFINE_SYM :  do_define_form,
+        _DEFINE_MEMO_SYM: do_define_memo_form,
         _IF_SYM :      do_if_form,
         _LAMBDA_SYM :  do_lambda_form,
         _LET_SYM :     do_let_form,
@@ -421,7 +591,12 @@ class Evaluation:
         self.check_form(1)
         op = self.full_eval(self.expr.car)
         #Jack 04:30PM.14.April.2012
-        op.apply_step([self.full_eval(self.expr.nth(x)) for x in range(1,self.expr.length())], self)
+        args = []
+        operands = self.expr.cdr
+        while operands.pairp():
+            args.append(self.full_eval(operands.car))
+            operands = operands.cdr
+        op.apply_step(args, self)
 
     # Utility methods for checking the structure of Scheme values that
     # represent programs.
@@ -432,13 +607,7 @@ class Evaluation:
         a SchemeError if this is not the case."""
         if expr is None:
             expr = self.expr
-        if not scm_listp(expr):
-            raise SchemeError("badly formed expression")
-        L = expr.length()
-        if L < min:
-            raise SchemeError("too few operands in form")
-        elif max is not None and L > max:
-            raise SchemeError("too many operands in form")
+        check_form(expr, min, max)
 
     @staticmethod
     def check_formals(formal_list):
@@ -462,6 +631,1256 @@ class Evaluation:
             if formals in formal_pylist:
                 raise SchemeError("Duplicated formals")
 
+def check_define_memo(expr):
+    """Check that EXPR is a well-formed define-memo form, (define-memo (NAME
+    . FORMALS) BODY ...), returning (NAME . FORMALS)."""
+    check_form(expr, 3)
+    target = expr.cdr.car
+    if not target.pairp() or not target.car.symbolp():
+        raise SchemeError("bad argument to define-memo")
+    Evaluation.check_formals(target.cdr)
+    return target
+
+def check_form(expr, min, max = None):
+    """Check EXPR is a proper list whose length is at least MIN and no more
+    than MAX (default: no maximum). Raises a SchemeError if this is not
+    the case."""
+    if not scm_listp(expr):
+        raise SchemeError("badly formed expression")
+    L = expr.length()
+    if L < min:
+        raise SchemeError("too few operands in form")
+    elif max is not None and L > max:
+        raise SchemeError("too many operands in form")
+
+##
+## Lexical addressing
+##
+
+# The analyzer and the bytecode compiler both resolve variable references
+# when they translate the code that contains them.  A Scope describes the
+# local frame that a lambda or let body will run in.  A reference to a
+# symbol bound by an enclosing Scope becomes a (depth, slot) address into
+# the chain of EnvironFrames; any other reference is to the global frame.
+# Bodies are scanned for internal defines before they are translated, so
+# that the symbols they define get slots too.
+
+class Scope:
+    """The symbols bound by a local frame, in slot order, as seen by the
+    code being translated.  The first NUM_FORMALS of NAMES are bound when
+    the frame is created, the last of them to a list of the remaining
+    arguments if REST is true; the others are defined by the body and are
+    UNASSIGNED until then.  ENCLOSING is the Scope of the enclosing frame,
+    None if that is the global frame, or DYNAMIC_SCOPE if it is unknown."""
+
+    def __init__(self, names, num_formals, enclosing, rest = False):
+        self.names = names
+        self.num_formals = num_formals
+        self.enclosing = enclosing
+        self.rest = rest
+        # What EnvironFrame.make_frame needs, computed once.
+        self.num_required = num_formals - 1 if rest else num_formals
+        self.padding = (UNASSIGNED,) * (len(names) - num_formals)
+
+# The enclosing Scope of code whose enclosing frames are not known when it
+# is translated.  References that reach it are looked up by name.
+DYNAMIC_SCOPE = Scope((), 0, None)
+
+def resolve(scope, sym):
+    """Where SYM is bound, as seen from code translated in SCOPE.  Returns
+    (DEPTH, S), where S is the Scope of the frame DEPTH frames out from the
+    current one that binds SYM, or None if that frame is the global frame.
+    Returns None if SYM can only be found by name at run time."""
+    depth = 0
+    while scope is not None:
+        if scope is DYNAMIC_SCOPE:
+            return None
+        if sym in scope.names:
+            return depth, scope
+        scope = scope.enclosing
+        depth += 1
+    return depth, None
+
+def lambda_scope(formals, body, enclosing):
+    """The Scope of a frame binding the Scheme formal parameter list FORMALS
+    in which the Scheme list of expressions BODY is evaluated, enclosed by
+    the Scope ENCLOSING."""
+    names = []
+    while formals.pairp():
+        names.append(formals.car)
+        formals = formals.cdr
+    rest = not formals.nullp()
+    if rest:
+        names.append(formals)
+    num_formals = len(names)
+    while body.pairp():
+        _scan_defines(body.car, names)
+        body = body.cdr
+    return Scope(tuple(names), num_formals, enclosing, rest)
+
+def _scan_defines(expr, names):
+    """Add to the list NAMES the symbols defined by the define forms in
+    EXPR that would be evaluated in the same frame as EXPR itself."""
+    if not expr.pairp():
+        return
+    op = expr.car
+    if op is _QUOTE_SYM or op is _LAMBDA_SYM:
+        return
+    elif (op is _DEFINE_SYM or op is _DEFINE_MEMO_SYM) and expr.cdr.pairp():
+        target = expr.cdr.car
+        if target.pairp():
+            target, exprs = target.car, NULL
+        else:
+            exprs = expr.cdr.cdr
+        if target.symbolp() and target not in names:
+            names.append(target)
+    elif op is _LET_SYM or op is _LET_STAR_SYM:
+        # Only the initial values (for let*, the first) are evaluated in
+        # this frame; a let* without bindings is like begin.
+        bindings = expr.cdr.car if expr.cdr.pairp() else NULL
+        if op is _LET_STAR_SYM and not bindings.pairp():
+            exprs = expr.cdr.cdr
+        else:
+            exprs = NULL
+        while bindings.pairp():
+            if bindings.car.pairp():
+                _scan_defines(bindings.car.cdr, names)
+            if op is _LET_STAR_SYM:
+                break
+            bindings = bindings.cdr
+    else:
+        exprs = expr
+    while exprs.pairp():
+        _scan_defines(exprs.car, names)
+        exprs = exprs.cdr
+
+##
+## Analysis
+##
+
+# The analyzer converts a Scheme expression, once, into a compiled node: a
+# Python function of one EnvironFrame that returns the value of the
+# expression in that frame.  All of the syntax checking that Evaluation.step
+# repeats on every visit to a form is done here, when the node is built.
+# A node built for an expression in tail position may instead return a
+# _TailCall, which apply_procedure completes without growing the Python
+# stack, so that tail calls remain properly tail-recursive.
+
+class _TailCall:
+    """A pending application of the procedure PROC to the Python list ARGS,
+    returned by a call node in tail position."""
+
+    __slots__ = ("proc", "args")
+
+    def __init__(self, proc, args):
+        self.proc = proc
+        self.args = args
+
+# Each interpreter's Profiler (see scheme_profile), to which its procedure
+# calls are reported, and RuntimeStats (see scheme_stats), which counts its
+# work, are kept in its InterpreterState.  _profiled_states is the number
+# of InterpreterStates with a Profiler, so that calls need not look up
+# their interpreter's state to find that it is not being profiled.
+_profiled_states = 0
+_profiler_lock = threading.Lock()
+
+def set_profiler(profiler):
+    """Report the current interpreter's procedure calls to the Profiler
+    PROFILER from now on (or to none, if PROFILER is None)."""
+    global _profiled_states
+    state = current_state()
+    with _profiler_lock:
+        _profiled_states += ((profiler is not None)
+                             - (state.profiler is not None))
+        state.profiler = profiler
+
+def enable_runtime_stats():
+    """Start counting the current interpreter's work, returning the
+    RuntimeStats that holds the counts.  Only code analyzed or compiled
+    while counting counts its steps."""
+    state = current_state()
+    if state.runtime_stats is None:
+        state.runtime_stats = RuntimeStats()
+        state.runtime_stats.install(EnvironFrame, PrimitiveFunction)
+    return state.runtime_stats
+
+def disable_runtime_stats():
+    """Stop counting the current interpreter's work.  Code analyzed while
+    counting still counts its steps, into the RuntimeStats it was analyzed
+    with."""
+    state = current_state()
+    if state.runtime_stats is not None:
+        state.runtime_stats.uninstall()
+        state.runtime_stats = None
+
+def step_kind(expr):
+    """The key under which evaluations of EXPR are counted: the symbol of
+    a special form, or "(call)", "(variable)" or "(constant)"."""
+    if expr.symbolp():
+        return "(variable)"
+    elif expr.atomp():
+        return "(constant)"
+    elif expr.pairp() and expr.car.symbolp() and (
+            expr.car in SPECIAL_FORM_ANALYZERS):
+        return expr.car
+    return "(call)"
+
+def procedure_name(proc):
+    """The name under which calls to PROC are profiled."""
+    name = getattr(proc, "name", None)
+    if name is not None:
+        return name
+    if isinstance(proc, LambdaFunction):
+        return "(lambda {0})".format(str(proc.formals))
+    return proc.type_name()
+
+def apply_procedure(proc, args):
+    """The value of applying the Scheme procedure PROC to ARGS, a Python
+    list of SchemeValues."""
+    if _profiled_states and current_state().profiler is not None:
+        return _apply_profiled(proc, args)
+    while True:
+        if type(proc) is LambdaFunction:
+            result = proc.code(proc.env.make_frame(proc.scope, args))
+            if type(result) is not _TailCall:
+                return result
+            proc, args = result.proc, result.args
+        elif type(proc) is PrimitiveFunction:
+            if proc.func is scm_apply and len(args) >= 2:
+                proc, args = args[0], apply_args(*args[1:])
+                continue
+            return proc.apply(args)
+        else:
+            evaluation = Evaluation(None, None)
+            proc.apply_step(args, evaluation)
+            return evaluation.step_to_value()
+
+def _apply_profiled(proc, args):
+    """As for apply_procedure, reporting each call, including each tail
+    call, to the current interpreter's profiler."""
+    profiler = current_state().profiler
+    while True:
+        if (type(proc) is PrimitiveFunction and proc.func is scm_apply
+                and len(args) >= 2):
+            proc, args = args[0], apply_args(*args[1:])
+            continue
+        profiler.enter(procedure_name(proc))
+        if type(proc) is LambdaFunction:
+            result = proc.code(proc.env.make_frame(proc.scope, args))
+        elif type(proc) is PrimitiveFunction:
+            result = proc.apply(args)
+        else:
+            evaluation = Evaluation(None, None)
+            proc.apply_step(args, evaluation)
+            result = evaluation.step_to_value()
+        profiler.exit()
+        if type(result) is not _TailCall:
+            return result
+        proc, args = result.proc, result.args
+
+def analyze(expr, scope = None, tail = False):
+    """The compiled node for the Scheme expression EXPR, to be run in frames
+    described by SCOPE (None for the global frame).  TAIL is true iff EXPR
+    is in tail position, in which case calls are left to the caller as
+    _TailCalls."""
+    stats = current_state().runtime_stats
+    if stats is not None:
+        return stats.counted(step_kind(expr), _analyze(expr, scope, tail))
+    return _analyze(expr, scope, tail)
+
+def _analyze(expr, scope, tail):
+    if expr.symbolp():
+        return analyze_symbol(expr, scope)
+    elif expr.atomp():
+        return _constant(expr)
+    elif not scm_listp(expr):
+        raise SchemeError("malformed list: {0}".format(str(expr)))
+    op = expr.car
+    if op.symbolp() and op in SPECIAL_FORM_ANALYZERS:
+        return SPECIAL_FORM_ANALYZERS[op](expr, scope, tail)
+    return analyze_call_form(expr, scope, tail)
+
+def _constant(val):
+    """A node whose value is always VAL."""
+    return lambda env: val
+
+def _is_lambda(expr):
+    """True iff EXPR is a lambda expression."""
+    return expr.pairp() and expr.car is _LAMBDA_SYM
+
+def _to_pylist(exprs):
+    """The items of the proper Scheme list EXPRS as a Python list."""
+    result = []
+    while exprs.pairp():
+        result.append(exprs.car)
+        exprs = exprs.cdr
+    return result
+
+def analyze_sequence(exprs, scope, tail):
+    """A node that evaluates the items of the non-empty Scheme list EXPRS in
+    order, returning the value of the last."""
+    exprs = _to_pylist(exprs)
+    init = tuple(analyze(expr, scope) for expr in exprs[:-1])
+    last = analyze(exprs[-1], scope, tail)
+    if not init:
+        return last
+    def sequence(env):
+        for node in init:
+            node(env)
+        return last(env)
+    return sequence
+
+def _frame_walker(depth):
+    """A function that returns the frame DEPTH frames out from its
+    argument."""
+    if depth == 0:
+        return lambda env: env
+    elif depth == 1:
+        return lambda env: env.enclosing
+    def walk(env):
+        for _ in range(depth):
+            env = env.enclosing
+        return env
+    return walk
+
+def analyze_symbol(sym, scope):
+    address = resolve(scope, sym)
+    if address is None:
+        return lambda env: env.lookup(sym)
+    depth, bound_in = address
+    if bound_in is None:
+        frame_of = _frame_walker(depth)
+        def global_lookup(env):
+            try:
+                return frame_of(env).inner[sym]
+            except KeyError:
+                raise SchemeError("unknown identifier: {0}".format(str(sym)))
+        return global_lookup
+    slot = bound_in.names.index(sym)
+    if slot >= bound_in.num_formals:
+        frame_of = _frame_walker(depth)
+        def defined_lookup(env):
+            frame = frame_of(env)
+            val = frame.slots[slot]
+            if val is UNASSIGNED:
+                return frame.enclosing.lookup(sym)
+            return val
+        return defined_lookup
+    elif depth == 0:
+        return lambda env: env.slots[slot]
+    elif depth == 1:
+        return lambda env: env.enclosing.slots[slot]
+    frame_of = _frame_walker(depth)
+    return lambda env: frame_of(env).slots[slot]
+
+def analyze_quote_form(expr, scope, tail):
+    check_form(expr, 2, 2)
+    return _constant(expr.cdr.car)
+
+def analyze_lambda_form(expr, scope, tail, name = None):
+    """As for the other analyze_..._form functions.  NAME is the name of the
+    variable the lambda expression's value is being defined as, if any."""
+    check_form(expr, 3)
+    formals = expr.cdr.car
+    Evaluation.check_formals(formals)
+    body = Pair(_BEGIN_SYM, expr.cdr.cdr)
+    body_scope = lambda_scope(formals, body, scope)
+    # The body is analyzed when a function made here is first called, so
+    # that definitions that are never used (as in the prelude) cost little.
+    code = None
+    def make_lambda(env):
+        if code is not None:
+            return LambdaFunction(formals, body, env, code, body_scope, name)
+        def first_call(frame):
+            nonlocal code
+            if code is None:
+                # _analyze, because BODY is not an expression of the
+                # program's own to be counted by runtime_stats.
+                code = _analyze(body, body_scope, True)
+            proc.code = code
+            return code(frame)
+        proc = LambdaFunction(formals, body, env, first_call, body_scope,
+                              name)
+        return proc
+    return make_lambda
+
+def analyze_if_form(expr, scope, tail):
+    check_form(expr, 3, 4)
+    test = analyze(expr.cdr.car, scope)
+    consequent = analyze(expr.cdr.cdr.car, scope, tail)
+    if expr.cdr.cdr.cdr.nullp():
+        alternative = _constant(UNSPEC)
+    else:
+        alternative = analyze(expr.cdr.cdr.cdr.car, scope, tail)
+    def if_node(env):
+        if test(env) is not FALSE:
+            return consequent(env)
+        return alternative(env)
+    return if_node
+
+def analyze_and_form(expr, scope, tail):
+    check_form(expr, 1)
+    if expr.cdr.nullp():
+        return _constant(TRUE)
+    operands = _to_pylist(expr.cdr)
+    init = tuple(analyze(operand, scope) for operand in operands[:-1])
+    last = analyze(operands[-1], scope, tail)
+    def and_node(env):
+        for node in init:
+            if node(env) is FALSE:
+                return FALSE
+        return last(env)
+    return and_node
+
+def analyze_or_form(expr, scope, tail):
+    check_form(expr, 1)
+    if expr.cdr.nullp():
+        return _constant(FALSE)
+    operands = _to_pylist(expr.cdr)
+    init = tuple(analyze(operand, scope) for operand in operands[:-1])
+    last = analyze(operands[-1], scope, tail)
+    def or_node(env):
+        for node in init:
+            value = node(env)
+            if value is not FALSE:
+                return value
+        return last(env)
+    return or_node
+
+def analyze_cond_form(expr, scope, tail):
+    check_form(expr, 1)
+    clauses = []
+    rest = expr.cdr
+    while rest.pairp():
+        clause = rest.car
+        check_form(clause, 1)
+        if clause.car is _ELSE_SYM and rest.cdr.nullp():
+            if clause.cdr.nullp():
+                raise SchemeError("badly formed else clause")
+            clauses.append((None, False,
+                            analyze_sequence(clause.cdr, scope, tail)))
+        elif clause.cdr.nullp():
+            clauses.append((analyze(clause.car, scope), False, None))
+        elif clause.cdr.car is _ARROW_SYM:
+            check_form(clause, 3, 3)
+            clauses.append((analyze(clause.car, scope), True,
+                            analyze(clause.cdr.cdr.car, scope)))
+        else:
+            clauses.append((analyze(clause.car, scope), False,
+                            analyze_sequence(clause.cdr, scope, tail)))
+        rest = rest.cdr
+    invoke = _TailCall if tail else apply_procedure
+    def cond_node(env):
+        for test, arrow, body in clauses:
+            if test is None:
+                return body(env)
+            value = test(env)
+            if value is not FALSE:
+                if body is None:
+                    return TRUE
+                elif arrow:
+                    return invoke(body(env), [value])
+                return body(env)
+        return UNSPEC
+    return cond_node
+
+def analyze_set_bang_form(expr, scope, tail):
+    check_form(expr, 3, 3)
+    target = expr.cdr.car
+    if not target.symbolp():
+        raise SchemeError("bad argument to set!")
+    value = analyze(expr.cdr.cdr.car, scope)
+    address = resolve(scope, target)
+    if address is None:
+        def set_node(env):
+            env.find(target).define(target, value(env))
+            return UNSPEC
+        return set_node
+    depth, bound_in = address
+    frame_of = _frame_walker(depth)
+    if bound_in is None:
+        def set_global_node(env):
+            frame = frame_of(env)
+            if target not in frame.inner:
+                raise SchemeError("unknown identifier: {0}".format(str(target)))
+            frame.inner[target] = value(env)
+            return UNSPEC
+        return set_global_node
+    slot = bound_in.names.index(target)
+    def set_local_node(env):
+        frame = frame_of(env)
+        if frame.slots[slot] is UNASSIGNED:
+            frame.enclosing.find(target).define(target, value(env))
+        else:
+            frame.slots[slot] = value(env)
+        return UNSPEC
+    return set_local_node
+
+def analyze_define_form(expr, scope, tail):
+    check_form(expr, 3)
+    target = expr.cdr.car
+    if target.symbolp():
+        check_form(expr, 3, 3)
+        value = expr.cdr.cdr.car
+        if _is_lambda(value):
+            value = analyze_lambda_form(value, scope, False, str(target))
+        else:
+            value = analyze(value, scope)
+    elif not target.pairp():
+        raise SchemeError("bad argument to define")
+    else:
+        value = analyze_lambda_form(Pair(_LAMBDA_SYM,
+                                         Pair(target.cdr, expr.cdr.cdr)),
+                                    scope, False, str(target.car))
+        target = target.car
+    return _analyze_definition(target, value, scope)
+
+def analyze_define_memo_form(expr, scope, tail):
+    target = check_define_memo(expr)
+    name = str(target.car)
+    make_proc = analyze_lambda_form(Pair(_LAMBDA_SYM,
+                                         Pair(target.cdr, expr.cdr.cdr)),
+                                    scope, False, name)
+    def value(env):
+        return MemoFunction(make_proc(env), name=name)
+    return _analyze_definition(target.car, value, scope)
+
+def _analyze_definition(target, value, scope):
+    """A node that defines the symbol TARGET as the value of the node
+    VALUE, in frames described by SCOPE."""
+    if scope is None or target not in scope.names:
+        def define_node(env):
+            env.define(target, value(env))
+            return UNSPEC
+        return define_node
+    slot = scope.names.index(target)
+    def define_local_node(env):
+        env.slots[slot] = value(env)
+        return UNSPEC
+    return define_local_node
+
+def analyze_begin_form(expr, scope, tail):
+    check_form(expr, 2)
+    return analyze_sequence(expr.cdr, scope, tail)
+
+def _parse_bindings(bindings, form_name):
+    """The symbols and the initial value expressions in the Scheme list
+    of let bindings BINDINGS, as a pair of Python lists."""
+    if not scm_listp(bindings):
+        raise SchemeError("bad bindings list in {0} form".format(form_name))
+    symbols, inits = [], []
+    while bindings.pairp():
+        binding = bindings.car
+        check_form(binding, 2, 2)
+        if not binding.car.symbolp():
+            raise SchemeError("bad binding in {0} form".format(form_name))
+        symbols.append(binding.car)
+        inits.append(binding.cdr.car)
+        bindings = bindings.cdr
+    return symbols, inits
+
+def analyze_let_form(expr, scope, tail):
+    check_form(expr, 3)
+    symbols, inits = _parse_bindings(expr.cdr.car, "let")
+    formals = scm_list(*symbols)
+    inits = tuple(analyze(init, scope) for init in inits)
+    body_scope = lambda_scope(formals, expr.cdr.cdr, scope)
+    body = analyze_sequence(expr.cdr.cdr, body_scope, tail)
+    def let_node(env):
+        return body(env.make_frame(body_scope,
+                                   [init(env) for init in inits]))
+    return let_node
+
+def analyze_let_star_form(expr, scope, tail):
+    check_form(expr, 3)
+    symbols, inits = _parse_bindings(expr.cdr.car, "let*")
+    # Each binding gets a frame of its own, in which the next initial value
+    # (or, for the last, the body) is evaluated.
+    bindings = []
+    for k, sym in enumerate(symbols):
+        init = analyze(inits[k], scope)
+        formals = scm_list(sym)
+        if k + 1 < len(symbols):
+            scope = lambda_scope(formals, scm_list(inits[k+1]), scope)
+        else:
+            scope = lambda_scope(formals, expr.cdr.cdr, scope)
+        bindings.append((init, scope))
+    body = analyze_sequence(expr.cdr.cdr, scope, tail)
+    def let_star_node(env):
+        for init, binding_scope in bindings:
+            env = env.make_frame(binding_scope, [init(env)])
+        return body(env)
+    return let_star_node
+
+def analyze_case_form(expr, scope, tail):
+    check_form(expr, 2)
+    key = analyze(expr.cdr.car, scope)
+    clauses = []
+    rest = expr.cdr.cdr
+    while rest.pairp():
+        clause = rest.car
+        check_form(clause, 2)
+        if clause.car is _ELSE_SYM:
+            if not rest.cdr.nullp():
+                raise SchemeError("badly formed else clause")
+            data = None
+        else:
+            data = tuple(_to_pylist(clause.car))
+        clauses.append((data, analyze_sequence(clause.cdr, scope, tail)))
+        rest = rest.cdr
+    def case_node(env):
+        value = key(env)
+        for data, body in clauses:
+            if data is None:
+                return body(env)
+            for datum in data:
+                if value.eqvp(datum):
+                    return body(env)
+        return UNSPEC
+    return case_node
+
+def analyze_call_form(expr, scope, tail):
+    check_form(expr, 1)
+    operator = analyze(expr.car, scope)
+    operands = tuple(analyze(operand, scope)
+                     for operand in _to_pylist(expr.cdr))
+    invoke = _TailCall if tail else apply_procedure
+    def call_node(env):
+        return invoke(operator(env), [operand(env) for operand in operands])
+    return call_node
+
+_ARROW_SYM = Evaluation._ARROW_SYM
+_BEGIN_SYM = Evaluation._BEGIN_SYM
+_DEFINE_SYM = Evaluation._DEFINE_SYM
+_DEFINE_MEMO_SYM = Evaluation._DEFINE_MEMO_SYM
+_ELSE_SYM = Evaluation._ELSE_SYM
+_LAMBDA_SYM = Evaluation._LAMBDA_SYM
+_LET_SYM = Evaluation._LET_SYM
+_LET_STAR_SYM = Evaluation._LET_STAR_SYM
+_QUOTE_SYM = Evaluation._QUOTE_SYM
+
+# Mapping of symbols that introduce special forms to the functions that
+# analyze them.
+SPECIAL_FORM_ANALYZERS = {
+    Evaluation._AND_SYM :     analyze_and_form,
+    Evaluation._BEGIN_SYM :   analyze_begin_form,
+    Evaluation._CASE_SYM :    analyze_case_form,
+    Evaluation._COND_SYM :    analyze_cond_form,
+    Evaluation._DEFINE_SYM :  analyze_define_form,
+    Evaluation._DEFINE_MEMO_SYM: analyze_define_memo_form,
+    Evaluation._IF_SYM :      analyze_if_form,
+    Evaluation._LAMBDA_SYM :  analyze_lambda_form,
+    Evaluation._LET_SYM :     analyze_let_form,
+    Evaluation._LET_STAR_SYM: analyze_let_star_form,
+    Evaluation._OR_SYM :      analyze_or_form,
+    Evaluation._QUOTE_SYM  :  analyze_quote_form,
+    Evaluation._SET_BANG_SYM: analyze_set_bang_form,
+}
+
+##
+## Bytecode virtual machine
+##
+
+# A second execution engine.  compile_expr translates a Scheme expression
+# into a CodeObject: a flat array of (opcode, argument) pairs plus a table
+# of constants.  vm_execute runs a CodeObject with an explicit value stack.
+# Lambda bodies are compiled once, when the enclosing form is compiled, and
+# every expression in tail position ends either in TAILCALL or RETURN.
+# Local variables are addressed by (depth, slot), packed into one argument
+# as depth << 16 | slot, so slots must be less than MAX_LOCAL_SLOTS and
+# depths less than MAX_LOCAL_DEPTH for the argument to fit in an int.
+MAX_LOCAL_SLOTS = 1 << 16
+MAX_LOCAL_DEPTH = 1 << 15
+
+_OPNAMES = (
+    "LOAD_CONST",           # push constants[arg]
+    "LOAD_LOCAL",           # push the value at local address arg
+    "LOAD_GLOBAL",          # push the global value of constants[arg]
+    "STORE_LOCAL",          # pop a value, set! local address arg;
+                            # push UNSPEC
+    "STORE_GLOBAL",         # pop a value, set! global constants[arg];
+                            # push UNSPEC
+    "DEFINE_LOCAL",         # pop a value, define slot arg of the current
+                            # frame; push UNSPEC
+    "DEFINE_NAME",          # pop a value, define constants[arg] in the
+                            # current frame; push UNSPEC
+    "MAKE_CLOSURE",         # push a BytecodeFunction for constants[arg]
+    "POP_TOP",              # discard the top of the stack
+    "DUP_TOP",              # push the top of the stack again
+    "ROT_TWO",              # swap the two topmost stack items
+    "JUMP",                 # continue at instruction arg
+    "JUMP_IF_FALSE",        # pop; continue at arg if the value was #f
+    "JUMP_IF_FALSE_OR_POP", # if top is #f continue at arg, else pop it
+    "JUMP_IF_TRUE_OR_POP",  # if top is not #f continue at arg, else pop it
+    "CASE_MATCH",           # push whether top is eqv? to an item of
+                            # the tuple constants[arg]
+    "CALL",                 # call a procedure on the arg values above it
+    "TAILCALL",             # as CALL, replacing the running code
+    "RETURN",               # return the top of the stack
+    "COUNT",                # count an evaluation of constants[arg] in
+                            # runtime_stats (emitted only when enabled)
+)
+
+(LOAD_CONST, LOAD_LOCAL, LOAD_GLOBAL, STORE_LOCAL, STORE_GLOBAL,
+ DEFINE_LOCAL, DEFINE_NAME, MAKE_CLOSURE, POP_TOP, DUP_TOP, ROT_TWO, JUMP,
+ JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, CASE_MATCH, CALL,
+ TAILCALL, RETURN, COUNT) = range(len(_OPNAMES))
+
+def _constant_key(val):
+    """The key under which CodeObject.constant interns VAL.  Equal Numbers
+    (see Number.__eq__) share a constant.  Other values are shared only if
+    they are the same object, since quoted lists and strings that are equal
+    may still be told apart by eq? or modified."""
+    if type(val) is Number:
+        return Number, val
+    return type(val), id(val)
+
+class CodeObject:
+    """Compiled bytecode for a top-level expression or a lambda body.
+    CODE is an array of integers holding (opcode, argument) pairs, and
+    CONSTANTS is the list of values that the arguments of LOAD_CONST,
+    LOAD_GLOBAL, and similar instructions index."""
+
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []
+        # The index in SELF.constants of each constant, by _constant_key.
+        self.constant_index = {}
+
+    def emit(self, op, arg = 0):
+        """Append the instruction OP with argument ARG, returning its
+        index in SELF.code."""
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 2
+
+    def constant(self, val):
+        """The index of VAL in SELF.constants, adding it if necessary."""
+        key = _constant_key(val)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(val)
+        return index
+
+    def here(self):
+        """The index of the next instruction to be emitted."""
+        return len(self.code)
+
+    def patch(self, at, target):
+        """Make the jump instruction emitted at index AT jump to TARGET."""
+        self.code[at+1] = target
+
+    def disassemble(self):
+        """A human-readable listing of SELF."""
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc+1]
+            line = "{0:4} {1:21} {2}".format(pc, _OPNAMES[op], arg)
+            if op in (LOAD_CONST, LOAD_GLOBAL, STORE_GLOBAL, DEFINE_NAME,
+                      CASE_MATCH, COUNT):
+                line += " ({0})".format(self.constants[arg])
+            elif op in (LOAD_LOCAL, STORE_LOCAL):
+                line += " (depth {0}, slot {1})".format(arg >> 16,
+                                                         arg & 0xFFFF)
+            lines.append(line)
+        return "\n".join(lines)
+
+class BytecodeFunction(LambdaFunction):
+    """A LambdaFunction whose body has been compiled to the CodeObject
+    BYTECODE, for execution by the virtual machine.  Its frames are laid
+    out as described by SCOPE, and GLOBALS is the global frame at the root of ENV."""
+
+    def __init__(self, formals, body, env, bytecode, scope, globals,
+                 name = None):
+        # The body is already compiled, so LambdaFunction's analysis of it
+        # is not needed.
+        self.formals = formals
+        self.body = body
+        self.env = env
+        self.bytecode = bytecode
+        self.scope = scope
+        self.globals = globals
+        self.name = name
+
+    def apply_step(self, args, evaluation):
+        evaluation.set_value(
+            vm_execute(self.bytecode,
+                       self.env.make_frame(self.scope, args),
+                       self.globals))
+
+# A call that is waiting, on the virtual machine's control stack, for the
+# value of a call it made is kept as the tuple (CODE_OBJ, PC, ENV, GLOBALS,
+# BASE): the running CodeObject, the index of its next instruction, its
+# environment and global frame, and the height of the value stack when it
+# started.  Tuples are quicker to make than instances of a class.
+
+def continuation_size():
+    """The number of bytes taken by each pending call on the virtual
+    machine's control stack, not counting the EnvironFrame that every
+    engine creates for a call."""
+    return sys.getsizeof((None, 0, None, None, 0))
+
+def vm_execute(code_obj, env, globals = None):
+    """The value of running the CodeObject CODE_OBJ in environment ENV,
+    whose global frame is GLOBALS (by default, ENV itself).  Calls between
+    BytecodeFunctions do not use the Python stack: a non-tail call pushes
+    a continuation onto an explicit control stack, and RETURN pops it."""
+    if globals is None:
+        globals = env
+    # The opcodes tested most often, as locals, which are quicker to read
+    # than globals.
+    (load_local, load_global, load_const, call, tailcall, jump_if_false,
+     ret) = (LOAD_LOCAL, LOAD_GLOBAL, LOAD_CONST, CALL, TAILCALL,
+             JUMP_IF_FALSE, RETURN)
+    state = current_state()
+    max_depth = state.vm_max_depth
+    code, constants = code_obj.code, code_obj.constants
+    stack = []
+    push, pop = stack.append, stack.pop
+    frames = []
+    pc = base = 0
+    # When profiling, the profiler's stack holds an entry for each call of
+    # a BytecodeFunction in progress here, above its first PROFILE_BASE.
+    profile_base = (len(state.profiler.stack)
+                    if state.profiler is not None else 0)
+    while True:
+        op = code[pc]
+        arg = code[pc+1]
+        pc += 2
+        if op == load_local:
+            if arg < 0x10000:
+                # Most variables are in the current frame (depth 0).
+                frame = env
+                val = frame.slots[arg]
+            else:
+                frame = env
+                depth = arg >> 16
+                while depth:
+                    frame = frame.enclosing
+                    depth -= 1
+                val = frame.slots[arg & 0xFFFF]
+            if val is UNASSIGNED:
+                val = frame.enclosing.lookup(frame.names[arg & 0xFFFF])
+            push(val)
+        elif op == load_global:
+            try:
+                push(globals.inner[constants[arg]])
+            except KeyError:
+                raise SchemeError("unknown identifier: {0}"
+                                  .format(str(constants[arg])))
+        elif op == load_const:
+            push(constants[arg])
+        elif op == call or op == tailcall:
+            start = len(stack) - arg
+            proc = stack[start-1]
+            args = stack[start:]
+            del stack[start-1:]
+            if (op == call and type(proc) is PrimitiveFunction
+                    and proc.func is not scm_apply and not _profiled_states):
+                # The commonest call, as apply_procedure would make it.
+                push(proc.apply(args))
+                continue
+            while (type(proc) is PrimitiveFunction and proc.func is scm_apply
+                   and len(args) >= 2):
+                proc, args = args[0], apply_args(*args[1:])
+            if type(proc) is BytecodeFunction:
+                if op == call:
+                    if max_depth is not None and len(frames) >= max_depth:
+                        raise SchemeError("maximum recursion depth exceeded")
+                    frames.append((code_obj, pc, env, globals, base))
+                    base = len(stack)
+                profiler = state.profiler
+                if profiler is not None:
+                    if op == tailcall and len(profiler.stack) > profile_base:
+                        profiler.exit()
+                    profiler.enter(procedure_name(proc))
+                env = proc.env.make_frame(proc.scope, args)
+                globals = proc.globals
+                code_obj = proc.bytecode
+                code, constants = code_obj.code, code_obj.constants
+                pc = 0
+            elif op == call:
+                push(apply_procedure(proc, args))
+            else:
+                val = apply_procedure(proc, args)
+                profiler = state.profiler
+                if profiler is not None and len(profiler.stack) > profile_base:
+                    profiler.exit()
+                if not frames:
+                    return val
+                code_obj, pc, env, globals, base = frames.pop()
+                code, constants = code_obj.code, code_obj.constants
+                push(val)
+        elif op == jump_if_false:
+            if pop() is FALSE:
+                pc = arg
+        elif op == ret:
+            val = pop()
+            profiler = state.profiler
+            if profiler is not None and len(profiler.stack) > profile_base:
+                profiler.exit()
+            if not frames:
+                return val
+            code_obj, pc, env, globals, base = frames.pop()
+            code, constants = code_obj.code, code_obj.constants
+            push(val)
+        elif op == JUMP:
+            pc = arg
+        elif op == POP_TOP:
+            pop()
+        elif op == JUMP_IF_FALSE_OR_POP:
+            if stack[-1] is FALSE:
+                pc = arg
+            else:
+                pop()
+        elif op == JUMP_IF_TRUE_OR_POP:
+            if stack[-1] is not FALSE:
+                pc = arg
+            else:
+                pop()
+        elif op == MAKE_CLOSURE:
+            formals, body, bytecode, scope, name = constants[arg]
+            push(BytecodeFunction(formals, body, env, bytecode, scope,
+                                  globals, name))
+        elif op == DEFINE_LOCAL:
+            env.slots[arg] = pop()
+            push(UNSPEC)
+        elif op == DEFINE_NAME:
+            env.define(constants[arg], pop())
+            push(UNSPEC)
+        elif op == STORE_LOCAL:
+            frame = env
+            depth = arg >> 16
+            while depth:
+                frame = frame.enclosing
+                depth -= 1
+            slot = arg & 0xFFFF
+            if frame.slots[slot] is UNASSIGNED:
+                frame.enclosing.find(frame.names[slot]).define(
+                    frame.names[slot], pop())
+            else:
+                frame.slots[slot] = pop()
+            push(UNSPEC)
+        elif op == STORE_GLOBAL:
+            sym = constants[arg]
+            if sym not in globals.inner:
+                raise SchemeError("unknown identifier: {0}".format(str(sym)))
+            globals.inner[sym] = pop()
+            push(UNSPEC)
+        elif op == CASE_MATCH:
+            value = stack[-1]
+            push(FALSE)
+            for datum in constants[arg]:
+                if value.eqvp(datum):
+                    stack[-1] = TRUE
+                    break
+        elif op == DUP_TOP:
+            push(stack[-1])
+        elif op == ROT_TWO:
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        elif op == COUNT:
+            if state.runtime_stats is not None:
+                state.runtime_stats.count(constants[arg])
+        else:
+            raise SchemeError("bad opcode: {0}".format(op))
+
+def compile_toplevel(expr):
+    """A CodeObject that computes the value of the Scheme expression EXPR."""
+    code = CodeObject()
+    compile_expr(expr, code, None, True)
+    return code
+
+def compile_expr(expr, code, scope, tail):
+    """Append to the CodeObject CODE instructions that evaluate the Scheme
+    expression EXPR in frames described by SCOPE.  If TAIL is true, those
+    instructions return the value from CODE; otherwise they leave it on
+    the stack."""
+    if current_state().runtime_stats is not None:
+        code.emit(COUNT, code.constant(step_kind(expr)))
+    if expr.symbolp():
+        _compile_variable(expr, code, scope, LOAD_LOCAL, LOAD_GLOBAL)
+        _compile_return(code, tail)
+    elif expr.atomp():
+        _compile_constant(expr, code, tail)
+    elif not scm_listp(expr):
+        raise SchemeError("malformed list: {0}".format(str(expr)))
+    elif expr.car.symbolp() and expr.car in SPECIAL_FORM_COMPILERS:
+        SPECIAL_FORM_COMPILERS[expr.car](expr, code, scope, tail)
+    else:
+        compile_call_form(expr, code, scope, tail)
+
+def _compile_variable(sym, code, scope, local_op, global_op):
+    """Emit LOCAL_OP or GLOBAL_OP, whichever addresses SYM from SCOPE."""
+    depth, bound_in = resolve(scope, sym)
+    if bound_in is None:
+        code.emit(global_op, code.constant(sym))
+    else:
+        slot = bound_in.names.index(sym)
+        if slot >= MAX_LOCAL_SLOTS:
+            raise SchemeError("too many local variables: {0}".format(sym))
+        if depth >= MAX_LOCAL_DEPTH:
+            raise SchemeError("procedures nested too deeply: {0}".format(sym))
+        code.emit(local_op, depth << 16 | slot)
+
+def _compile_return(code, tail):
+    if tail:
+        code.emit(RETURN)
+
+def _compile_constant(val, code, tail):
+    code.emit(LOAD_CONST, code.constant(val))
+    _compile_return(code, tail)
+
+def compile_sequence(exprs, code, scope, tail):
+    """Compile the items of the non-empty Scheme list EXPRS in order,
+    keeping only the value of the last."""
+    while not exprs.cdr.nullp():
+        compile_expr(exprs.car, code, scope, False)
+        code.emit(POP_TOP)
+        exprs = exprs.cdr
+    compile_expr(exprs.car, code, scope, tail)
+
+def compile_quote_form(expr, code, scope, tail):
+    check_form(expr, 2, 2)
+    _compile_constant(expr.cdr.car, code, tail)
+
+def compile_lambda_form(expr, code, scope, tail, name = None):
+    """As for the other compile_..._form functions.  NAME is the name of the
+    variable the lambda expression's value is being defined as, if any."""
+    check_form(expr, 3)
+    formals = expr.cdr.car
+    Evaluation.check_formals(formals)
+    body = Pair(_BEGIN_SYM, expr.cdr.cdr)
+    body_scope = lambda_scope(formals, expr.cdr.cdr, scope)
+    bytecode = CodeObject()
+    compile_sequence(expr.cdr.cdr, bytecode, body_scope, True)
+    code.emit(MAKE_CLOSURE,
+              code.constant((formals, body, bytecode, body_scope, name)))
+    _compile_return(code, tail)
+
+def compile_if_form(expr, code, scope, tail):
+    check_form(expr, 3, 4)
+    compile_expr(expr.cdr.car, code, scope, False)
+    to_alternative = code.emit(JUMP_IF_FALSE)
+    compile_expr(expr.cdr.cdr.car, code, scope, tail)
+    if not tail:
+        to_end = code.emit(JUMP)
+    code.patch(to_alternative, code.here())
+    if expr.cdr.cdr.cdr.nullp():
+        _compile_constant(UNSPEC, code, tail)
+    else:
+        compile_expr(expr.cdr.cdr.cdr.car, code, scope, tail)
+    if not tail:
+        code.patch(to_end, code.here())
+
+def _compile_short_circuit(expr, code, scope, tail, jump, empty_value):
+    """Compile an and or or form EXPR, testing each operand but the last
+    with the instruction JUMP.  EMPTY_VALUE is the value of the form with
+    no operands."""
+    check_form(expr, 1)
+    if expr.cdr.nullp():
+        _compile_constant(empty_value, code, tail)
+        return
+    jumps = []
+    operands = expr.cdr
+    while not operands.cdr.nullp():
+        compile_expr(operands.car, code, scope, False)
+        jumps.append(code.emit(jump))
+        operands = operands.cdr
+    compile_expr(operands.car, code, scope, tail)
+    for at in jumps:
+        code.patch(at, code.here())
+    if jumps:
+        _compile_return(code, tail)
+
+def compile_and_form(expr, code, scope, tail):
+    _compile_short_circuit(expr, code, scope, tail,
+                           JUMP_IF_FALSE_OR_POP, TRUE)
+
+def compile_or_form(expr, code, scope, tail):
+    _compile_short_circuit(expr, code, scope, tail,
+                           JUMP_IF_TRUE_OR_POP, FALSE)
+
+def compile_cond_form(expr, code, scope, tail):
+    check_form(expr, 1)
+    to_end = []
+    clauses = expr.cdr
+    while clauses.pairp():
+        clause = clauses.car
+        check_form(clause, 1)
+        if clause.car is _ELSE_SYM and clauses.cdr.nullp():
+            if clause.cdr.nullp():
+                raise SchemeError("badly formed else clause")
+            compile_sequence(clause.cdr, code, scope, tail)
+            break
+        compile_expr(clause.car, code, scope, False)
+        if clause.cdr.nullp():
+            to_next = code.emit(JUMP_IF_FALSE)
+            _compile_constant(TRUE, code, tail)
+        elif clause.cdr.car is _ARROW_SYM:
+            check_form(clause, 3, 3)
+            code.emit(DUP_TOP)
+            to_next = code.emit(JUMP_IF_FALSE)
+            compile_expr(clause.cdr.cdr.car, code, scope, False)
+            code.emit(ROT_TWO)
+            code.emit(TAILCALL if tail else CALL, 1)
+            if not tail:
+                to_end.append(code.emit(JUMP))
+            code.patch(to_next, code.here())
+            code.emit(POP_TOP)
+            clauses = clauses.cdr
+            continue
+        else:
+            to_next = code.emit(JUMP_IF_FALSE)
+            compile_sequence(clause.cdr, code, scope, tail)
+        if not tail:
+            to_end.append(code.emit(JUMP))
+        code.patch(to_next, code.here())
+        clauses = clauses.cdr
+    else:
+        _compile_constant(UNSPEC, code, tail)
+    for at in to_end:
+        code.patch(at, code.here())
+
+def compile_set_bang_form(expr, code, scope, tail):
+    check_form(expr, 3, 3)
+    target = expr.cdr.car
+    if not target.symbolp():
+        raise SchemeError("bad argument to set!")
+    compile_expr(expr.cdr.cdr.car, code, scope, False)
+    _compile_variable(target, code, scope, STORE_LOCAL, STORE_GLOBAL)
+    _compile_return(code, tail)
+
+def compile_define_form(expr, code, scope, tail):
+    check_form(expr, 3)
+    target = expr.cdr.car
+    if target.symbolp():
+        check_form(expr, 3, 3)
+        value = expr.cdr.cdr.car
+        if _is_lambda(value):
+            compile_lambda_form(value, code, scope, False, str(target))
+        else:
+            compile_expr(value, code, scope, False)
+    elif not target.pairp():
+        raise SchemeError("bad argument to define")
+    else:
+        compile_lambda_form(Pair(_LAMBDA_SYM, Pair(target.cdr, expr.cdr.cdr)),
+                            code, scope, False, str(target.car))
+        target = target.car
+    _compile_definition(target, code, scope, tail)
+
+def compile_define_memo_form(expr, code, scope, tail):
+    target = check_define_memo(expr)
+    code.emit(LOAD_CONST, code.constant(_MEMOIZE))
+    compile_lambda_form(Pair(_LAMBDA_SYM, Pair(target.cdr, expr.cdr.cdr)),
+                        code, scope, False, str(target.car))
+    code.emit(CALL, 1)
+    _compile_definition(target.car, code, scope, tail)
+
+def _compile_definition(target, code, scope, tail):
+    """Emit code that defines the symbol TARGET as the value on top of the
+    stack."""
+    if scope is None or target not in scope.names:
+        code.emit(DEFINE_NAME, code.constant(target))
+    else:
+        code.emit(DEFINE_LOCAL, scope.names.index(target))
+    _compile_return(code, tail)
+
+def compile_begin_form(expr, code, scope, tail):
+    check_form(expr, 2)
+    compile_sequence(expr.cdr, code, scope, tail)
+
+def compile_let_form(expr, code, scope, tail):
+    check_form(expr, 3)
+    symbols, inits = _parse_bindings(expr.cdr.car, "let")
+    lambda_expr = Pair(_LAMBDA_SYM, Pair(scm_list(*symbols), expr.cdr.cdr))
+    compile_call_form(Pair(lambda_expr, scm_list(*inits)), code, scope, tail)
+
+def compile_let_star_form(expr, code, scope, tail):
+    check_form(expr, 3)
+    symbols, inits = _parse_bindings(expr.cdr.car, "let*")
+    if not symbols:
+        compile_sequence(expr.cdr.cdr, code, scope, tail)
+        return
+    body = expr.cdr.cdr
+    for sym, init in reversed(list(zip(symbols, inits))):
+        bindings = scm_list(scm_list(sym, init))
+        body = scm_list(Pair(_LET_SYM, Pair(bindings, body)))
+    compile_expr(body.car, code, scope, tail)
+
+def compile_case_form(expr, code, scope, tail):
+    check_form(expr, 2)
+    compile_expr(expr.cdr.car, code, scope, False)
+    to_end = []
+    clauses = expr.cdr.cdr
+    while clauses.pairp():
+        clause = clauses.car
+        check_form(clause, 2)
+        if clause.car is _ELSE_SYM:
+            if not clauses.cdr.nullp():
+                raise SchemeError("badly formed else clause")
+            code.emit(POP_TOP)
+            compile_sequence(clause.cdr, code, scope, tail)
+            break
+        code.emit(CASE_MATCH, code.constant(tuple(_to_pylist(clause.car))))
+        to_next = code.emit(JUMP_IF_FALSE)
+        code.emit(POP_TOP)
+        compile_sequence(clause.cdr, code, scope, tail)
+        if not tail:
+            to_end.append(code.emit(JUMP))
+        code.patch(to_next, code.here())
+        clauses = clauses.cdr
+    else:
+        code.emit(POP_TOP)
+        _compile_constant(UNSPEC, code, tail)
+    for at in to_end:
+        code.patch(at, code.here())
+
+def compile_call_form(expr, code, scope, tail):
+    check_form(expr, 1)
+    compile_expr(expr.car, code, scope, False)
+    operands = expr.cdr
+    while operands.pairp():
+        compile_expr(operands.car, code, scope, False)
+        operands = operands.cdr
+    code.emit(TAILCALL if tail else CALL, expr.length() - 1)
+
+# Mapping of symbols that introduce special forms to the functions that
+# compile them.
+SPECIAL_FORM_COMPILERS = {
+    Evaluation._AND_SYM :     compile_and_form,
+    Evaluation._BEGIN_SYM :   compile_begin_form,
+    Evaluation._CASE_SYM :    compile_case_form,
+    Evaluation._COND_SYM :    compile_cond_form,
+    Evaluation._DEFINE_SYM :  compile_define_form,
+    Evaluation._DEFINE_MEMO_SYM: compile_define_memo_form,
+    Evaluation._IF_SYM :      compile_if_form,
+    Evaluation._LAMBDA_SYM :  compile_lambda_form,
+    Evaluation._LET_SYM :     compile_let_form,
+    Evaluation._LET_STAR_SYM: compile_let_star_form,
+    Evaluation._OR_SYM :      compile_or_form,
+    Evaluation._QUOTE_SYM  :  compile_quote_form,
+    Evaluation._SET_BANG_SYM: compile_set_bang_form,
+}
+
+##
+## Engine selection
+##
+
+# The functions that evaluate a Scheme expression in an environment, by the
+# name of the engine that does the work.
+ENGINES = {
+    "analyze": lambda expr, env: analyze(expr)(env),
+    "vm":      lambda expr, env: vm_execute(compile_toplevel(expr), env),
+}
+
+def set_engine(name):
+    """Make the engine named NAME (a key of ENGINES) evaluate all further
+    expressions passed to scm_eval by the current interpreter."""
+    if name not in ENGINES:
+        raise SchemeError("unknown engine: {0}".format(name))
+    current_state().engine = name
+
 def scm_eval(sexpr):
     # To begin with, this function simply returns SEXPR unchanged, without
     # doing any evaluation.  This allows you to test your solution to
@@ -474,7 +1893,17 @@ def scm_eval(sexpr):
     # which is what evaluation is supposed to do.
 
     #Joey 11:30PM.13.April.2012
-    return Evaluation(sexpr, the_global_environment).step_to_value()
+    state = current_state()
+    profiler = state.profiler
+    profile_depth = len(profiler.stack) if profiler is not None else 0
+    try:
+        return ENGINES[state.engine](sexpr, state.global_environment)
+    except RecursionError:
+        raise SchemeError("maximum recursion depth exceeded")
+    finally:
+        # Calls abandoned by an error never report their ends.
+        if profiler is not None:
+            profiler.unwind(profile_depth)
     # return sexpr
 
 def scm_apply(func, arg0, *other_args):
@@ -483,6 +1912,11 @@ def scm_apply(func, arg0, *other_args):
     the last value in OTHER_ARGS are first added (with scm_cons) to
     the beginning of the last argument in OTHER_ARGS (which must be 
     a Scheme list), and then passed to the value of FUNC."""
+    return apply_procedure(func, apply_args(arg0, *other_args))
+
+def apply_args(arg0, *other_args):
+    """The Python list of arguments that (apply f ARG0 OTHER_ARGS...)
+    passes to f."""
     if other_args:
         check_type(other_args[-1], scm_listp, len(other_args), 'apply')
         args = [arg0]
@@ -497,29 +1931,33 @@ def scm_apply(func, arg0, *other_args):
     while not rest.nullp():
         args.append(rest.car)
         rest = rest.cdr
-    
-    evaluation = Evaluation(None, None)
-    func.apply_step(args, evaluation)
-    return evaluation.step_to_value()
+    return args
 
 
 def call_with_input_file(filename, proc):
     """Temporarily set the current input port to the file named by FILENAME,
-    (a string) and call PROC.  Always restores the input port when done."""
+    (a string) and call PROC.  Always restores the input port when done.
+    The file is read in bulk by a Reader."""
+    state = current_state()
     with scheme_open(filename) as inp:
-        call_with_input_source(inp, proc)
+        input_port0 = state.input_port
+        try:
+            state.input_port = Reader(inp)
+            proc()
+        finally:
+            state.input_port = input_port0
 
 def call_with_input_source(source, proc):
     """Temporarily set the current input port to read lines from the
     SOURCE (an iterator returning lines or a string).  Always restores
     the input port when done."""
-    global input_port
-    input_port0 = input_port
+    state = current_state()
+    input_port0 = state.input_port
     try:
-        input_port = Buffer(tokenize_lines(source))
+        state.input_port = Buffer(scan_lines(source))
         proc()
     finally:
-        input_port = input_port0
+        state.input_port = input_port0
     
 def read_eval_print(prompt = None):
     """Read and evaluate from the current input port until the end of file.
@@ -527,9 +1965,10 @@ def read_eval_print(prompt = None):
     each expression."""
     while True:
         try:
+            out = current_output()
             if prompt is not None:
-                print(prompt, end = "")
-            sys.stdout.flush()
+                print(prompt, end = "", file=out)
+            out.flush()
             expr = scm_read()
             if expr is THE_EOF_OBJECT:
                 return
@@ -538,56 +1977,417 @@ def read_eval_print(prompt = None):
                 scm_write(val)
                 scm_newline()
         except SchemeError as exc:
-            if not exc.args[0]:
-                print("Error", file=sys.stderr)
-            else:
-                print("Error: {0}".format(exc.args[0]), file=sys.stderr)
-            sys.stderr.flush()
+            report_error(exc)
+
+def report_error(exc):
+    """Print the SchemeError EXC on the current interpreter's error
+    output."""
+    err = current_error_output()
+    if not exc.args[0]:
+        print("Error", file=err)
+    else:
+        print("Error: {0}".format(exc.args[0]), file=err)
+    err.flush()
 
 def scm_read():
-    def read_tail():
-        """Assuming that input is positioned inside a Scheme list or pair,
-        immediately before a final parenthesis or another item in the list,
-        return the remainder of the list from that point.  Thus, returns
-        (2 3) when positioned at the carat in "(1 ^ 2 3)", returns
-        () when positioned at the carat in "(1 2 3 ^ )", and returns
-        the pair (2 . 3) when positioned at the carat in (1 ^ 2 . 3)."""
-        if input_port.current is None:
-            raise SchemeError("unexpected EOF")
-        syntax, val = input_port.current
-        "*** YOUR CODE HERE ***"
-        #Jack 04:30PM.09.April.2012
-        if syntax == ')':
-            input_port.pop()
-            return NULL
-        elif syntax == '.':
-            input_port.pop()
-            result = scm_read()
-            input_port.pop()
-            return result
-        else:
-            first = scm_read()
-            rest = read_tail()
-            return Pair(first, rest)
-
+    """The next datum from the current input port, or THE_EOF_OBJECT if
+    there is none.  Lists are built by appending to their last pair, on an
+    explicit stack (see read_token), so that neither long nor deeply
+    nested lists are limited by Python's recursion limit."""
+    input_port = current_state().input_port
+    if type(input_port) is Reader:
+        return input_port.read()
     if input_port.current is None:
         return THE_EOF_OBJECT
+    stack = []
+    while True:
+        token = input_port.pop()
+        if token is None:
+            raise SchemeError("unexpected EOF")
+        datum = read_token(stack, *token)
+        if datum is not INCOMPLETE:
+            return datum
 
-    syntax, val = input_port.pop()
+def scm_profile_start():
+    """Start profiling procedure calls, discarding any earlier profile."""
+    set_profiler(Profiler())
+    return UNSPEC
 
-    if syntax == NUMERAL:
-        return Number(val)
-    elif syntax == BOOLEAN:
-        return boolify(val)
-    elif syntax == SYMBOL:
-        return Symbol.string_to_symbol(val)
-    elif syntax == "'":
-        #Jack 04:30PM.09.April.2012
-        return Pair(Symbol.string_to_symbol('quote'),Pair(scm_read(),NULL))
-    elif syntax == "(":
-        return read_tail()
+def scm_profile_report(sym = None):
+    """Print the calls profiled since profile-start, most self time first,
+    or, given the symbol SYM, write them as collapsed stacks (for flamegraph
+    tools) to the file it names."""
+    profiler = current_state().profiler
+    if profiler is None:
+        raise SchemeError("profiling has not been started")
+    if sym is None:
+        profiler.report(current_output())
+    else:
+        check_type(sym, scm_symbolp, 0, "profile-report")
+        with open(str(sym), "w") as out:
+            profiler.write_collapsed(out)
+    return UNSPEC
+
+def scm_runtime_stats():
+    """Print the counts of the interpreter's work (see scheme_stats)."""
+    runtime_stats = current_state().runtime_stats
+    if runtime_stats is None:
+        raise SchemeError("runtime statistics are off (run with --stats)")
+    runtime_stats.report(current_output())
+    return UNSPEC
+
+def scm_memoize(proc, max_size = None):
+    """A memoized version of the procedure PROC that remembers the values
+    for at most MAX_SIZE (default MEMO_DEFAULT_SIZE) argument lists."""
+    check_type(proc, _procedurep, 0, "memoize")
+    if max_size is None:
+        max_size = MEMO_DEFAULT_SIZE
     else:
-        raise SchemeError("unexpected token: {0}".format(repr(val)))
+        check_type(max_size, scm_integerp, 1, "memoize")
+        max_size = max_size.num_val
+        if max_size < 1:
+            raise SchemeError("memoize: size must be positive")
+    return MemoFunction(proc, max_size)
+
+# The memoize primitive, as called by compiled define-memo forms.
+_MEMOIZE = PrimitiveFunction(scm_memoize, "memoize")
+
+def scm_memo_stats(proc):
+    """The list (HITS MISSES SIZE) for the memoized procedure PROC: the
+    numbers of its calls that found and did not find a remembered value,
+    and the number of values it remembers now."""
+    check_type(proc, lambda val: type(val) is MemoFunction, 0, "memo-stats")
+    return scm_list(make_number(proc.hits), make_number(proc.misses),
+                    make_number(len(proc.cache)))
+
+def scm_make_hash_table(equivalence = None):
+    """A new, empty hash table whose keys are compared with EQUIVALENCE,
+    which is the eq?, eqv? or equal? primitive (by default equal?)."""
+    if equivalence is None:
+        return EqualHashTable()
+    for pred, table_class in ((scm_eqp, EqHashTable), (scm_eqvp, HashTable),
+                              (scm_equalp, EqualHashTable)):
+        if type(equivalence) is PrimitiveFunction and equivalence.func is pred:
+            return table_class()
+    raise SchemeError("make-hash-table: equivalence must be eq?, eqv? or "
+                      "equal?")
+
+def _procedurep(val):
+    return isinstance(val, (PrimitiveFunction, LambdaFunction, MemoFunction))
+
+##
+## Parallel map
+##
+
+# The number of pieces parallel-map splits its work into per worker, so
+# that pieces that take longer than others do not leave workers idle.  Each
+# interpreter has its own pool of workers (see InterpreterState).
+PARALLEL_CHUNKS_PER_WORKER = 4
+
+# True in a worker process, where parallel-map runs sequentially.
+_in_parallel_worker = False
+
+def set_parallel_workers(workers):
+    """Make the current interpreter's parallel-map use WORKERS processes
+    (None for one per CPU) from now on."""
+    current_state().parallel_workers = workers
+    _close_parallel_pool()
+
+def _close_parallel_pool():
+    state = current_state()
+    if state.parallel_pool is not None:
+        state.parallel_pool.terminate()
+        state.parallel_pool.join()
+        state.parallel_pool = None
+
+def _get_parallel_pool():
+    """The current interpreter's pool of worker processes, as many as its
+    parallel_workers, running its engine, with global environments made
+    from the same primitives and prelude as its own."""
+    state = current_state()
+    if (state.parallel_pool is not None
+            and state.parallel_engine != state.engine):
+        _close_parallel_pool()
+    if state.parallel_pool is None:
+        state.parallel_pool = multiprocessing.Pool(
+            state.parallel_workers, initializer=_init_parallel_worker,
+            initargs=(state.engine, state.primitives, state.prelude))
+        state.parallel_engine = state.engine
+    return state.parallel_pool
+
+def _init_parallel_worker(engine, primitives, prelude):
+    """Prepare a worker process: a fresh global environment, in which the
+    procedures sent to it are defined (see _SchemePickler)."""
+    global _in_parallel_worker
+    _in_parallel_worker = True
+    set_current_state(InterpreterState(engine, turtle="record"))
+    create_global_environment(primitives, prelude)
+
+class _SchemePickler(pickle.Pickler):
+    """Pickles Scheme values, including procedures, for another process
+    running the same prelude.  Values predefined in the global environment
+    (see create_global_environment) are sent by name, to be replaced by
+    the receiver's own, and other closures by their formals, body and
+    environment, from which the receiver makes a closure anew.  The global
+    frame becomes the receiver's global frame, in which the receiver
+    defines the bindings in the dict GLOBALS, if given (workers are sent
+    those a procedure refers to, see _referenced_globals; results are
+    sent back without any).  A list is sent as the Python list of its
+    cars and its last cdr, so that pickling a long list does not recurse
+    once per element, and a hash table as its entries.  Symbols and Chars
+    are unpickled as the receiver's interned ones (see their __reduce__
+    methods), and primitives as the receiver's own."""
+
+    def __init__(self, file, globals = None):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.globals = globals
+        self.predefined = {id(val): sym for sym, val
+                           in _predefined_bindings(
+                               current_state().global_environment)}
+
+    def reducer_override(self, obj):
+        if type(obj) is EnvironFrame:
+            if obj.enclosing is not None:
+                return NotImplemented
+            if not self.globals:
+                return _receiver_globals, ()
+            return (_receiver_globals, (), self.globals, None, None,
+                    _define_all)
+        if obj is UNASSIGNED or obj is UNSPEC or obj is THE_EOF_OBJECT:
+            return _shared_constant, (_SHARED_CONSTANTS.index(obj),)
+        sym = self.predefined.get(id(obj))
+        if sym is not None and isinstance(obj, SchemeValue):
+            return _receiver_global, (sym,)
+        if type(obj) is Pair:
+            return _new_pair, (), _pair_chain(obj), None, None, _init_pairs
+        if isinstance(obj, HashTable):
+            return (type(obj), (), list(obj.entries.values()), None, None,
+                    _init_hash_table)
+        if type(obj) is PrimitiveFunction:
+            return _primitive_named, (obj.name,)
+        if isinstance(obj, LambdaFunction):
+            return (_new_closure, (),
+                    (obj.formals, obj.body, obj.env, obj.name,
+                     _frame_names(obj.env)),
+                    None, None, _init_closure)
+        if type(obj) is MemoFunction:
+            return MemoFunction, (obj.proc, obj.max_size, obj.name)
+        return NotImplemented
+
+def _predefined_bindings(frame):
+    """The (symbol, value) pairs that create_global_environment defined in
+    the global FRAME."""
+    return getattr(frame, "predefined", {}).items()
+
+def _referenced_globals(proc):
+    """The bindings in the current global environment, other than the
+    predefined ones, that the procedure PROC refers to: those of the
+    symbols in its body and in the procedures and data in its environment,
+    and in turn in the values of those bindings.  Symbols that a program
+    makes as it runs (with string->symbol) are not found."""
+    frame = current_state().global_environment
+    predefined = dict(_predefined_bindings(frame))
+    bindings = {}
+    seen = set()
+    pending = [proc]
+    while pending:
+        val = pending.pop()
+        if id(val) in seen:
+            continue
+        seen.add(id(val))
+        kind = type(val)
+        if kind is Symbol:
+            if val in frame.inner and predefined.get(val) is not (
+                    frame.inner[val]):
+                bindings[val] = frame.inner[val]
+                pending.append(bindings[val])
+        elif kind is Pair:
+            pending.append(val.car)
+            pending.append(val.cdr)
+        elif isinstance(val, LambdaFunction):
+            pending.append(val.body)
+            pending.append(val.env)
+        elif kind is MemoFunction:
+            pending.append(val.proc)
+        elif kind is EnvironFrame and val is not frame:
+            pending.extend(val.slots or ())
+            pending.extend((val.inner or {}).values())
+            pending.append(val.enclosing)
+        elif kind is Vector:
+            pending.extend(val.items)
+        elif isinstance(val, HashTable):
+            for entry in val.entries.values():
+                pending.extend(entry)
+    return bindings
+
+def _dumps(val, globals = None):
+    out = BytesIO()
+    _SchemePickler(out, globals).dump(val)
+    return out.getvalue()
+
+def dump_globals():
+    """A pickle (bytes) of the bindings in the current global environment
+    other than the predefined ones, which load_globals defines again."""
+    frame = current_state().global_environment
+    predefined = dict(_predefined_bindings(frame))
+    return _dumps(frame, {sym: val for sym, val in frame.inner.items()
+                          if predefined.get(sym) is not val})
+
+def load_globals(data):
+    """Define in the current global environment the bindings pickled in
+    DATA by dump_globals."""
+    pickle.loads(data)
+
+# The singletons that unpickle as themselves.
+_SHARED_CONSTANTS = (UNASSIGNED, UNSPEC, THE_EOF_OBJECT)
+
+def _shared_constant(k):
+    return _SHARED_CONSTANTS[k]
+
+def _receiver_globals():
+    return current_state().global_environment
+
+def _define_all(frame, bindings):
+    for sym, val in bindings.items():
+        frame.define(sym, val)
+
+def _receiver_global(sym):
+    return current_state().global_environment.lookup(sym)
+
+def _pair_chain(pair):
+    """The list of the cars of PAIR and of the pairs in its cdrs, and the
+    cdr of the last of those, which is one of them if the list is cyclic."""
+    items = []
+    seen = set()
+    while type(pair) is Pair and id(pair) not in seen:
+        seen.add(id(pair))
+        items.append(pair.car)
+        pair = pair.cdr
+    return items, pair
+
+def _new_pair():
+    return Pair.__new__(Pair)
+
+def _init_pairs(pair, chain):
+    items, last = chain
+    for k in range(len(items) - 1, 0, -1):
+        last = Pair(items[k], last)
+    pair.car, pair.cdr = items[0], last
+
+def _init_hash_table(table, entries):
+    # The receiver's dict keys can differ (see HashTable.key).
+    for key, val in entries:
+        table.set(key, val)
+
+def _primitive_named(name):
+    """The receiver's primitive procedure named NAME."""
+    frame = current_state().global_environment
+    for val in dict(_predefined_bindings(frame)).values():
+        if type(val) is PrimitiveFunction and val.name == name:
+            return val
+    if name == _MEMOIZE.name:
+        return _MEMOIZE
+    raise SchemeError("unknown primitive: {0}".format(name))
+
+def _frame_names(frame):
+    """The names of the slots of the local frames from FRAME out, or None
+    if one of them also has bindings by name."""
+    names = []
+    while frame.enclosing is not None:
+        if frame.inner:
+            return None
+        names.append(frame.names)
+        frame = frame.enclosing
+    return tuple(names)
+
+def _new_closure():
+    if current_state().engine == "vm":
+        return BytecodeFunction.__new__(BytecodeFunction)
+    return LambdaFunction.__new__(LambdaFunction)
+
+def _init_closure(proc, state):
+    """Make PROC a closure for the receiver's engine.  Its environment may
+    not be unpickled yet, so a BytecodeFunction is compiled for the frame
+    layout FRAME_NAMES (see _frame_names)."""
+    formals, body, env, name, frame_names = state
+    if type(proc) is BytecodeFunction:
+        if frame_names is not None:
+            enclosing = None
+            for names in reversed(frame_names):
+                enclosing = Scope(names, len(names), enclosing)
+            scope = lambda_scope(formals, scm_list(body), enclosing)
+            bytecode = CodeObject()
+            compile_sequence(scm_list(body), bytecode, scope, True)
+            BytecodeFunction.__init__(proc, formals, body, env, bytecode,
+                                      scope,
+                                      current_state().global_environment,
+                                      name)
+            return
+        proc.__class__ = LambdaFunction
+    LambdaFunction.__init__(proc, formals, body, env, name=name)
+
+# In a worker, the procedures most recently sent to it, by their pickles.
+_parallel_procedures = OrderedDict()
+
+def _parallel_apply(task):
+    """In a worker, apply a pickled procedure to each of a pickled list of
+    argument lists.  Returns (True, the pickled list of values) or (False,
+    an error message): the pool only passes on Exceptions, which
+    SchemeErrors are not."""
+    proc_pickle, args_pickle = task
+    try:
+        proc = _parallel_procedures.get(proc_pickle)
+        if proc is None:
+            proc = _parallel_procedures[proc_pickle] = pickle.loads(proc_pickle)
+            if len(_parallel_procedures) > 8:
+                _parallel_procedures.popitem(last=False)
+        results = [apply_procedure(proc, args)
+                   for args in pickle.loads(args_pickle)]
+        return True, _dumps(results)
+    except SchemeError as exc:
+        return False, str(exc.args[0]) if exc.args else ""
+    except RecursionError:
+        return False, "maximum recursion depth exceeded"
+
+def _parallel_results(proc, lists, name):
+    """The Python list of values of PROC applied to corresponding elements
+    of the Scheme lists LISTS, as by map, computed by the worker processes.
+    NAME is the primitive for error messages."""
+    check_type(proc, _procedurep, 0, name)
+    for k, lst in enumerate(lists):
+        check_type(lst, scm_listp, k + 1, name)
+    arg_lists = [list(args) for args in zip(*[_to_pylist(lst)
+                                               for lst in lists])]
+    if (_in_parallel_worker or not arg_lists
+            or multiprocessing.current_process().daemon):
+        # Daemonic processes, such as those of other pools, cannot start
+        # workers of their own.
+        return [apply_procedure(proc, args) for args in arg_lists]
+    pool = _get_parallel_pool()
+    workers = current_state().parallel_workers or os.cpu_count() or 1
+    pieces = min(len(arg_lists), PARALLEL_CHUNKS_PER_WORKER * workers)
+    size = -(-len(arg_lists) // pieces)
+    proc_pickle = _dumps(proc, _referenced_globals(proc))
+    tasks = [(proc_pickle, _dumps(arg_lists[i:i+size]))
+             for i in range(0, len(arg_lists), size)]
+    results = []
+    for ok, payload in pool.imap(_parallel_apply, tasks):
+        if not ok:
+            raise SchemeError("{0}: {1}".format(name, payload))
+        results.extend(pickle.loads(payload))
+    return results
+
+def scm_parallel_map(proc, lst, *lists):
+    """As for map, but applying PROC in worker processes, to copies of the
+    arguments: changes PROC makes to them or to global variables are not
+    seen here."""
+    return scm_list(*_parallel_results(proc, (lst,) + lists, "parallel-map"))
+
+def scm_parallel_for_each(proc, lst, *lists):
+    """As for for-each, but applying PROC in worker processes, as for
+    parallel-map."""
+    _parallel_results(proc, (lst,) + lists, "parallel-for-each")
+    return UNSPEC
 
 def scm_load(sym):
     check_type(sym, scm_symbolp, 0, "load")
@@ -616,6 +2416,51 @@ _PRIMITIVES = (
     ("list", scm_list),
     ("append", scm_append),
 
+    ("vector?", scm_vectorp),
+    ("make-vector", scm_make_vector),
+    ("vector", scm_vector),
+    ("vector-length", scm_vector_length),
+    ("vector-ref", scm_vector_ref),
+    ("vector-set!", scm_vector_set),
+    ("list->vector", scm_list_to_vector),
+    ("vector->list", scm_vector_to_list),
+    ("f64vector?", scm_f64vectorp),
+    ("make-f64vector", scm_make_f64vector),
+    ("f64vector", scm_f64vector),
+    ("list->f64vector", scm_list_to_f64vector),
+
+    ("hash-table?", scm_hash_tablep),
+    ("make-hash-table", scm_make_hash_table),
+    ("hash-table-ref", scm_hash_table_ref),
+    ("hash-table-set!", scm_hash_table_set),
+    ("hash-table-delete!", scm_hash_table_delete),
+    ("hash-table-contains?", scm_hash_table_containsp),
+    ("hash-table-count", scm_hash_table_count),
+    ("hash-table-keys", scm_hash_table_keys),
+    ("hash-table-values", scm_hash_table_values),
+    ("hash-table->alist", scm_hash_table_to_alist),
+
+    ("string?", scm_stringp),
+    ("char?", scm_charp),
+    ("string", scm_string),
+    ("string-length", scm_string_length),
+    ("string-ref", scm_string_ref),
+    ("substring", scm_substring),
+    ("string-append", scm_string_append),
+    ("string=?", scm_string_eq),
+    ("string<?", scm_string_lt),
+    ("string>?", scm_string_gt),
+    ("string->symbol", scm_string_to_symbol),
+    ("symbol->string", scm_symbol_to_string),
+    ("string->number", scm_string_to_number),
+    ("number->string", scm_number_to_string),
+    ("string->list", scm_string_to_list),
+    ("list->string", scm_list_to_string),
+    ("char->integer", scm_char_to_integer),
+    ("integer->char", scm_integer_to_char),
+    ("open-output-string", scm_open_output_string),
+    ("get-output-string", scm_get_output_string),
+
     ("integer?", scm_integerp),
     ("+", scm_add),
     ("-", scm_sub),
@@ -639,12 +2484,22 @@ _PRIMITIVES = (
     ("write", scm_write),
     ("display", scm_display),
     ("newline", scm_newline),
+    ("write-string", scm_write_string),
+    ("write-char", scm_write_char),
     ("read", scm_read),
     ("load", scm_load),
 
     ("eval", scm_eval),
     ("apply", scm_apply),
 
+    ("profile-start", scm_profile_start),
+    ("profile-report", scm_profile_report),
+    ("runtime-stats", scm_runtime_stats),
+    ("memoize", scm_memoize),
+    ("memo-stats", scm_memo_stats),
+    ("parallel-map", scm_parallel_map),
+    ("parallel-for-each", scm_parallel_for_each),
+
     ("error", scm_error),
     (["exit", "bye"], scm_exit),
 
@@ -672,6 +2527,7 @@ _PRIMITIVES = (
     ('end_fill', tscm_end_fill),
     ('exitonclick', tscm_exitonclick),
     ('speed', tscm_speed),
+    ('save-drawing', tscm_save_drawing),
 
     #Primitives forgotten by the coder
     ('max', scm_max),
@@ -687,36 +2543,290 @@ def define_primitives(frame, bindings):
             names = (names,)
         for name in names:
             frame.define(Symbol.string_to_symbol(name),
-                         PrimitiveFunction(func))
-
-def create_global_environment():
-    """Initialize the_global_environment to a fresh environment defining the
-    predefined names."""
-    global the_global_environment
-
-    the_global_environment = EnvironFrame(None)
+                         PrimitiveFunction(func, name))
+
+def create_global_environment(primitives = _PRIMITIVES,
+                              prelude = SCHEME_PRELUDE_FILE):
+    """Give the current interpreter a fresh global environment, in which
+    expressions passed to scm_eval are evaluated, defining the (name,
+    function) bindings in PRIMITIVES and the definitions in the file
+    PRELUDE (if not None)."""
+    env = EnvironFrame(None)
+    state = current_state()
+    state.global_environment = env
+    state.primitives, state.prelude = primitives, prelude
+    # Workers started before have the old environment's definitions.
+    _close_parallel_pool()
     
     # Uncomment the following line after you finish with Problem 4.
-    scm_load(Symbol.string_to_symbol(SCHEME_PRELUDE_FILE))
-    define_primitives(the_global_environment, _PRIMITIVES)
+    if prelude is not None:
+        load_prelude(prelude)
+    define_primitives(env, primitives)
+    # The bindings made so far, which parallel-map's workers also have.
+    env.predefined = dict(env.inner)
+
+def load_prelude(filename):
+    """Evaluate the Scheme definitions in FILENAME, as for load.  The
+    expressions read are cached (pickled) in PRELUDE_CACHE_DIR, so that as
+    long as the file's text is unchanged, later runs skip reading it."""
+    with scheme_open(filename) as inp:
+        source = inp.read()
+        path = inp.name
+    key = hashlib.sha1(source.encode()).hexdigest()
+    cache_file = None
+    if PRELUDE_CACHE_DIR is not None:
+        cache_file = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                  PRELUDE_CACHE_DIR,
+                                  "{0}.v{1}.pickle".format(
+                                      os.path.basename(path),
+                                      PRELUDE_CACHE_VERSION))
+    exprs = _read_prelude_cache(cache_file, key)
+    if exprs is None:
+        try:
+            exprs = list(Reader(StringIO(source), path))
+        except SchemeError:
+            # Let the usual reader report the error in context.
+            call_with_input_source(source.splitlines(True), read_eval_print)
+            return
+        _write_prelude_cache(cache_file, key, exprs)
+    for expr in exprs:
+        try:
+            scm_eval(expr)
+        except SchemeError as exc:
+            report_error(exc)
 
-input_port = None
+def _read_prelude_cache(cache_file, key):
+    """The expressions cached in CACHE_FILE if it was written for source text
+    with hash KEY, and otherwise None."""
+    if cache_file is None:
+        return None
+    try:
+        with open(cache_file, "rb") as inp:
+            cached_key, exprs = pickle.load(inp)
+    except Exception:
+        return None
+    return exprs if cached_key == key else None
+
+def _write_prelude_cache(cache_file, key, exprs):
+    """Cache EXPRS, read from source text with hash KEY, in CACHE_FILE.  The
+    cache is only an optimization, so failure to write it is ignored."""
+    if cache_file is None:
+        return
+    temp_file = "{0}.{1}.{2}".format(cache_file, os.getpid(),
+                                     threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(temp_file, "wb") as out:
+            pickle.dump((key, exprs), out, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except (OSError, pickle.PicklingError, RecursionError):
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+class SchemeExit(SchemeError):
+    """Raised by an Interpreter's methods when the program calls exit,
+    instead of ending the process.  CODE is the status it gave."""
+
+    def __init__(self, code):
+        super().__init__("exit with status {0}".format(code))
+        self.code = code
+
+class Interpreter(InterpreterState):
+    """An independent Scheme interpreter, with its own global environment,
+    input port, output, engine, profiler, runtime statistics, turtle and
+    parallel-map workers, so that many can run in one process.  The global
+    environment defines the (name, function) bindings in PRIMITIVES and the
+    definitions in the file PRELUDE (if not None).  Output goes to the file
+    OUTPUT if given, and to the standard output otherwise; errors reported
+    rather than raised (by load, for example) go to the file ERRORS if
+    given, and otherwise to OUTPUT or the standard error.  A call of exit
+    raises SchemeExit rather than ending the process.
+
+    While one of its methods runs, an interpreter is the current state of
+    the thread running it (see current_state), which is where evaluation
+    and the primitives find it, so interpreters in different threads run
+    at the same time.  Each interpreter evaluates one thing at a time,
+    though: calls of its methods from different threads run one after
+    another.  Symbols, which are immutable, are shared by all
+    interpreters."""
+
+    def __init__(self, engine = DEFAULT_ENGINE, max_depth = VM_MAX_DEPTH,
+                 turtle = "record", output = None, errors = None,
+                 primitives = _PRIMITIVES, prelude = SCHEME_PRELUDE_FILE):
+        if engine not in ENGINES:
+            raise SchemeError("unknown engine: {0}".format(engine))
+        if turtle != "auto" and turtle not in TURTLE_BACKENDS:
+            raise SchemeError("unknown turtle backend: {0}".format(turtle))
+        super().__init__(engine, max_depth, turtle, output, errors)
+        self._lock = threading.RLock()
+        with self._running():
+            create_global_environment(primitives, prelude)
+
+    @contextmanager
+    def _running(self):
+        """Make this interpreter the current state of this thread for the
+        duration of a with statement, waiting for any other thread running
+        it to finish first.  A call of exit raises SchemeExit."""
+        with self._lock:
+            previous = set_current_state(self)
+            try:
+                yield
+            except SystemExit as exc:
+                raise SchemeExit(exc.code) from None
+            finally:
+                set_current_state(previous)
+
+    def eval_string(self, source, name = "<string>"):
+        """The value of the last expression in the Scheme text SOURCE, after
+        evaluating them all in turn, or UNSPEC if there are none.  Raises
+        SchemeError at the first error, naming the source NAME if the
+        error is in its syntax."""
+        return self._eval_all(Reader(StringIO(source), name))
+
+    def load_file(self, filename):
+        """Evaluate the expressions in the file FILENAME in turn, as for
+        eval_string."""
+        with scheme_open(filename) as inp:
+            return self._eval_all(Reader(inp))
+
+    def call(self, proc, *args):
+        """The value of applying PROC, a Scheme procedure or the name of
+        one in the global environment, to ARGS, which are SchemeValues or
+        Python values with Scheme equivalents (see to_scheme)."""
+        with self._running():
+            if type(proc) is str:
+                proc = self.global_environment.lookup(
+                    Symbol.string_to_symbol(proc))
+            call = scm_list(proc, *[scm_list(_QUOTE_SYM, to_scheme(arg))
+                                    for arg in args])
+            return scm_eval(call)
+
+    def set_parallel_workers(self, workers):
+        """Make parallel-map use WORKERS processes (None for one per CPU)
+        from now on."""
+        with self._running():
+            set_parallel_workers(workers)
+
+    def close(self):
+        """Stop this interpreter's parallel-map workers, profiling and
+        runtime statistics."""
+        with self._running():
+            _close_parallel_pool()
+            set_profiler(None)
+            disable_runtime_stats()
+
+    def _eval_all(self, reader):
+        with self._running():
+            input_port0 = self.input_port
+            self.input_port = reader
+            try:
+                val = UNSPEC
+                while True:
+                    expr = reader.read()
+                    if expr is THE_EOF_OBJECT:
+                        return val
+                    val = scm_eval(expr)
+            finally:
+                self.input_port = input_port0
+
+def to_scheme(val):
+    """The SchemeValue corresponding to the Python value VAL: VAL itself if
+    it is one, and otherwise a boolean, number or string for a Python bool,
+    int, float or str, or a list for a Python list or tuple."""
+    if isinstance(val, SchemeValue):
+        return val
+    elif type(val) is bool:
+        return boolify(val)
+    elif type(val) in (int, float):
+        return make_number(val)
+    elif type(val) is str:
+        return String(val)
+    elif type(val) in (list, tuple):
+        return scm_list(*[to_scheme(item) for item in val])
+    raise SchemeError("no Scheme value for {0}".format(repr(val)))
 
 @main
 def run(*argv):
-    global input_port
-
-    if argv:
+    state = current_state()
+
+    parser = argparse.ArgumentParser(description="Scheme interpreter")
+    parser.add_argument("file", nargs="?",
+                        help="Scheme source file to run (default: stdin)")
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+                        default=state.engine,
+                        help="evaluator to use (default: %(default)s)")
+    parser.add_argument("--max-depth", type=int, default=state.vm_max_depth,
+                        help="most pending calls allowed by the vm engine "
+                             "(default: %(default)s); the analyze engine "
+                             "allows a few hundred, as Python's stack does")
+    parser.add_argument("--turtle", choices=["auto"] + sorted(TURTLE_BACKENDS),
+                        default=state.turtle_backend,
+                        help="turtle graphics backend: tk draws in a window, "
+                             "record draws headlessly into a display list, "
+                             "auto picks tk for an interactive session with "
+                             "a display and record otherwise "
+                             "(default: %(default)s)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+                        help="profile procedure calls, printing a report on "
+                             "the standard error at the end and writing "
+                             "collapsed stacks for flamegraphs to FILE if "
+                             "given")
+    parser.add_argument("--stats", action="store_true",
+                        help="count expressions evaluated, primitive calls, "
+                             "frames created and pairs and numbers "
+                             "allocated, printing a summary on the standard "
+                             "error at the end")
+    parser.add_argument("--save-drawing", metavar="FILE",
+                        help="when the program ends, save its turtle drawing "
+                             "to FILE (.svg or .png)")
+    args = parser.parse_args(argv)
+
+    if args.file:
         try:
-            input_file = open(argv[0])
+            input_file = open(args.file)
         except IOError as exc:
-            print("could not open {0}: {1}".format(argv[0], exc.args[0]),
+            print("could not open {0}: {1}".format(args.file, exc.args[0]),
                   file=sys.stderr)
             sys.exit(1)
     else:
         input_file = sys.stdin
+    set_engine(args.engine)
+    state.vm_max_depth = args.max_depth
+    if args.turtle == "auto":
+        interactive = not args.file and sys.stdin.isatty()
+        set_turtle_backend(auto_backend(interactive))
+    else:
+        set_turtle_backend(args.turtle)
     #Jack 04:30PM.14.April.2012
     #interact()    
-    input_port = Buffer(tokenize_lines(input_file))
+    if args.file:
+        state.input_port = Reader(input_file)
+    else:
+        state.input_port = Buffer(scan_lines(input_file))
+    if args.stats:
+        # Enabled before the prelude is loaded so that its procedures count
+        # their steps, but only the program's own work is reported.
+        enable_runtime_stats()
     create_global_environment()
-    read_eval_print("scm> ")
+    if args.stats:
+        state.runtime_stats.reset()
+    if args.profile is not None:
+        set_profiler(Profiler())
+    try:
+        read_eval_print("scm> ")
+    finally:
+        if state.profiler is not None and args.profile is not None:
+            state.profiler.report(sys.stderr)
+            if args.profile:
+                with open(args.profile, "w") as out:
+                    state.profiler.write_collapsed(out)
+        if args.stats:
+            state.runtime_stats.report(sys.stderr, limit=20)
+        if args.save_drawing:
+            try:
+                tscm_save_drawing(String(args.save_drawing))
+            except (OSError, SchemeError) as exc:
+                print("could not save drawing: {0}".format(exc),
+                      file=sys.stderr)
@@ -1,17 +1,22 @@
+import re
+import threading
+import weakref
 from operator import *
+from array import array
 from math import floor, ceil
 from scheme_utils import *
 from scheme_tokens import symbol_escaped
 from io import StringIO
-                              
-try:
-    import turtle
-except:
-    print("warning: could not import the turtle module.", file=sys.stderr)
+from scheme_turtle import TURTLE_BACKENDS, auto_backend, make_turtle, \
+                          save_drawing
 
 class SchemeValue:
     """A value manipulated by a Scheme program."""
 
+    # Scheme programs create very many values, so the classes defined here
+    # use __slots__ rather than a per-instance __dict__.
+    __slots__ = ()
+
     def __bool__(self):
         """All Scheme values other than #f are considered true in Python as
         well as Scheme."""
@@ -64,6 +69,18 @@ class SchemeValue:
     def symbolp(self):
         return FALSE
 
+    def vectorp(self):
+        return FALSE
+
+    def stringp(self):
+        return FALSE
+
+    def charp(self):
+        return FALSE
+
+    def hash_tablep(self):
+        return FALSE
+
     def procedurep(self):
         return FALSE
 
@@ -91,8 +108,12 @@ class S_Expr(SchemeValue):
     """An S_Expr is a Scheme value that can be returned by the reader.
     Other Scheme values can only result from the evaluation of functions or
     forms (e.g., the values of lambda expressions)."""
-    
+
+    __slots__ = ()
+
 class Pair(S_Expr):
+    __slots__ = ("car", "cdr")
+
     def __init__(self, x, y):
         self.car = x
         self.cdr = y
@@ -107,9 +128,7 @@ class Pair(S_Expr):
         return TRUE
 
     def equalp(self, other):
-        if not other.pairp():
-            return FALSE
-        return self.car.equalp(other.car) and self.cdr.equalp(other.cdr)
+        return boolify(equal_values(self, other))
 
     def __repr__(self):
         return "cons({0}, {1})".format(repr(self.car), repr(self.cdr))
@@ -170,10 +189,106 @@ class Pair(S_Expr):
             x = x.cdr
             k -= 1
             
+class Vector(S_Expr):
+    """A Scheme vector, whose elements are the Python list ITEMS.  Vectors,
+    like other atoms, evaluate to themselves."""
+
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+    def type_name(self):
+        return "vector"
+
+    def vectorp(self):
+        return TRUE
+
+    def equalp(self, other):
+        return boolify(equal_values(self, other))
+
+    def __repr__(self):
+        return "Vector({0})".format(repr(self.items))
+
+    def __str__(self):
+        out = StringIO()
+        self.display(out)
+        return out.getvalue()
+
+    def ref(self, k):
+        """Element K, a Python integer in range."""
+        return self.items[k]
+
+    def set(self, k, val):
+        """Make element K, a Python integer in range, VAL."""
+        self.items[k] = val
+
+    def to_list(self):
+        """The elements of SELF as a Python list of SchemeValues."""
+        return list(self.items)
+
+    def write(self, f):
+        self._print(f, "#(", "write")
+        return UNSPEC
+
+    def display(self, f):
+        self._print(f, "#(", "display")
+        return UNSPEC
+
+    def _print(self, f, prefix, method):
+        print(prefix, file=f, end="")
+        separator = ""
+        for item in self.to_list():
+            print(separator, file=f, end="")
+            getattr(item, method)(f)
+            separator = " "
+        print(")", file=f, end="")
+
+class F64Vector(Vector):
+    """A vector of floating-point numbers, stored unboxed in the array('d')
+    ITEMS.  Elements are boxed as Numbers when they are fetched."""
+
+    __slots__ = ()
+
+    def type_name(self):
+        return "f64vector"
+
+    def vectorp(self):
+        return FALSE
+
+    def equalp(self, other):
+        return boolify(type(other) is F64Vector and self.items == other.items)
+
+    def __repr__(self):
+        return "F64Vector({0})".format(repr(self.items))
+
+    def ref(self, k):
+        return make_number(self.items[k])
+
+    def set(self, k, val):
+        check_type(val, scm_numberp, 2, "vector-set!")
+        self.items[k] = val.num_val
+
+    def to_list(self):
+        return [make_number(x) for x in self.items]
+
+    def write(self, f):
+        self._print(f, "#f64(", "write")
+        return UNSPEC
+
+    def display(self, f):
+        self._print(f, "#f64(", "display")
+        return UNSPEC
+
 class Null(S_Expr):
+    __slots__ = ()
+
     def __str__(self):
         return "()"
 
+    def __reduce__(self):
+        return "NULL"
+
     def type_name(self):
         return "null"
 
@@ -193,6 +308,8 @@ class Bool(S_Expr):
     so that TRUE (#t) is a true Python value as well and FALSE is a false
     Python value."""
 
+    __slots__ = ("__truth",)
+
     def __init__(self, is_true):
         self.__truth = bool(is_true)
 
@@ -200,6 +317,9 @@ class Bool(S_Expr):
         """As a Python value, SELF is True if it is #t and False otherwise."""
         return self.__truth
 
+    def __reduce__(self):
+        return "TRUE" if self else "FALSE"
+
     def __str__(self):
         return "#t" if self else "#f"
 
@@ -216,6 +336,8 @@ TRUE  = Bool(True)
 FALSE = Bool(False)
 
 class Number(S_Expr):
+    __slots__ = ("num_val",)
+
     def __init__(self, val):
         self.num_val = val
 
@@ -231,16 +353,63 @@ class Number(S_Expr):
     def integerp(self):
         return boolify(type(self.num_val) is int)
 
+    def __reduce__(self):
+        return make_number, (self.num_val,)
+
     def write(self, f):
         print(self.num_val, file=f, end="")
     
     def eqvp(self, other):
-        return boolify(other.integerp() and self.num_val == other.num_val)
+        return boolify(self == other)
+
+    def __eq__(self, other):
+        """Numbers are equal (and eqv?) when both are exact or both inexact
+        and their values are equal, so that equal Numbers can be used as
+        the same dict key."""
+        return (type(other) is Number
+                and type(self.num_val) is type(other.num_val)
+                and self.num_val == other.num_val)
+
+    def __hash__(self):
+        return hash(self.num_val)
 
     def __str__(self):
         return str(self.num_val)
 
+# Numbers are immutable, so small integers (loop counters, angles, list
+# lengths) are preallocated once and shared instead of boxed anew each
+# time an arithmetic primitive produces one.
+SMALL_INT_MIN = -128
+SMALL_INT_MAX = 1024
+_small_ints = []
+
+def set_small_int_range(low, high):
+    """Intern the Numbers LOW through HIGH (inclusive), which make_number
+    returns from then on instead of allocating new ones.  An empty range
+    (HIGH < LOW) disables the cache."""
+    global SMALL_INT_MIN, SMALL_INT_MAX, _small_ints
+    SMALL_INT_MIN, SMALL_INT_MAX = low, high
+    _small_ints = [Number(k) for k in range(low, high + 1)]
+
+set_small_int_range(SMALL_INT_MIN, SMALL_INT_MAX)
+
+def make_number(val):
+    """The Number whose value is VAL (a Python int or float).  Returns a
+    shared instance when VAL is an integer in the small-integer range."""
+    if type(val) is int and SMALL_INT_MIN <= val <= SMALL_INT_MAX:
+        return _small_ints[val - SMALL_INT_MIN]
+    return Number(val)
+
+# The size of the symbol table that triggers its first sweep.
+SYMBOL_SWEEP_SIZE = 10000
+
+# Held while adding to or sweeping the symbol table, which interpreters in
+# different threads share.
+_symbol_lock = threading.Lock()
+
 class Symbol(S_Expr):
+    __slots__ = ("ident", "escaped", "__weakref__")
+
     def __init__(self, ident):
         self.ident = ident
         self.escaped = symbol_escaped(ident)
@@ -257,15 +426,44 @@ class Symbol(S_Expr):
     def __hash__(self):
         return hash(self.ident)
 
+    def __reduce__(self):
+        """Unpickle as the interned Symbol with the same name."""
+        return Symbol.string_to_symbol, (self.ident,)
+
     @staticmethod
     def string_to_symbol(name):
         """The Symbol whose string value is NAME.  Always returns the same
-        Symbol object when given the same string."""
-        result = Symbol.symbols.get(name, None)
-        if result is None:
-            result = Symbol.symbols[name] = Symbol(name)
+        Symbol object when given the same string, for as long as that
+        Symbol is referred to."""
+        ref = Symbol.symbols.get(name)
+        if ref is not None:
+            result = ref()
+            if result is not None:
+                return result
+        with _symbol_lock:
+            # Another thread may have made it in the meantime.
+            ref = Symbol.symbols.get(name)
+            result = ref() if ref is not None else None
+            if result is None:
+                result = Symbol(name)
+                Symbol.symbols[name] = weakref.ref(result)
+                if len(Symbol.symbols) > Symbol.sweep_size:
+                    Symbol._sweep()
         return result
 
+    @staticmethod
+    def sweep():
+        """Remove the entries for collected Symbols from Symbol.symbols."""
+        with _symbol_lock:
+            Symbol._sweep()
+
+    @staticmethod
+    def _sweep():
+        symbols = Symbol.symbols
+        for name in [name for name, ref in symbols.items() if ref() is None]:
+            del symbols[name]
+        Symbol.sweep_size = max(SYMBOL_SWEEP_SIZE, 2 * len(symbols))
+
     def atomp(self):
         return TRUE
 
@@ -278,13 +476,201 @@ class Symbol(S_Expr):
     def display(self, f):
         print(self.ident, file=f, end="")
 
-    # The mapping of names to symbols.
+    # The mapping of names to weak references to symbols.  A symbol that
+    # nothing else refers to can be collected, since no program can tell
+    # that the symbol made for its name the next time is a different
+    # object, so symbols made from transient words do not accumulate.  The
+    # entries of collected symbols are swept out whenever the table has
+    # doubled in size since the last sweep (which is cheaper than the
+    # per-entry callbacks of a WeakValueDictionary).
     symbols = {}
+    sweep_size = SYMBOL_SWEEP_SIZE
+
+class String(S_Expr):
+    """A Scheme string, whose characters are the Python string TEXT.
+    Strings cannot be modified, so their TEXT may be shared."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def type_name(self):
+        return "string"
+
+    def stringp(self):
+        return TRUE
+
+    def equalp(self, other):
+        return boolify(type(other) is String and self.text == other.text)
+
+    def __repr__(self):
+        return "String({0})".format(repr(self.text))
+
+    def __str__(self):
+        return self.text
+
+    def write(self, f):
+        text = self.text
+        for char, escape in _STRING_ESCAPES:
+            text = text.replace(char, escape)
+        print('"', text, '"', sep="", file=f, end="")
+        return UNSPEC
+
+    def display(self, f):
+        print(self.text, file=f, end="")
+        return UNSPEC
+
+# The characters written as escapes in strings, backslash first.
+_STRING_ESCAPES = (("\\", "\\\\"), ('"', '\\"'), ("\n", "\\n"), ("\t", "\\t"))
+
+class Char(S_Expr):
+    """A Scheme character, CHAR being a Python string of length 1.  There
+    is only one Char for each character (see make_char), so that eq? and
+    eqv? agree on them."""
+
+    __slots__ = ("char",)
+
+    def __init__(self, char):
+        self.char = char
+
+    def type_name(self):
+        return "character"
+
+    def charp(self):
+        return TRUE
+
+    def __repr__(self):
+        return "Char({0})".format(repr(self.char))
+
+    def __str__(self):
+        return self.char
+
+    def __reduce__(self):
+        """Unpickle as the shared Char for the same character."""
+        return make_char, (self.char,)
+
+    def write(self, f):
+        name = CHAR_NAMES.get(self.char, self.char)
+        print("#\\", name, sep="", file=f, end="")
+        return UNSPEC
+
+    def display(self, f):
+        print(self.char, file=f, end="")
+        return UNSPEC
+
+    # The mapping of characters to Chars.
+    chars = {}
+
+def make_char(char):
+    """The Char for the Python string CHAR, of length 1."""
+    result = Char.chars.get(char)
+    if result is None:
+        result = Char.chars.setdefault(char, Char(char))
+    return result
+
+# The names by which characters that do not print visibly are written.
+CHAR_NAMES = {" ": "space", "\n": "newline", "\t": "tab", "\r": "return",
+              "\0": "null", "\a": "alarm", "\b": "backspace",
+              "\x1b": "escape", "\x7f": "delete"}
+
+class StringPort(SchemeValue):
+    """An output port that collects what is written to it in the StringIO
+    OUT, so that a string can be built in pieces in linear time."""
+
+    __slots__ = ("out",)
+
+    def __init__(self):
+        self.out = StringIO()
+
+    def type_name(self):
+        return "string port"
+
+class HashTable(SchemeValue):
+    """A hash table whose keys are the same when they are eqv?.  ENTRIES
+    maps the Python dict key for each Scheme key (see key) to the tuple
+    (KEY, VALUE), in the order the keys were added."""
+
+    __slots__ = ("entries",)
+
+    # The name of the equivalence predicate on keys.
+    equivalence = "eqv?"
+
+    def __init__(self):
+        self.entries = {}
+
+    def type_name(self):
+        return "hash table"
+
+    def hash_tablep(self):
+        return TRUE
+
+    def __str__(self):
+        return "<hash table ({0}, {1} entries)>".format(
+            self.equivalence, len(self.entries))
+
+    def key(self, key):
+        """The dict key for KEY.  Numbers hash and compare by value, and
+        other values by identity."""
+        return key
+
+    def get(self, key, default = None):
+        """The value for KEY, or DEFAULT if there is none."""
+        entry = self.entries.get(self.key(key))
+        return default if entry is None else entry[1]
+
+    def set(self, key, val):
+        self.entries[self.key(key)] = (key, val)
+
+    def delete(self, key):
+        """Remove KEY, returning whether it was present."""
+        return self.entries.pop(self.key(key), None) is not None
+
+class EqHashTable(HashTable):
+    """A hash table whose keys are the same when they are eq?."""
+
+    __slots__ = ()
+
+    equivalence = "eq?"
+
+    def key(self, key):
+        # ENTRIES keeps KEY alive, so its id is not reused.
+        return id(key)
+
+class EqualHashTable(HashTable):
+    """A hash table whose keys are the same when they are equal?."""
+
+    __slots__ = ()
+
+    equivalence = "equal?"
+
+    def key(self, key):
+        if isinstance(key, (Pair, Vector, String)):
+            return _EqualKey(key)
+        return key
+
+class _EqualKey:
+    """A dict key for the pair, vector or string VAL that is equal to the
+    keys for values equal? to VAL."""
+
+    __slots__ = ("val", "hash")
+
+    def __init__(self, val):
+        self.val = val
+        self.hash = equal_hash(val)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return type(other) is _EqualKey and equal_values(self.val, other.val)
 
 class Unspecified(SchemeValue):
     """A class whose sole instance is the "unspecified value", which is 
     returned to represent the value of a Scheme expressions whose value
     is irrelevant and not specified by the Scheme report."""
+    __slots__ = ()
+
     def type_name(self):
         return "unspecified value"
 
@@ -293,6 +679,8 @@ UNSPEC = Unspecified()
 class Eof(SchemeValue):
     """A class whose sole instance is the "end-of-file object", which is 
     returned to represent an end-of-file condition when reading."""
+    __slots__ = ()
+
     def type_name(self):
         return "eof object"
 
@@ -309,16 +697,24 @@ def check_type(val, predicate, k, name):
                           .format(k, name, val.type_name()))
     return val
 
+# A numeral: group 1 is the digits of an integer, and group 2 an exponent.
+_NUMERAL = re.compile(r"[+-]?(?:(\d+)|\d+\.\d*|\.\d+)([eE][+-]?\d+)?\Z")
+
+def numeral_value(s):
+    """The Python int or float denoted by the numeral S, or None if S is
+    not a numeral."""
+    match = _NUMERAL.match(s)
+    if match is None:
+        return None
+    if match.group(1) and not match.group(2):
+        return int(s)
+    return float(s)
+
 def string_to_atom(s):
     """The number or symbol denoted by S."""
-    try:
-        return Number(int(s))
-    except:
-        pass
-    try:
-        return Number(float(s))
-    except:
-        pass
+    val = numeral_value(s)
+    if val is not None:
+        return make_number(val)
     return Symbol.string_to_symbol(s)
 
 ##
@@ -349,6 +745,117 @@ def scm_eqvp(x, y):
 def scm_equalp(x, y):
     return x.equalp(y)
 
+# equal? alternates between comparing this many pairs directly and this
+# many while tracking which pairs it has compared (see equal_values).
+EQUAL_PHASE_LENGTH = 10000
+
+def equal_values(x, y):
+    """True iff X and Y are equal?: pairs whose cars and cdrs are equal?,
+    vectors of the same length whose elements are equal?, or other values
+    that are (by their equalp method).  Structures are walked with an
+    explicit stack, so their size and depth are limited only by memory.
+    Cyclic structures (made with set-cdr! or vector-set!, say) are equal?
+    if unfolding them gives the same infinite trees.
+
+    In alternate phases, the pairs and vectors compared are put in classes
+    known (or, while the comparison is in progress, assumed) to be equal?,
+    using union-find.  Comparing two pairs of the same class again is
+    skipped, which ends cycles and avoids comparing shared substructure
+    more than once, as in Adams and Dybvig, "Efficient nondestructive
+    equality checking for trees and graphs" (2008).  The other phases skip
+    that bookkeeping, which is all most comparisons need."""
+    parent = {}    # The id of a pair -> a pair of the same class.
+
+    def find(pair):
+        root = pair
+        while id(root) in parent:
+            root = parent[id(root)]
+        while pair is not root:
+            next_pair = parent[id(pair)]
+            parent[id(pair)] = root
+            pair = next_pair
+        return root
+
+    tracking = False
+    budget = EQUAL_PHASE_LENGTH
+    pending = [x, y]
+    while pending:
+        y, x = pending.pop(), pending.pop()
+        while x is not y:
+            if type(x) is not Pair or type(y) is not Pair:
+                if type(x) is not Vector or type(y) is not Vector:
+                    if not _equal_atoms(x, y):
+                        return False
+                    break
+            budget -= 1
+            if budget < 0:
+                tracking = not tracking
+                budget = EQUAL_PHASE_LENGTH
+            if tracking:
+                x_id = id(x)
+                if x_id not in parent and id(y) not in parent:
+                    parent[x_id] = y    # The usual case: both are new.
+                else:
+                    x_root, y_root = find(x), find(y)
+                    if x_root is y_root:
+                        break
+                    parent[id(x_root)] = y_root
+            if type(x) is Vector:
+                if len(x.items) != len(y.items):
+                    return False
+                for x_item, y_item in zip(x.items, y.items):
+                    if x_item is not y_item:
+                        if type(x_item) is Pair or type(x_item) is Vector:
+                            pending.append(x_item)
+                            pending.append(y_item)
+                        elif not _equal_atoms(x_item, y_item):
+                            return False
+                break
+            x_car, y_car = x.car, y.car
+            if x_car is not y_car:
+                if type(x_car) is Pair or type(x_car) is Vector:
+                    pending.append(x_car)
+                    pending.append(y_car)
+                elif not _equal_atoms(x_car, y_car):
+                    return False
+            x, y = x.cdr, y.cdr
+    return True
+
+# equal_hash looks at no more than this many values.
+EQUAL_HASH_LIMIT = 64
+
+def equal_hash(val):
+    """A hash of VAL such that values that are equal? have equal hashes.
+    Only the first EQUAL_HASH_LIMIT values in a preorder walk of VAL's
+    pairs and vectors contribute, so it takes bounded time even on large
+    or cyclic structures."""
+    hashes = []
+    pending = [val]
+    while pending and len(hashes) < EQUAL_HASH_LIMIT:
+        val = pending.pop()
+        if type(val) is Pair:
+            hashes.append(-1)
+            pending.append(val.cdr)
+            pending.append(val.car)
+        elif type(val) is Vector:
+            hashes.append(-2 - len(val.items))
+            pending.extend(reversed(val.items[:EQUAL_HASH_LIMIT]))
+        elif type(val) is F64Vector:
+            hashes.append(hash(tuple(val.items[:EQUAL_HASH_LIMIT])))
+        elif type(val) is String:
+            hashes.append(hash(val.text))
+        else:
+            hashes.append(hash(val))
+    return hash(tuple(hashes))
+
+def _equal_atoms(x, y):
+    """Whether X and Y, not both pairs or both vectors, are equal?."""
+    if type(x) is Number:
+        # As for x.eqvp(y), which this is for short.
+        return (type(y) is Number and type(x.num_val) is type(y.num_val)
+                and x.num_val == y.num_val)
+    return type(x) is not Pair and type(x) is not Vector and bool(x.equalp(y))
+
 ##
 ## Operations on lists and pairs.
 ##
@@ -376,7 +883,7 @@ def scm_listp(x):
 
 def scm_length(x):
     check_type(x, scm_listp, 0, 'length')
-    return Number(x.length())
+    return make_number(x.length())
 
 def scm_cons(x, y):
     return Pair(x, y)
@@ -422,6 +929,245 @@ def scm_append(*vals):
             result = r
     return result
 
+##
+## Operations on vectors
+##
+
+def scm_vectorp(x):
+    return x.vectorp()
+
+def scm_f64vectorp(x):
+    return boolify(type(x) is F64Vector)
+
+def _any_vectorp(x):
+    """Whether X is a vector or an f64vector, on both of which the vector
+    procedures work."""
+    return isinstance(x, Vector)
+
+def _list_items(lst, k, name):
+    """The elements of the list LST, argument K of NAME, as a Python list."""
+    check_type(lst, scm_listp, k, name)
+    items = []
+    while lst is not NULL:
+        items.append(lst.car)
+        lst = lst.cdr
+    return items
+
+def _vector_size(k, name):
+    """The Python integer for the vector size K, argument 0 of NAME."""
+    check_type(k, scm_integerp, 0, name)
+    if k.num_val < 0:
+        raise SchemeError("{0}: negative size".format(name))
+    return k.num_val
+
+def _vector_index(v, k, name):
+    """The Python integer for K, argument 1 of NAME, an index into V."""
+    check_type(v, _any_vectorp, 0, name)
+    check_type(k, scm_integerp, 1, name)
+    k = k.num_val
+    if not 0 <= k < len(v.items):
+        raise SchemeError("{0}: index {1} out of range for vector of "
+                          "length {2}".format(name, k, len(v.items)))
+    return k
+
+def scm_make_vector(k, fill = FALSE):
+    return Vector([fill] * _vector_size(k, "make-vector"))
+
+def scm_vector(*items):
+    return Vector(list(items))
+
+def scm_make_f64vector(k, fill = None):
+    size = _vector_size(k, "make-f64vector")
+    if fill is None:
+        return F64Vector(array("d", bytes(8 * size)))
+    check_type(fill, scm_numberp, 1, "make-f64vector")
+    return F64Vector(array("d", [fill.num_val]) * size)
+
+def scm_f64vector(*nums):
+    _check_nums(*nums)
+    return F64Vector(array("d", [num.num_val for num in nums]))
+
+def scm_vector_length(v):
+    check_type(v, _any_vectorp, 0, "vector-length")
+    return make_number(len(v.items))
+
+def scm_vector_ref(v, k):
+    return v.ref(_vector_index(v, k, "vector-ref"))
+
+def scm_vector_set(v, k, val):
+    v.set(_vector_index(v, k, "vector-set!"), val)
+    return UNSPEC
+
+def scm_list_to_vector(lst):
+    return Vector(_list_items(lst, 0, "list->vector"))
+
+def scm_list_to_f64vector(lst):
+    items = _list_items(lst, 0, "list->f64vector")
+    _check_nums(*items)
+    return F64Vector(array("d", [num.num_val for num in items]))
+
+def scm_vector_to_list(v):
+    check_type(v, _any_vectorp, 0, "vector->list")
+    return scm_list(*v.to_list())
+
+##
+## Hash tables
+##
+
+def scm_hash_tablep(x):
+    return x.hash_tablep()
+
+def scm_hash_table_ref(table, key, default = None):
+    check_type(table, scm_hash_tablep, 0, "hash-table-ref")
+    val = table.get(key, default)
+    if val is None:
+        raise SchemeError("hash-table-ref: no value for key {0}".format(key))
+    return val
+
+def scm_hash_table_set(table, key, val):
+    check_type(table, scm_hash_tablep, 0, "hash-table-set!")
+    table.set(key, val)
+    return UNSPEC
+
+def scm_hash_table_delete(table, key):
+    check_type(table, scm_hash_tablep, 0, "hash-table-delete!")
+    table.delete(key)
+    return UNSPEC
+
+def scm_hash_table_containsp(table, key):
+    check_type(table, scm_hash_tablep, 0, "hash-table-contains?")
+    return boolify(table.get(key) is not None)
+
+def scm_hash_table_count(table):
+    check_type(table, scm_hash_tablep, 0, "hash-table-count")
+    return make_number(len(table.entries))
+
+def scm_hash_table_keys(table):
+    check_type(table, scm_hash_tablep, 0, "hash-table-keys")
+    return scm_list(*[key for key, _ in table.entries.values()])
+
+def scm_hash_table_values(table):
+    check_type(table, scm_hash_tablep, 0, "hash-table-values")
+    return scm_list(*[val for _, val in table.entries.values()])
+
+def scm_hash_table_to_alist(table):
+    check_type(table, scm_hash_tablep, 0, "hash-table->alist")
+    return scm_list(*[Pair(key, val) for key, val in table.entries.values()])
+
+##
+## Operations on strings and characters
+##
+
+def scm_stringp(x):
+    return x.stringp()
+
+def scm_charp(x):
+    return x.charp()
+
+def scm_string_length(s):
+    check_type(s, scm_stringp, 0, "string-length")
+    return make_number(len(s.text))
+
+def scm_string_ref(s, k):
+    check_type(s, scm_stringp, 0, "string-ref")
+    check_type(k, scm_integerp, 1, "string-ref")
+    if not 0 <= k.num_val < len(s.text):
+        raise SchemeError("string-ref: index {0} out of range for string of "
+                          "length {1}".format(k.num_val, len(s.text)))
+    return make_char(s.text[k.num_val])
+
+def scm_substring(s, start, end = None):
+    check_type(s, scm_stringp, 0, "substring")
+    check_type(start, scm_integerp, 1, "substring")
+    start = start.num_val
+    if end is None:
+        end = len(s.text)
+    else:
+        check_type(end, scm_integerp, 2, "substring")
+        end = end.num_val
+    if not 0 <= start <= end <= len(s.text):
+        raise SchemeError("substring: indices {0} and {1} out of range for "
+                          "string of length {2}".format(start, end, len(s.text)))
+    return String(s.text[start:end])
+
+def scm_string_append(*strings):
+    for k, s in enumerate(strings):
+        check_type(s, scm_stringp, k, "string-append")
+    return String("".join(s.text for s in strings))
+
+def scm_string(*chars):
+    for k, c in enumerate(chars):
+        check_type(c, scm_charp, k, "string")
+    return String("".join(c.char for c in chars))
+
+def _string_compare(op, name):
+    def compare(*strings):
+        for k, s in enumerate(strings):
+            check_type(s, scm_stringp, k, name)
+        return boolify(all(op(x.text, y.text)
+                           for x, y in zip(strings, strings[1:])))
+    return compare
+
+scm_string_eq = _string_compare(eq, "string=?")
+scm_string_lt = _string_compare(lt, "string<?")
+scm_string_gt = _string_compare(gt, "string>?")
+
+def scm_string_to_symbol(s):
+    check_type(s, scm_stringp, 0, "string->symbol")
+    return Symbol.string_to_symbol(s.text)
+
+def scm_symbol_to_string(sym):
+    check_type(sym, scm_symbolp, 0, "symbol->string")
+    return String(sym.ident)
+
+def scm_number_to_string(num):
+    check_type(num, scm_numberp, 0, "number->string")
+    return String(str(num.num_val))
+
+def scm_string_to_number(s):
+    """The number S denotes, or #f if it is not a numeral."""
+    check_type(s, scm_stringp, 0, "string->number")
+    val = numeral_value(s.text)
+    return FALSE if val is None else make_number(val)
+
+def scm_string_to_list(s):
+    check_type(s, scm_stringp, 0, "string->list")
+    return scm_list(*[make_char(c) for c in s.text])
+
+def scm_list_to_string(lst):
+    chars = _list_items(lst, 0, "list->string")
+    return scm_string(*chars)
+
+def scm_char_to_integer(c):
+    check_type(c, scm_charp, 0, "char->integer")
+    return make_number(ord(c.char))
+
+def scm_integer_to_char(k):
+    check_type(k, scm_integerp, 0, "integer->char")
+    try:
+        return make_char(chr(k.num_val))
+    except (ValueError, OverflowError):
+        raise SchemeError("integer->char: no character {0}".format(k.num_val))
+
+def scm_open_output_string():
+    return StringPort()
+
+def scm_get_output_string(port):
+    """A string of everything written to PORT so far."""
+    check_type(port, _string_portp, 0, "get-output-string")
+    return String(port.out.getvalue())
+
+def _string_portp(x):
+    return type(x) is StringPort
+
+def _output(port, k, name):
+    """The Python file for the optional output port PORT, argument K of
+    NAME: the current interpreter's output if PORT is None."""
+    if port is None:
+        return current_output()
+    check_type(port, _string_portp, k, name)
+    return port.out
+
 ##
 ## Operations on symbols
 ##
@@ -454,65 +1200,92 @@ def _arith(op, init, vals):
     s = init
     for i in range(len(vals)):
         s = op(s, vals[i].num_val)
-    return Number(s)
+    return make_number(s)
+
+# The two-operand case of +, -, * and the comparisons dominates numeric
+# loops, so each of them first tests for two Numbers directly and only
+# falls back to the general (checking, varargs) path otherwise.
 
 def scm_add(*vals):
+    if len(vals) == 2:
+        x, y = vals
+        if type(x) is Number and type(y) is Number:
+            return make_number(x.num_val + y.num_val)
     return _arith(add, 0, vals)
 
 def scm_sub(val0, *vals):
-    if len(vals) == 0:
-        return Number(-val0.num_val)
+    if len(vals) == 1:
+        y = vals[0]
+        if type(val0) is Number and type(y) is Number:
+            return make_number(val0.num_val - y.num_val)
+    elif len(vals) == 0:
+        _check_nums(val0)
+        return make_number(-val0.num_val)
     return _arith(sub, val0.num_val, vals)
 
 def scm_mul(*vals):
+    if len(vals) == 2:
+        x, y = vals
+        if type(x) is Number and type(y) is Number:
+            return make_number(x.num_val * y.num_val)
     return _arith(mul, 1, vals)
 
 def scm_div(val0, val1):
     _check_nums(val0, val1)
-    return Number(val0.num_val / val1.num_val)
+    return make_number(val0.num_val / val1.num_val)
 
 def scm_quo(val0, val1):
     _check_nums(val0, val1, pred = scm_integerp)
     if (val0.num_val < 0) == (val1.num_val < 0):
-        return Number(val0.num_val // val1.num_val)
+        return make_number(val0.num_val // val1.num_val)
     else:
-        return Number(-(abs(val0.num_val) // abs(val1.num_val)))
+        return make_number(-(abs(val0.num_val) // abs(val1.num_val)))
 
 def scm_modulo(val0, val1):
     _check_nums(val0, val1, pred = scm_integerp)
-    return Number(val0.num_val % val1.num_val)
+    return make_number(val0.num_val % val1.num_val)
 
 def scm_remainder(val0, val1):
     _check_nums(val0, val1, pred = scm_integerp)
     x = val0.num_val
     y = val1.num_val
-    return Number(x - (1 if (x<0) == (y<0) else -1) * (abs(x)//abs(y)) * y)
+    return make_number(x - (1 if (x<0) == (y<0) else -1) * (abs(x)//abs(y)) * y)
 
 def scm_floor(val):
     _check_nums(val)
-    return Number(floor(val.num_val))
+    return make_number(floor(val.num_val))
 
 def scm_ceil(val):
     _check_nums(val)
-    return Number(floor(val.num_val))
+    return make_number(floor(val.num_val))
 
 def _numcomp(op, x, y):
     _check_nums(x, y)
     return boolify(op(x.num_val, y.num_val))
 
 def scm_eq(x, y):
+    if type(x) is Number and type(y) is Number:
+        return TRUE if x.num_val == y.num_val else FALSE
     return _numcomp(eq, x, y)
 
 def scm_lt(x, y):
+    if type(x) is Number and type(y) is Number:
+        return TRUE if x.num_val < y.num_val else FALSE
     return _numcomp(lt, x, y)
 
 def scm_gt(x, y):
+    if type(x) is Number and type(y) is Number:
+        return TRUE if x.num_val > y.num_val else FALSE
     return _numcomp(gt, x, y)
 
 def scm_le(x, y):
+    if type(x) is Number and type(y) is Number:
+        return TRUE if x.num_val <= y.num_val else FALSE
     return _numcomp(le, x, y)
 
 def scm_ge(x, y):
+    if type(x) is Number and type(y) is Number:
+        return TRUE if x.num_val >= y.num_val else FALSE
     return _numcomp(ge, x, y)
 
 def scm_max(*args):
@@ -540,21 +1313,118 @@ def scm_procedurep(x):
 def scm_eof_objectp(x):
     return x.eof_objectp()
 
+##
+## Interpreter state
+##
+
+# The engine that evaluates expressions unless another is chosen.  The vm
+# keeps pending calls on a stack of its own, so that recursion is limited
+# by VM_MAX_DEPTH, while the analyze engine's is limited by Python's stack
+# to a few hundred calls.
+DEFAULT_ENGINE = "vm"
+
+# The default maximum number of pending (non-tail) calls the vm engine
+# allows before reporting an error.
+VM_MAX_DEPTH = 1000000
+
+class InterpreterState:
+    """The state of one Scheme interpreter, which evaluation and the
+    primitives find with current_state, so that interpreters running in
+    different threads do not share it:
+
+    global_environment  the frame in which top-level forms are evaluated
+    primitives, prelude the arguments it was made from (see
+                        create_global_environment)
+    input_port          what read and the read-eval-print loop read from
+    output              the file output goes to (None for sys.stdout)
+    errors              the file errors are reported on (None for OUTPUT
+                        if given, and sys.stderr otherwise)
+    engine              the name of the evaluator to use
+    vm_max_depth        the most pending calls the vm engine allows, or None
+                        for no limit other than memory
+    profiler            the Profiler to which calls are reported, or None
+    runtime_stats       the RuntimeStats counting the work done, or None
+    turtle_backend      the kind of turtle (see set_turtle_backend)
+    turtle              that turtle, created on first use
+    parallel_workers    the number of processes parallel-map uses, or None
+                        for one per CPU
+    parallel_pool       those processes, started on first use, and the
+    parallel_engine     engine they run"""
+
+    def __init__(self, engine = DEFAULT_ENGINE, max_depth = VM_MAX_DEPTH,
+                 turtle = "auto", output = None, errors = None):
+        self.global_environment = None
+        self.primitives = self.prelude = None
+        self.input_port = None
+        self.output = output
+        self.errors = errors
+        self.engine = engine
+        self.vm_max_depth = max_depth
+        self.profiler = None
+        self.runtime_stats = None
+        self.turtle_backend = turtle
+        self.turtle = None
+        self.parallel_workers = None
+        self.parallel_pool = None
+        self.parallel_engine = None
+
+# The state used by a thread that has not chosen one with set_current_state.
+DEFAULT_STATE = InterpreterState()
+
+_thread_state = threading.local()
+
+def current_state():
+    """The InterpreterState of the interpreter running in this thread."""
+    return getattr(_thread_state, "state", DEFAULT_STATE)
+
+def set_current_state(state):
+    """Make STATE the current InterpreterState of this thread, returning
+    the one it replaces."""
+    previous = current_state()
+    _thread_state.state = state
+    return previous
+
+def current_output():
+    """The file to which the current interpreter writes its output."""
+    out = current_state().output
+    return sys.stdout if out is None else out
+
+def current_error_output():
+    """The file on which the current interpreter reports errors."""
+    state = current_state()
+    if state.errors is not None:
+        return state.errors
+    return sys.stderr if state.output is None else state.output
+
 ##
 ## Output
 ##
 
-def scm_display(val):
-    val.display(sys.stdout)
+def scm_display(val, port = None):
+    val.display(_output(port, 1, "display"))
     return UNSPEC
 
-def scm_newline():
-    print()
-    sys.stdout.flush()
+def scm_newline(port = None):
+    if port is not None:
+        _output(port, 0, "newline").write("\n")
+        return UNSPEC
+    out = current_output()
+    print(file=out)
+    out.flush()
     return UNSPEC
 
-def scm_write(val):
-    val.write(sys.stdout)
+def scm_write(val, port = None):
+    val.write(_output(port, 1, "write"))
+    return UNSPEC
+
+def scm_write_string(s, port = None):
+    check_type(s, scm_stringp, 0, "write-string")
+    _output(port, 1, "write-string").write(s.text)
+    return UNSPEC
+
+def scm_write_char(c, port = None):
+    check_type(c, scm_charp, 0, "write-char")
+    _output(port, 1, "write-char").write(c.char)
     return UNSPEC
 
 
@@ -566,7 +1436,7 @@ def scm_error(msg = None):
     if msg is None:
         msg = ""
     else:
-        check_type(msg, scm_symbolp, 0, "error")
+        check_type(msg, lambda x: x.symbolp() or x.stringp(), 0, "error")
         msg = str(msg)
     raise SchemeError(msg)
 
@@ -584,22 +1454,25 @@ def scm_exit(code = None):
 
 def sscm_word(*words):
     """The atom resulting from concatenating the representations of the atoms
-    in WORDS."""
-    result = ""
+    in WORDS: a string if any of them is a string."""
     for w in words:
-        if scm_symbolp(w) or scm_numberp(w):
-            result += str(w)
-        else:
+        if not (w.symbolp() or w.numberp() or w.stringp()):
             raise SchemeError("bad argument type to word: {0}"
                               .format(w.type_name()))
+    result = "".join(str(w) for w in words)
+    if any(w.stringp() for w in words):
+        return String(result)
     return string_to_atom(result)
 
 
 def sscm_first(x):
     """If X is a list, its car.  If X is an integer of symbol, the Scheme
-    value denoted by the first character of its printed representation."""
+    value denoted by the first character of its printed representation.  If
+    X is a string, the string of its first character."""
     if x.symbolp() or x.numberp():
         return string_to_atom(str(x)[0])
+    elif x.stringp():
+        return String(x.text[0])
     elif x.pairp():
         return x.car
     else:
@@ -607,17 +1480,21 @@ def sscm_first(x):
 
 def sscm_butfirst(x):
     """If X is a list, its cdr.  If X is a symbol or integer, the Scheme
-    value denoted by all but the first character of its printed representation."""
+    value denoted by all but the first character of its printed representation.
+    If X is a string, the string of all but its first character."""
     if x.pairp():
         return x.cdr
     elif x.symbolp() or x.numberp():
         return string_to_atom(str(x)[1:])
+    elif x.stringp():
+        return String(x.text[1:])
     else:
         raise SchemeError("bad argument to butfirst")
     
 def sscm_last(x):
     """If X is a list, its last element.  If it is a symbol or number, the
-    symbol or number denoted by the last character in its string value."""
+    symbol or number denoted by the last character in its string value.  If
+    it is a string, the string of its last character."""
     if x.pairp():
         while x.pairp() and not x.cdr.nullp():
             x = x.cdr
@@ -625,12 +1502,15 @@ def sscm_last(x):
             return x.car
     elif x.symbolp() or x.numberp():
         return string_to_atom(str(x)[-1])
+    elif x.stringp():
+        return String(x.text[-1])
     raise SchemeError("bad argument to last")
         
 def sscm_butlast(x):
     """If X is a list, the list consisting of all but its last element.
     If it is a symbol or number, the symbol or number denoted by all but
-    the last character in its string denotation."""
+    the last character in its string denotation.  If it is a string, the
+    string of all but its last character."""
     if x.pairp():
         result = NULL
         while x.pairp() and not x.cdr.nullp():
@@ -644,17 +1524,19 @@ def sscm_butlast(x):
             return result
     elif x.symbolp() or x.numberp():
         return string_to_atom(str(x)[0:-1])
+    elif x.stringp():
+        return String(x.text[0:-1])
     raise SchemeError("bad argument to butlast")
 
 def sscm_sentence(*vals):
-    """Creates a list out of the integers, symbols, and lists in VALS, treating
+    """Creates a list out of the integers, symbols, strings, and lists in VALS, treating
     the atoms as single-element lists and concatenating the values together."""
     result = NULL
     for i in range(len(vals)-1, -1, -1):
         v = vals[i]
         if scm_listp(v):
             result = scm_append(v, result)
-        elif v.integerp() or v.symbolp():
+        elif v.integerp() or v.symbolp() or v.stringp():
             result = scm_cons(v, result)
         else:
             raise SchemeError("bad argument to sentence")
@@ -664,42 +1546,49 @@ def sscm_sentence(*vals):
 ## Turtle graphics (non-standard)
 ##
 
-_turtle_screen_on = False
+# Each interpreter draws with its own turtle backend (see scheme_turtle),
+# of the kind in its InterpreterState, which is created on first use.
+
+def set_turtle_backend(name):
+    """Make the turtle primitives of the current interpreter draw with a
+    fresh backend of kind NAME (a key of TURTLE_BACKENDS, or "auto") from
+    now on."""
+    if name != "auto" and name not in TURTLE_BACKENDS:
+        raise SchemeError("unknown turtle backend: {0}".format(name))
+    state = current_state()
+    state.turtle_backend = name
+    state.turtle = None
 
 def _tscm_prep():
-    global _turtle_screen_on
-    if not _turtle_screen_on:
-        _turtle_screen_on = True
-        turtle.title("Scheme Turtles")
-        turtle.mode('logo')
+    """The current turtle backend."""
+    state = current_state()
+    if state.turtle is None:
+        state.turtle = make_turtle(state.turtle_backend)
+    return state.turtle
 
 def tscm_forward(n):
     """Move the turtle forward a distance N units on the current heading."""
     _check_nums(n)
-    _tscm_prep()
-    turtle.forward(n.num_val)
+    _tscm_prep().forward(n.num_val)
     return UNSPEC
 
 def tscm_backward(n):
     """Move the turtle backward a distance N units on the current heading,
     without changing direction."""
     _check_nums(n)
-    _tscm_prep()
-    turtle.backward(n.num_val)
+    _tscm_prep().backward(n.num_val)
     return UNSPEC
 
 def tscm_left(n):
     """Rotate the turtle's heading N degrees counterclockwise."""
     _check_nums(n)
-    _tscm_prep()
-    turtle.left(n.num_val)
+    _tscm_prep().left(n.num_val)
     return UNSPEC
 
 def tscm_right(n):
     """Rotate the turtle's heading N degrees clockwise."""
     _check_nums(n)
-    _tscm_prep()
-    turtle.right(n.num_val)
+    _tscm_prep().right(n.num_val)
     return UNSPEC
     
 def tscm_circle(r, extent = None):
@@ -712,80 +1601,68 @@ def tscm_circle(r, extent = None):
         _check_nums(r)
     else:
         _check_nums(r, extent)
-    _tscm_prep()
-    turtle.circle(r.num_val, extent and extent.num_val)
+    _tscm_prep().circle(r.num_val, extent and extent.num_val)
     return UNSPEC
     
 def tscm_setposition(x, y):
     """Set turtle's position to (X,Y), heading unchanged."""
     _check_nums(x, y)
-    _tscm_prep()
-    turtle.setposition(x.num_val, y.num_val)
+    _tscm_prep().setposition(x.num_val, y.num_val)
     return UNSPEC
 
 def tscm_setheading(h):
     """Set the turtle's heading H degrees clockwise from north (up)."""
     _check_nums(h)
-    _tscm_prep()
-    turtle.setheading(h.num_val)
+    _tscm_prep().setheading(h.num_val)
     return UNSPEC
 
 def tscm_penup():
     """Raise the pen, so that the turtle does not draw."""
-    _tscm_prep()
-    turtle.penup()
+    _tscm_prep().penup()
     return UNSPEC
 
 def tscm_pendown():
     """Lower the pen, so that the turtle starts drawing."""
-    _tscm_prep()
-    turtle.pendown()
+    _tscm_prep().pendown()
     return UNSPEC
 
 def tscm_showturtle():
     """Make turtle visible."""
-    _tscm_prep()
-    turtle.showturtle()
+    _tscm_prep().showturtle()
     return UNSPEC
 
 def tscm_hideturtle():
     """Make turtle visible."""
-    _tscm_prep()
-    turtle.hideturtle()
+    _tscm_prep().hideturtle()
     return UNSPEC
 
 def tscm_clear():
     """Clear the drawing, leaving the turtle unchanged."""
-    _tscm_prep()
-    turtle.clear()
+    _tscm_prep().clear()
     return UNSPEC
 
 def tscm_color(c):
     """Set the color to C, a symbol such as red or '#ffc0c0' (representing
     hexadecimal red, green, and blue values."""
-    _tscm_prep()
     check_type(c, scm_symbolp, 0, "color")
-    turtle.color(str(c))
+    _tscm_prep().color(str(c))
     return UNSPEC
 
 def tscm_begin_fill():
     """Start a sequence of moves that outline a shape to be filled."""
-    _tscm_prep()
-    turtle.begin_fill()
+    _tscm_prep().begin_fill()
     return UNSPEC
 
 def tscm_end_fill():
     """Fill in shape drawn since last begin_fill."""
-    _tscm_prep()
-    turtle.end_fill()
+    _tscm_prep().end_fill()
     return UNSPEC
 
 def tscm_exitonclick():
     """Wait for a click on the turtle window, and then close it."""
-    global _turtle_screen_on
-    if _turtle_screen_on:
+    turtle = current_state().turtle
+    if turtle is not None:
         turtle.exitonclick()
-        _turtle_screen_on = False
     return UNSPEC
 
 def tscm_speed(s):
@@ -793,6 +1670,18 @@ def tscm_speed(s):
     0-10, with 0 indicating no animation (lines draw instantly), and 1-10
     indicating faster and faster movement."""
     check_type(s, scm_integerp, 0, "speed")
-    _tscm_prep()
-    turtle.speed(s.num_val)
+    _tscm_prep().speed(s.num_val)
+    return UNSPEC
+
+def tscm_save_drawing(filename):
+    """Save everything the turtle has drawn to the file named by the string
+    or symbol FILENAME, as an SVG or PNG image according to its extension.
+    Symbols are read in lower case, so a string is needed for a name with
+    capitals."""
+    check_type(filename, lambda x: x.symbolp() or x.stringp(), 0,
+               "save-drawing")
+    try:
+        save_drawing(_tscm_prep().display_list, str(filename))
+    except ValueError as exc:
+        raise SchemeError(str(exc))
     return UNSPEC
@@ -0,0 +1,108 @@
+"""A deterministic profiler for Scheme procedures.
+
+The evaluators tell the Profiler when each procedure call starts (enter)
+and ends (exit); a tail call is the end of one call and the start of the
+next.  For each procedure name the profiler counts calls and accumulates
+self time (spent in the procedure's own body) and total time (including
+its callees, counted once however deeply the procedure recurses).  It
+also keeps self time for each distinct call stack, in a tree, so that it
+can write the collapsed-stack format read by flamegraph tools."""
+
+import sys
+import time
+
+
+class _StackNode:
+    """A distinct call stack: NAME called from the stack PARENT.  SELF_TIME
+    is the time spent with exactly this stack running.  A procedure that
+    calls itself directly stays in the same node, so that deep recursion
+    does not make deep stacks."""
+
+    __slots__ = ("name", "parent", "children", "self_time")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.self_time = 0.0
+
+    def child(self, name):
+        if name == self.name:
+            return self
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = _StackNode(name, self)
+        return node
+
+
+class Profiler:
+    """Call counts and times for the procedures called since it was
+    created.  CLOCK returns the current time in seconds."""
+
+    def __init__(self, clock = time.perf_counter):
+        self.clock = clock
+        self.root = _StackNode(None, None)
+        # Per procedure name, [calls, self time, total time].
+        self.stats = {}
+        # The calls in progress, innermost last, as [NODE, START, CHILD_TIME].
+        self.stack = []
+        self._active = {}
+
+    def enter(self, name):
+        """Record the start of a call to the procedure called NAME."""
+        stack = self.stack
+        parent = stack[-1][0] if stack else self.root
+        stack.append([parent.child(name), self.clock(), 0.0])
+        self._active[name] = self._active.get(name, 0) + 1
+
+    def exit(self):
+        """Record the end of the innermost call in progress."""
+        node, start, child_time = self.stack.pop()
+        elapsed = self.clock() - start
+        name = node.name
+        self_time = elapsed - child_time
+        node.self_time += self_time
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += self_time
+        active = self._active[name] - 1
+        self._active[name] = active
+        if active == 0:
+            stats[2] += elapsed
+
+    def unwind(self, depth):
+        """End the calls in progress beyond the first DEPTH, as when an
+        error abandons them."""
+        while len(self.stack) > depth:
+            self.exit()
+
+    def report(self, out = sys.stdout, limit = None):
+        """Print the procedures on OUT, most self time first (at most LIMIT
+        of them, if given)."""
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        if limit is not None:
+            rows = rows[:limit]
+        print("{0:>10} {1:>10} {2:>10}  {3}"
+              .format("calls", "self (s)", "total (s)", "procedure"), file=out)
+        for name, (calls, self_time, total) in rows:
+            print("{0:>10} {1:>10.4f} {2:>10.4f}  {3}"
+                  .format(calls, self_time, total, name), file=out)
+
+    def write_collapsed(self, out):
+        """Write the self time of every call stack on OUT, one stack per
+        line as semicolon-separated names from the outermost, followed by
+        a space and the time in microseconds."""
+        pending = [(self.root, "")]
+        while pending:
+            node, path = pending.pop()
+            if node is not self.root:
+                path = path + ";" + node.name if path else node.name
+                micros = int(round(node.self_time * 1e6))
+                if micros > 0:
+                    print("{0} {1}".format(path, micros), file=out)
+            for child in node.children.values():
+                pending.append((child, path))
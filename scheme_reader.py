@@ -0,0 +1,329 @@
+"""A bulk reader for Scheme source and data files.
+
+The interactive reader (scm_read in scheme.py) takes tokens one at a time
+from a Buffer fed line by line by scheme_tokens.tokenize_lines, which
+suits a terminal but spends most of its time in per-token bookkeeping on
+large files.  A Reader instead reads its file in large chunks, splits each
+chunk into tokens with a single compiled regular expression, and builds
+the data directly.  Line and column numbers are only computed (from the
+offset of the offending token) when an error is reported.
+
+Both readers assemble data from tokens with read_token, which keeps the
+lists under construction on an explicit stack.  The vector syntax #( ... ),
+strings and characters are recognized here rather than by scheme_tokens:
+the interactive reader takes its tokens from scan_lines, which splits
+them off before handing the rest of each line to tokenize_line.  A string
+must end on the line it starts on (\n in a string stands for a newline)."""
+
+import re
+
+from scheme_primitives import (CHAR_NAMES, NULL, THE_EOF_OBJECT, Pair,
+                               String, Symbol, Vector, boolify, make_char,
+                               make_number, numeral_value)
+from scheme_tokens import BOOLEAN, NUMERAL, SYMBOL, tokenize_line
+from scheme_utils import SchemeError
+
+# Each match skips whitespace and then matches a parenthesis, quote or
+# "#(" (group 1), an integer (group 2), the contents of a string (group 3),
+# the name of a character (group 4), a string missing its closing quote
+# (group 5), a comment (no group), or any other run of characters (group
+# 6).  Comments are matched, rather than skipped, so that searching for the
+# next token never starts inside one.  Numerals are converted directly;
+# other atoms are classified once by scheme_tokens.tokenize_line, so that
+# both readers agree on them.
+_TOKEN = re.compile(r"""\s*(?:(#\(|[()'])|([+-]?\d+)(?![^\s()';"])"""
+                    r"""|"((?:[^"\\\n]|\\.)*)"|#\\(.[^\s()';"]*)|("[^\n]*)"""
+                    r"""|([^\s()';"]+)|;[^\n]*)""")
+
+# Lines that need more than scheme_tokens.tokenize_line (see scan_line).
+_SPECIAL = re.compile(r'#[(\\]|"')
+
+_ESCAPE = re.compile(r"\\(.)")
+_ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"'}
+_CHARS = {name: char for char, name in CHAR_NAMES.items()}
+
+_QUOTE_SYM = Symbol.string_to_symbol("quote")
+
+# Markers for the syntax that is not itself a datum.
+_OPEN, _CLOSE, _QUOTE, _DOT, _VECTOR = "(", ")", "'", ".", "#("
+
+# The syntax of string and character tokens, whose values are the Python
+# strings they denote.
+STRING, CHARACTER = "string", "character"
+
+# The syntax of a token that could not be read, whose value is the error
+# message, so that the error is reported when the token is read.
+_ERROR = "error"
+
+
+class Reader:
+    """Reads Scheme data from INP, a text file, which is read CHUNK_SIZE
+    characters at a time.  NAME identifies INP in error messages."""
+
+    def __init__(self, inp, name = None, chunk_size = 1 << 20):
+        self.inp = inp
+        self.name = name or getattr(inp, "name", "<input>")
+        self.chunk_size = chunk_size
+        self._atoms = {}
+        self._data = self._read_data()
+
+    def read(self):
+        """The next datum in the file, or THE_EOF_OBJECT at its end.  After
+        a syntax error, raises SchemeError and resumes reading at the token
+        after the one at fault."""
+        result = next(self._data, THE_EOF_OBJECT)
+        if type(result) is SchemeError:
+            raise result
+        return result
+
+    def __iter__(self):
+        """Iterate over the remaining data, raising SchemeError at the first
+        syntax error."""
+        while True:
+            datum = self.read()
+            if datum is THE_EOF_OBJECT:
+                return
+            yield datum
+
+    def _chunks(self):
+        """Yield (TEXT, LINE) pairs, where TEXT is a run of complete lines
+        from the file and LINE is the number of lines preceding it.  Tokens
+        never span lines, so they never span chunks."""
+        line = 0
+        rest = ""
+        while True:
+            text = self.inp.read(self.chunk_size)
+            if not text:
+                if rest:
+                    yield rest, line
+                return
+            text = rest + text
+            end = text.rfind("\n") + 1
+            if end == 0:
+                rest = text
+                continue
+            rest = text[end:]
+            text = text[:end]
+            yield text, line
+            line += text.count("\n")
+
+    def _error(self, message, text, line, offset):
+        """A SchemeError whose message is MESSAGE followed by the location
+        of character OFFSET of TEXT, a chunk that begins after LINE lines."""
+        line += text.count("\n", 0, offset) + 1
+        column = offset - text.rfind("\n", 0, offset)
+        return SchemeError("{0} ({1}, line {2}, column {3})"
+                           .format(message, self.name, line, column))
+
+    def _atom(self, text):
+        """The datum denoted by the atom TEXT, or a tuple of the tokens it
+        is made of if it is not a single datum.  All but numerals are
+        remembered in self._atoms."""
+        val = numeral_value(text)
+        if val is not None:
+            return make_number(val)
+        try:
+            tokens = tokenize_line(text)
+        except Exception as exc:
+            raise SchemeError(exc)
+        result = tuple(tokens)
+        if len(tokens) == 1 and tokens[0][0] in (SYMBOL, BOOLEAN, NUMERAL):
+            result = _atom_datum(*tokens[0])
+        self._atoms[text] = result
+        return result
+
+    def _read_data(self):
+        """Yield each datum in the file in turn, or a SchemeError in place
+        of a malformed one, after which reading resumes at the next token.
+        Lists are built on an explicit stack (see _complete); the common
+        case of an atom inside a list is handled inline."""
+        stack = []
+        atoms = self._atoms
+        for text, line in self._chunks():
+            matches = _TOKEN.finditer(text)
+            while True:
+                try:
+                    for match in matches:
+                        delim, integer, string, char, bad, atom = match.groups()
+                        if integer is not None:
+                            datum = make_number(int(integer))
+                        elif string is not None:
+                            datum = String(_string_text(string))
+                        elif char is not None:
+                            datum = make_char(_char(char))
+                        elif bad is not None:
+                            raise SchemeError("unterminated string")
+                        elif atom is not None:
+                            datum = atoms.get(atom)
+                            if datum is None:
+                                datum = self._atom(atom)
+                            if type(datum) is tuple:
+                                for syntax, val in datum:
+                                    datum = read_token(stack, syntax, val)
+                                    if datum is not INCOMPLETE:
+                                        yield datum
+                                continue
+                        elif delim == _OPEN:
+                            head = Pair(NULL, NULL)
+                            stack.append([head, head, _OPEN])
+                            continue
+                        elif delim is None:
+                            continue
+                        else:
+                            datum = read_token(stack, delim, None)
+                            if datum is not INCOMPLETE:
+                                yield datum
+                            continue
+                        if stack:
+                            entry = stack[-1]
+                            if entry[2] is _OPEN:
+                                last = Pair(datum, NULL)
+                                entry[1].cdr = last
+                                entry[1] = last
+                                continue
+                            datum = _complete(stack, datum)
+                            if datum is INCOMPLETE:
+                                continue
+                        yield datum
+                    break
+                except SchemeError as exc:
+                    stack = []
+                    offset = match.start(match.lastindex or 0)
+                    yield self._error(exc.args[0], text, line, offset)
+        if stack:
+            yield SchemeError("unexpected EOF ({0})".format(self.name))
+
+
+def scan_line(line):
+    """The tokens in LINE, as produced by scheme_tokens.tokenize_line, with
+    each "#(" that starts a vector as the single token (_VECTOR, _VECTOR),
+    and strings and characters as (STRING, TEXT) and (CHARACTER, CHAR).
+    Malformed strings and characters become tokens that read_token reports
+    as errors."""
+    if not _SPECIAL.search(line):
+        return tokenize_line(line)
+    tokens = []
+    for match in _TOKEN.finditer(line):
+        delim, integer, string, char, bad, atom = match.groups()
+        try:
+            if delim is not None:
+                tokens.append((delim, delim))
+            elif integer is not None:
+                tokens.append((NUMERAL, int(integer)))
+            elif string is not None:
+                tokens.append((STRING, _string_text(string)))
+            elif char is not None:
+                tokens.append((CHARACTER, _char(char)))
+            elif bad is not None:
+                raise SchemeError("unterminated string")
+            elif atom is not None:
+                tokens.extend(tokenize_line(atom))
+        except SchemeError as exc:
+            tokens.append((_ERROR, exc.args[0]))
+    return tokens
+
+def _string_text(contents):
+    """The text of the string whose contents between the quotes, escapes
+    included, are CONTENTS."""
+    if "\\" not in contents:
+        return contents
+    def unescape(match):
+        char = _ESCAPES.get(match.group(1))
+        if char is None:
+            raise SchemeError("unknown escape in string: \\" + match.group(1))
+        return char
+    return _ESCAPE.sub(unescape, contents)
+
+def _char(name):
+    """The character written #\\NAME."""
+    if len(name) == 1:
+        return name
+    char = _CHARS.get(name.lower())
+    if char is None:
+        raise SchemeError("unknown character: #\\" + name)
+    return char
+
+def scan_lines(lines):
+    """An iterator over the token lists of the lines in LINES, as for
+    scheme_tokens.tokenize_lines."""
+    return map(scan_line, lines)
+
+
+# Returned by read_token and _complete while the datum being read is
+# unfinished.
+INCOMPLETE = object()
+
+def read_token(stack, syntax, val):
+    """Process the token (SYNTAX, VAL), as produced by scheme_tokens, for
+    the lists and quotations under construction in STACK (initially
+    empty), returning the datum it completes or INCOMPLETE.  Neither
+    nesting nor list length uses the Python stack."""
+    if syntax == _OPEN:
+        head = Pair(NULL, NULL)
+        stack.append([head, head, _OPEN])
+        return INCOMPLETE
+    elif syntax == _VECTOR:
+        stack.append([[], None, _VECTOR])
+        return INCOMPLETE
+    elif syntax == _QUOTE:
+        stack.append([None, None, _QUOTE])
+        return INCOMPLETE
+    elif syntax == _CLOSE:
+        if not stack or stack[-1][2] not in (_OPEN, _CLOSE, _VECTOR):
+            raise SchemeError("unexpected token: ')'")
+        head, _, state = stack.pop()
+        if state == _VECTOR:
+            return _complete(stack, Vector(head))
+        return _complete(stack, head.cdr)
+    elif syntax == _DOT:
+        if not stack or stack[-1][2] != _OPEN or stack[-1][0] is stack[-1][1]:
+            raise SchemeError("unexpected token: '.'")
+        stack[-1][2] = _DOT
+        return INCOMPLETE
+    return _complete(stack, _atom_datum(syntax, val))
+
+def _complete(stack, datum):
+    """Add the completed DATUM to the innermost list or quotation under
+    construction in STACK, returning DATUM itself if STACK is empty and
+    INCOMPLETE otherwise.  Each entry in STACK is [HEAD, LAST, STATE], where HEAD
+    is a dummy pair whose cdr is the list read so far, LAST its last pair,
+    and STATE is _OPEN while reading elements, _DOT after a dot and _CLOSE
+    once the datum after the dot has been read.  A vector is read as
+    [ITEMS, None, _VECTOR], where ITEMS is a Python list of its elements so
+    far.  A quotation awaiting its datum is [None, None, _QUOTE]."""
+    while stack:
+        entry = stack[-1]
+        state = entry[2]
+        if state == _OPEN:
+            last = Pair(datum, NULL)
+            entry[1].cdr = last
+            entry[1] = last
+        elif state == _VECTOR:
+            entry[0].append(datum)
+        elif state == _QUOTE:
+            stack.pop()
+            datum = Pair(_QUOTE_SYM, Pair(datum, NULL))
+            continue
+        elif state == _DOT:
+            entry[1].cdr = datum
+            entry[2] = _CLOSE
+        else:
+            raise SchemeError("expected ')' after the datum following '.'")
+        return INCOMPLETE
+    return datum
+
+def _atom_datum(syntax, val):
+    """The datum for the token (SYNTAX, VAL), which is not a delimiter."""
+    if syntax == SYMBOL:
+        return Symbol.string_to_symbol(val)
+    elif syntax == BOOLEAN:
+        return boolify(val)
+    elif syntax == NUMERAL:
+        return make_number(val)
+    elif syntax == STRING:
+        return String(val)
+    elif syntax == CHARACTER:
+        return make_char(val)
+    elif syntax == _ERROR:
+        raise SchemeError(val)
+    raise SchemeError("unexpected token: {0}".format(repr(val)))
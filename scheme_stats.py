@@ -0,0 +1,160 @@
+"""Counters of the work done by the Scheme interpreter.
+
+While a RuntimeStats is installed, the interpreter counts the evaluations
+of each kind of expression (each special form, calls, variables and
+constants), the calls of each primitive, the environment frames created,
+and the pairs and Numbers allocated, which are attributed to the
+primitive that allocated them, if any.  Installing substitutes counting
+versions of the constructors and of PrimitiveFunction.apply, and the
+evaluators only add counting to code analyzed or compiled while a
+RuntimeStats is installed, so that none of this costs anything otherwise.
+
+The substitutes are shared by all interpreters: while any RuntimeStats is
+installed, they count into the runtime_stats of the current interpreter
+(see current_state), if it has one."""
+
+import sys
+import threading
+
+from scheme_primitives import Number, Pair, current_state
+
+# The key under which allocations made outside any primitive (by the
+# evaluators or the reader) are counted.
+NO_PRIMITIVE = "(no primitive)"
+
+# The number of RuntimeStats installed, and while there are any, the
+# (class, name, method) triples replaced by counting versions.
+_installed_count = 0
+_saved = None
+_install_lock = threading.Lock()
+
+
+class RuntimeStats:
+    """Counts of the work done since it was installed or last reset."""
+
+    def __init__(self):
+        self.reset()
+        self._installed = False
+
+    def reset(self):
+        """Set all counts to zero."""
+        # Evaluations per kind of expression: a special form's symbol, or
+        # one of the strings the evaluators use for the other kinds.
+        self.steps = {}
+        # Per primitive name, the number of calls.
+        self.primitives = {}
+        self.frames = 0
+        # Per primitive name (or NO_PRIMITIVE), the allocations it made.
+        self.pairs = {}
+        self.numbers = {}
+        # The name of the innermost primitive running, if any.
+        self.primitive = NO_PRIMITIVE
+
+    def count(self, key):
+        """Count an evaluation of the kind of expression KEY."""
+        steps = self.steps
+        steps[key] = steps.get(key, 0) + 1
+
+    def counted(self, key, node):
+        """An analyzed node that counts an evaluation of KEY and then
+        runs NODE."""
+        def counted_node(env):
+            steps = self.steps
+            steps[key] = steps.get(key, 0) + 1
+            return node(env)
+        return counted_node
+
+    def install(self, frame_class, primitive_class):
+        """Start counting the creation of pairs, Numbers, and instances of
+        FRAME_CLASS, and the calls of instances of PRIMITIVE_CLASS, in
+        the interpreters whose runtime_stats this is."""
+        global _installed_count
+        with _install_lock:
+            if self._installed:
+                return
+            self._installed = True
+            _installed_count += 1
+            if _installed_count == 1:
+                _install_counting(frame_class, primitive_class)
+
+    def uninstall(self):
+        """Stop counting, restoring the methods replaced by install once
+        no RuntimeStats is installed."""
+        global _installed_count, _saved
+        with _install_lock:
+            if not self._installed:
+                return
+            self._installed = False
+            _installed_count -= 1
+            if _installed_count == 0:
+                for cls, name, method in _saved:
+                    setattr(cls, name, method)
+                _saved = None
+
+    def report(self, out = sys.stdout, limit = None):
+        """Print the counts on OUT, largest first (at most LIMIT rows per
+        table, if given)."""
+        def table(title, counts):
+            rows = sorted(((str(key), n) for key, n in counts.items()),
+                          key=lambda row: (-row[1], row[0]))
+            print("{0}: {1}".format(title, sum(counts.values())), file=out)
+            for key, n in rows[:limit]:
+                print("{0:>12}  {1}".format(n, key), file=out)
+        table("Expressions evaluated", self.steps)
+        table("Primitive calls", self.primitives)
+        print("Frames created: {0}".format(self.frames), file=out)
+        table("Pairs allocated", self.pairs)
+        table("Numbers boxed", self.numbers)
+
+def _install_counting(frame_class, primitive_class):
+    """Replace the constructors and apply method that RuntimeStats.install
+    counts with versions that count into the current interpreter's
+    runtime_stats."""
+    global _saved
+    _saved = [(cls, name, cls.__dict__[name])
+              for cls, name in ((Pair, "__init__"),
+                                (Number, "__init__"),
+                                (frame_class, "__init__"),
+                                (primitive_class, "apply"))]
+    pair_init = Pair.__init__
+    number_init = Number.__init__
+    frame_init = frame_class.__init__
+    apply = primitive_class.apply
+
+    def counting_pair_init(pair, car, cdr):
+        stats = current_state().runtime_stats
+        if stats is not None:
+            pairs, key = stats.pairs, stats.primitive
+            pairs[key] = pairs.get(key, 0) + 1
+        pair_init(pair, car, cdr)
+
+    def counting_number_init(number, val):
+        stats = current_state().runtime_stats
+        if stats is not None:
+            numbers, key = stats.numbers, stats.primitive
+            numbers[key] = numbers.get(key, 0) + 1
+        number_init(number, val)
+
+    def counting_frame_init(frame, *args):
+        stats = current_state().runtime_stats
+        if stats is not None:
+            stats.frames += 1
+        frame_init(frame, *args)
+
+    def counting_apply(proc, args):
+        stats = current_state().runtime_stats
+        if stats is None:
+            return apply(proc, args)
+        primitives, name = stats.primitives, proc.name
+        primitives[name] = primitives.get(name, 0) + 1
+        outer = stats.primitive
+        stats.primitive = name
+        try:
+            return apply(proc, args)
+        finally:
+            stats.primitive = outer
+
+    Pair.__init__ = counting_pair_init
+    Number.__init__ = counting_number_init
+    frame_class.__init__ = counting_frame_init
+    primitive_class.apply = counting_apply
@@ -2,77 +2,407 @@
 
 """Unit testing framework for the Logo interpreter.
 
-Usage: python3 scheme_test.py FILE
+Usage: python3 scheme_test.py [PATH ...] [--engine ENGINE] [--jobs N]
+                              [--only LINES] [--slowest N]
 
-Interprets FILE as interactive Scheme source code, and compares each line
-of printed output from the read-eval-print loop and from any output functions
-to an expected output described in a comment.  For example,
+Interprets each test file as interactive Scheme source code, using the
+evaluator ENGINE (see scheme.ENGINES; default vm), and compares each
+line of printed output from the read-eval-print loop and from any output
+functions to an expected output described in a comment.  For example,
 
 (display (+ 2 3))
 ; expect 5
 
 Differences between printed and expected outputs are printed with line numbers.
+Turtle graphics are recorded headlessly rather than drawn in a window.
+
+Each PATH is a test file or a directory, which is searched for .scm files
+containing expected outputs; the default is tests.scm.  Several files are
+run in N worker processes at once (by default, one per CPU), each file in
+a fresh global environment, and the results are reported file by file with
+their times, followed by the totals.  For compatibility, the engine may
+also be given as the last PATH, as in "scheme_test.py tests.scm vm".  The
+exit status is 1 if any test failed.
+
+Forms are evaluated one at a time.  A Python exception raised by one is
+reported as an error, its traceback is added to the report, and the run
+continues with the next form.  With --only LINES, just the forms on those
+lines of a single file are checked, after the forms before them that have
+no expected outputs of their own (definitions and other setup) are run,
+or the global definitions they left are restored from SETUP_CACHE_DIR if
+they have been run before; --slowest N lists the forms that took longest.
 """
 
+import argparse
+import bisect
+import collections
+import hashlib
 import io
+import multiprocessing
+import os
+import pickle
 import sys
+import time
+import traceback
 from ucb import main
-from scheme import call_with_input_source, create_global_environment, \
-                   read_eval_print
+import scheme
+from scheme import ENGINES, UNSPEC, THE_EOF_OBJECT, SchemeError, \
+                   call_with_input_source, create_global_environment, \
+                   report_error, scm_eval, scm_newline, scm_read, scm_write, \
+                   set_engine, set_turtle_backend, DEFAULT_ENGINE, \
+                   dump_globals, load_globals
 
-def summarize(output, expected_output):
-    """Summarize results of running tests."""
+def summarize(output, expected_output, out = None):
+    """Summarize results of running tests on OUT (the standard output by
+    default), returning the number of tests and the number that failed."""
     num_failed, num_expected = 0, len(expected_output)
     for (actual, (expected, line_number)) in zip(output, expected_output):
         if expected.startswith("Error"):
             if not actual.startswith("Error"):
                 num_failed += 1
-                print('test failed at line {0}'.format(line_number))
-                print('  expected an error indication')
-                print('   printed: {0}'.format(actual))
+                print('test failed at line {0}'.format(line_number), file=out)
+                print('  expected an error indication', file=out)
+                print('   printed: {0}'.format(actual), file=out)
         elif actual != expected:
             num_failed += 1
-            print('test failed at line {0}'.format(line_number))
-            print('  expected: {0}'.format(expected))
-            print('   printed: {0}'.format(actual))
-    print('{0} tested; {1} failed.'.format(num_expected, num_failed))
+            print('test failed at line {0}'.format(line_number), file=out)
+            print('  expected: {0}'.format(expected), file=out)
+            print('   printed: {0}'.format(actual), file=out)
+    print('{0} tested; {1} failed.'.format(num_expected, num_failed), file=out)
+    return num_expected, num_failed
 
 EXPECT_STRING = '; expect'
 
-@main
-def run_tests(src_file = 'tests.scm'):
-    """Run a read-eval loop that reads from src_file and collects outputs."""
+# The directory, relative to a test file, in which --only keeps the global
+# definitions left by the setup forms it last ran (see run_setup).
+SETUP_CACHE_DIR = "__pycache__"
+
+# A top-level form of a test file: DATUM, or the SchemeError raised when
+# reading it, which spans lines FIRST_LINE through LAST_LINE.  The lines
+# after it, up to the next form, hold its expected outputs.
+TopLevelForm = collections.namedtuple("TopLevelForm",
+                                      "first_line last_line datum")
+
+# The outcome of running one test file: the numbers of tests and failures,
+# the report printed by summarize followed by the traceback of each
+# unhandled exception (of which there were CRASHES), the time taken, and
+# the time taken by each form evaluated, as (FIRST_LINE, SECONDS) pairs.
+TestResult = collections.namedtuple(
+    "TestResult", "src_file tested failed report seconds crashes form_times")
+
+def read_forms(src):
+    """The top-level forms in the open test file SRC, as a list of
+    TopLevelForms, and its expected outputs, as a list of (EXPECTED,
+    LINE_NUMBER) pairs."""
     expected_output = []
-    line_number = 0
+    lines = []
+    forms = []
 
-    def read_lines(src):
+    def read_lines():
         """Creates a generator that returns the lines of src, filtering out
         '; expect' strings and collecting them into expected_output with their
-        line numbers.  The variable line_number gives the number of the last
-        line returned for diagnostic purposes."""
-        nonlocal line_number
+        line numbers.  All lines are kept in lines."""
         while True:
-            line_number += 1
             line = src.readline()
+            lines.append(line)
             if line.lstrip().startswith(EXPECT_STRING):
                 expected = line.split(EXPECT_STRING, 1)[1][1:-1]
-                expected_output.append((expected, line_number))
+                expected_output.append((expected, len(lines)))
                 continue
             if not line:
                 return
             yield line
 
-    sys.stderr = sys.stdout = io.StringIO() # Collect output to stdout and stderr
-    create_global_environment()
+    def read_all():
+        # A form is read when the line holding its last token is, and
+        # begins on the first line after the previous form that is neither
+        # blank nor a comment.
+        end = 0
+        while True:
+            try:
+                datum = scm_read()
+            except SchemeError as exc:
+                datum = exc
+            if datum is THE_EOF_OBJECT:
+                return
+            last = len(lines)
+            first = next((n for n in range(end + 1, last)
+                          if lines[n-1].strip()
+                          and not lines[n-1].lstrip().startswith(";")), last)
+            forms.append(TopLevelForm(first, last, datum))
+            end = last
+
+    call_with_input_source(read_lines(), read_all)
+    return forms, expected_output
+
+def eval_form(form, crashes):
+    """Evaluate FORM, a TopLevelForm, printing its value or error as the
+    read-eval-print loop does.  Python exceptions other than SchemeError
+    are reported as errors too, and their tracebacks appended to CRASHES,
+    so that later forms still run.  Before that, the global variables are
+    bound to the values they had before the form, so that definitions it
+    made are undone; but changes it made to those values themselves (to
+    pairs, vectors or hash tables, for example) are not."""
+    if isinstance(form.datum, SchemeError):
+        report_error(form.datum)
+        return
+    bindings = scheme.current_state().global_environment.inner
+    saved_bindings = dict(bindings)
     try:
-        call_with_input_source(read_lines(open(src_file)),
-                               lambda: read_eval_print(""))
-    except BaseException as exc:
-        sys.stderr = sys.__stderr__
-        print("Tests terminated due to unhandled exception "
-              "after line {0}:\n>>>".format(line_number),
+        val = scm_eval(form.datum)
+        if val is not UNSPEC:
+            scm_write(val)
+            scm_newline()
+    except SchemeError as exc:
+        report_error(exc)
+    except Exception as exc:
+        bindings.clear()
+        bindings.update(saved_bindings)
+        print("Error: {0}: {1}".format(type(exc).__name__, exc),
               file=sys.stderr)
-        raise
-    output = sys.stdout.getvalue().split('\n')
-    sys.stdout = sys.__stdout__  # Revert stdout
-    summarize(output, expected_output)
+        crashes.append("Unhandled exception in the form at line {0}:\n"
+                       ">>>\n{1}".format(form.first_line,
+                                        traceback.format_exc()))
+    sys.stdout.flush()
+
+def setup_forms(forms, expected_output, stop):
+    """The forms among FORMS[:STOP] that have no expected outputs (see
+    read_forms) of their own: those that set up the state that later
+    forms are tested in."""
+    expected_lines = sorted(line for _, line in expected_output)
+    setup = []
+    for i, form in enumerate(forms[:stop]):
+        k = bisect.bisect_right(expected_lines, form.last_line)
+        if (k == len(expected_lines)
+                or expected_lines[k] >= forms[i+1].first_line):
+            setup.append(form)
+    return setup
+
+def run_setup(src_file, setup, engine):
+    """Run the forms SETUP of the test file SRC_FILE with the named engine,
+    or, if the same forms were run last time with the same engine and
+    prelude, define the global bindings they left then instead.  Those are
+    cached (see dump_globals) in SETUP_CACHE_DIR; other effects of the
+    forms, such as changes to predefined values or turtle drawings, are
+    not."""
+    with open(src_file) as src:
+        lines = src.readlines()
+    try:
+        with open(scheme.SCHEME_PRELUDE_FILE) as src:
+            prelude = src.read()
+    except OSError:
+        prelude = ""
+    key = hashlib.sha1()
+    for text in [engine, prelude] + ["".join(lines[form.first_line-1:
+                                                   form.last_line])
+                                     for form in setup]:
+        key.update(text.encode())
+        key.update(b"\0")
+    key = key.hexdigest()
+    cache_file = os.path.join(os.path.dirname(os.path.abspath(src_file)),
+                              SETUP_CACHE_DIR,
+                              os.path.basename(src_file) + ".setup.pickle")
+    try:
+        with open(cache_file, "rb") as inp:
+            cached_key, data = pickle.load(inp)
+        if cached_key == key:
+            load_globals(data)
+            return
+    except Exception:
+        pass    # Run the forms instead.
+    for form in setup:
+        eval_form(form, [])
+    # The cache is only an optimization, so failure to write it (because a
+    # value cannot be pickled, for example) is ignored.
+    temp_file = "{0}.{1}".format(cache_file, os.getpid())
+    try:
+        data = dump_globals()
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(temp_file, "wb") as out:
+            pickle.dump((key, data), out, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except (OSError, pickle.PicklingError, TypeError, RecursionError):
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+def select_forms(forms, first, last):
+    """The range of indices in FORMS of the forms on lines FIRST through
+    LAST, where each form's lines extend to the next form, so as to
+    include its expected outputs."""
+    starts = [form.first_line for form in forms] + [float("inf")]
+    selected = [i for i in range(len(forms))
+                if starts[i] <= last and starts[i+1] > first]
+    if not selected:
+        return range(0)
+    return range(selected[0], selected[-1] + 1)
+
+def run_file(src_file, engine = DEFAULT_ENGINE, only = None):
+    """Run the forms of src_file one by one, collecting their outputs and
+    evaluating with the named engine in a fresh global environment, and
+    return its TestResult.  If ONLY is a pair of line numbers (FIRST,
+    LAST), only the forms on those lines are checked, after running the
+    forms before them that have no expected outputs (see run_setup).  The
+    forms before them that do are skipped, so the state the checked forms
+    see differs from that of a full run if those forms changed it."""
+    start = time.perf_counter()
+    set_engine(engine)
+    set_turtle_backend("record")
+    crashes, form_times = [], []
+    # Collect output to stdout and stderr
+    sys.stderr = sys.stdout = captured = io.StringIO()
+    try:
+        create_global_environment()
+        with open(src_file) as src:
+            forms, expected_output = read_forms(src)
+        selected = range(len(forms))
+        if only is not None:
+            selected = select_forms(forms, *only)
+            setup = setup_forms(forms, expected_output, selected.start)
+            if selected:
+                first = forms[selected.start].first_line
+                end = (forms[selected.stop].first_line
+                       if selected.stop < len(forms) else float("inf"))
+            else:
+                first = end = 0
+            expected_output = [(expected, line)
+                               for expected, line in expected_output
+                               if first <= line < end]
+            sys.stderr = sys.stdout = io.StringIO()    # Discarded
+            run_setup(src_file, setup, engine)
+            sys.stderr = sys.stdout = captured
+        for form in forms[selected.start:selected.stop]:
+            form_start = time.perf_counter()
+            try:
+                eval_form(form, crashes)
+            finally:
+                form_times.append((form.first_line,
+                                   time.perf_counter() - form_start))
+    except SystemExit:
+        pass    # (exit) ends the file's run
+    except BaseException as exc:
+        if isinstance(exc, KeyboardInterrupt):
+            raise
+        report = ("Tests terminated due to unhandled exception:\n"
+                  ">>>\n{0}".format(traceback.format_exc()))
+        return TestResult(src_file, 0, 0, report,
+                          time.perf_counter() - start, 1, form_times)
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__  # Revert
+    output = captured.getvalue().split('\n')
+    report = io.StringIO()
+    tested, failed = summarize(output, expected_output, report)
+    for crash in crashes:
+        print(crash, end='', file=report)
+    return TestResult(src_file, tested, failed, report.getvalue(),
+                      time.perf_counter() - start, len(crashes), form_times)
+
+def find_test_files(paths):
+    """The test files named by PATHS: each path that is a file, and the
+    .scm files containing expected outputs found in each directory, in
+    order."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(".scm"):
+                    filename = os.path.join(dirpath, name)
+                    with open(filename) as src:
+                        if EXPECT_STRING in src.read():
+                            files.append(filename)
+    return files
+
+def _run_file_task(task):
+    return run_file(*task)
+
+def run_files(files, engine, jobs = None, only = None):
+    """The TestResults of running the test FILES with the named engine, in
+    the order given, using JOBS worker processes (one per CPU if None).
+    ONLY is passed on to run_file."""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(files))
+    if jobs <= 1:
+        return [run_file(src_file, engine, only) for src_file in files]
+    # Hand out the largest files first, so that no worker is left running
+    # a long file after the others have finished.
+    tasks = sorted(((src_file, engine, only) for src_file in files),
+                   key=lambda task: -os.path.getsize(task[0]))
+    with multiprocessing.Pool(jobs) as pool:
+        results = {result.src_file: result
+                   for result in pool.imap_unordered(_run_file_task, tasks)}
+    return [results[src_file] for src_file in files]
+
+def line_range(text):
+    """The (FIRST, LAST) line numbers denoted by TEXT, which is LINE,
+    FIRST-LAST, or FIRST- (through the end of the file)."""
+    first, dash, last = text.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last else float("inf") if dash else first
+    except ValueError:
+        raise argparse.ArgumentTypeError("not a line range: " + text)
+    return first, last
+
+def report_slowest(result, limit, out = sys.stdout):
+    """Print the LIMIT forms of RESULT that took longest to run."""
+    times = sorted(result.form_times, key=lambda item: -item[1])[:limit]
+    for line, seconds in times:
+        print("{0:10.4f}s  line {1}".format(seconds, line), file=out)
+
+@main
+def run_tests(*argv):
+    parser = argparse.ArgumentParser(description="Scheme test runner")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="test file, or directory to search for test "
+                             "files (default: tests.scm)")
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+                        default=DEFAULT_ENGINE,
+                        help="evaluator to use (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of worker processes (default: one per "
+                             "CPU)")
+    parser.add_argument("--only", type=line_range, metavar="LINES",
+                        help="check just the forms on LINES (N, N-M or N-) "
+                             "of a single test file, after running the forms "
+                             "before them that have no expected outputs, or "
+                             "restoring the definitions they left when last "
+                             "run")
+    parser.add_argument("--slowest", type=int, default=0, metavar="N",
+                        help="also list the N forms of each file that took "
+                             "longest to run")
+    args = parser.parse_args(argv)
+    paths, engine = args.paths, args.engine
+    if paths and paths[-1] in ENGINES and not os.path.exists(paths[-1]):
+        engine = paths.pop()
+    files = find_test_files(paths or ['tests.scm'])
+    if not files:
+        print("no test files found", file=sys.stderr)
+        sys.exit(1)
+    if args.only is not None and len(files) > 1:
+        parser.error("--only needs a single test file")
+
+    start = time.perf_counter()
+    results = run_files(files, engine, args.jobs, args.only)
+    elapsed = time.perf_counter() - start
+    if len(results) == 1:
+        print(results[0].report, end='')
+        report_slowest(results[0], args.slowest)
+    else:
+        for result in results:
+            print("{0} ({1:.2f}s)".format(result.src_file, result.seconds))
+            print(result.report, end='')
+            report_slowest(result, args.slowest)
+        crashes = sum(result.crashes for result in results)
+        print("{0} files{1}: {2} tested; {3} failed in {4:.2f}s.".format(
+            len(results),
+            " ({0} unhandled exceptions)".format(crashes) if crashes else "",
+            sum(result.tested for result in results),
+            sum(result.failed for result in results), elapsed))
+    if any(result.failed or result.crashes for result in results):
+        sys.exit(1)
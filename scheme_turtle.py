@@ -0,0 +1,461 @@
+"""Turtle graphics backends for the Scheme interpreter.
+
+The turtle primitives in scheme_primitives.py draw through a backend
+object with the same method names as Python's turtle module.  TkTurtle
+animates on screen with that module; RecordingTurtle draws nothing and
+instead records the picture into a DisplayList, so turtle programs can run
+without a display (and without waiting for the animation).  Either way,
+the recorded picture can be saved as SVG or PNG with save_drawing."""
+
+import io
+import os
+import struct
+import sys
+import zlib
+from array import array
+from math import ceil, cos, isfinite, radians, sin
+
+try:
+    import turtle
+except ImportError:
+    turtle = None
+
+
+class TkTurtle:
+    """A backend that draws with Python's turtle module in a Tk window,
+    which is opened on first use."""
+
+    def __init__(self):
+        if turtle is None:
+            raise RuntimeError("could not import the turtle module")
+        self.screen_on = False
+        # The drawing is recorded as well, so that it can be saved.
+        self.recorder = RecordingTurtle()
+        self.display_list = self.recorder.display_list
+
+    def _prep(self):
+        if not self.screen_on:
+            self.screen_on = True
+            turtle.title("Scheme Turtles")
+            turtle.mode('logo')
+
+    def __getattr__(self, name):
+        """Drawing operations go straight to the turtle module."""
+        func = getattr(turtle, name)
+        record = getattr(self.recorder, name)
+        def operation(*args):
+            self._prep()
+            record(*args)
+            return func(*args)
+        return operation
+
+    def exitonclick(self):
+        if self.screen_on:
+            turtle.exitonclick()
+            self.screen_on = False
+
+
+class DisplayList:
+    """The drawing made by a RecordingTurtle.  Line segments are stored flat
+    in SEGMENTS as x0, y0, x1, y1 (four floats per segment), with the index
+    into COLORS of each segment's color in SEGMENT_COLORS.  FILLS is a list
+    of (SEGMENT_COUNT, COLOR_INDEX, POINTS) triples, one per filled
+    polygon, where POINTS holds the vertices flat as x, y and SEGMENT_COUNT
+    is the number of segments drawn before the polygon was filled."""
+
+    def __init__(self):
+        self.segments = array('d')
+        self.segment_colors = array('i')
+        self.fills = []
+        self.colors = []
+        self._color_index = {}
+
+    def __len__(self):
+        """The number of line segments."""
+        return len(self.segment_colors)
+
+    def color_index(self, color):
+        """The index of COLOR in self.colors, adding it if necessary."""
+        k = self._color_index.get(color)
+        if k is None:
+            k = self._color_index[color] = len(self.colors)
+            self.colors.append(color)
+        return k
+
+    def add_segment(self, x0, y0, x1, y1, color):
+        self.segments.extend((x0, y0, x1, y1))
+        self.segment_colors.append(color)
+
+    def add_fill(self, points, color):
+        self.fills.append((len(self), color, points))
+
+    def bounds(self):
+        """The bounding box (XMIN, YMIN, XMAX, YMAX) of everything drawn,
+        or None if nothing has been."""
+        xs = list(self.segments[0::2])
+        ys = list(self.segments[1::2])
+        for _, _, points in self.fills:
+            xs.extend(points[0::2])
+            ys.extend(points[1::2])
+        if not xs:
+            return None
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def clear(self):
+        del self.segments[:]
+        del self.segment_colors[:]
+        self.fills = []
+
+
+class RecordingTurtle:
+    """A backend that tracks the turtle's position, heading, pen and fill
+    state as the turtle module would in logo mode (heading 0 is north,
+    headings increase clockwise), recording each line drawn and each
+    polygon filled in SELF.display_list."""
+
+    def __init__(self):
+        self.display_list = DisplayList()
+        self.x = self.y = 0.0
+        self.heading = 0.0
+        self.pen_down = True
+        self.visible = True
+        self.color_name = "black"
+        self._color = self.display_list.color_index(self.color_name)
+        self._fill_points = None
+
+    def _goto(self, x, y):
+        if self.pen_down:
+            self.display_list.add_segment(self.x, self.y, x, y, self._color)
+        self.x, self.y = x, y
+        if self._fill_points is not None:
+            self._fill_points.extend((x, y))
+
+    def forward(self, distance):
+        angle = radians(self.heading)
+        self._goto(self.x + distance * sin(angle),
+                   self.y + distance * cos(angle))
+
+    def backward(self, distance):
+        self.forward(-distance)
+
+    def left(self, angle):
+        self.heading = (self.heading - angle) % 360
+
+    def right(self, angle):
+        self.heading = (self.heading + angle) % 360
+
+    def circle(self, radius, extent=None):
+        """Approximate the arc by a polygon, using the same number of
+        steps as the turtle module."""
+        if extent is None:
+            extent = 360
+        frac = abs(extent) / 360
+        steps = 1 + int(min(11 + abs(radius) / 6, 59) * frac)
+        w = extent / steps
+        w2 = w / 2
+        length = 2 * radius * sin(radians(w2))
+        if radius < 0:
+            length, w, w2 = -length, -w, -w2
+        self.left(w2)
+        for _ in range(steps):
+            self.forward(length)
+            self.left(w)
+        self.left(-w2)
+
+    def setposition(self, x, y):
+        self._goto(float(x), float(y))
+
+    def setheading(self, heading):
+        self.heading = heading % 360
+
+    def penup(self):
+        self.pen_down = False
+
+    def pendown(self):
+        self.pen_down = True
+
+    def showturtle(self):
+        self.visible = True
+
+    def hideturtle(self):
+        self.visible = False
+
+    def clear(self):
+        self.display_list.clear()
+        if self._fill_points is not None:
+            self._fill_points = array('d', (self.x, self.y))
+
+    def color(self, color):
+        self.color_name = color
+        self._color = self.display_list.color_index(color)
+
+    def begin_fill(self):
+        self._fill_points = array('d', (self.x, self.y))
+
+    def end_fill(self):
+        points = self._fill_points
+        self._fill_points = None
+        if points is not None and len(points) > 4:
+            self.display_list.add_fill(points, self._color)
+
+    def speed(self, speed):
+        pass
+
+    def exitonclick(self):
+        pass
+
+
+TURTLE_BACKENDS = {
+    "tk": TkTurtle,
+    "record": RecordingTurtle,
+}
+
+def display_available():
+    """True if a Tk window could be opened: always on Windows and macOS,
+    and elsewhere only when an X or Wayland display is set."""
+    if sys.platform.startswith("win") or sys.platform == "darwin":
+        return True
+    return bool(os.environ.get("DISPLAY") or
+                os.environ.get("WAYLAND_DISPLAY"))
+
+def auto_backend(interactive):
+    """The kind of backend that "auto" stands for: Tk in an INTERACTIVE
+    session (such as a read-eval-print loop at a terminal) with a display
+    to draw on, and the recorder otherwise, so that programs run from files
+    or by other programs draw headlessly unless Tk is asked for."""
+    if interactive and turtle is not None and display_available():
+        return "tk"
+    return "record"
+
+def make_turtle(backend="auto", interactive=False):
+    """A new turtle backend of kind BACKEND, one of the keys of
+    TURTLE_BACKENDS or "auto" (see auto_backend)."""
+    if backend == "auto":
+        backend = auto_backend(interactive)
+    return TURTLE_BACKENDS[backend]()
+
+##
+## Exporting drawings
+##
+
+# RGB values of the color names most used with the turtle, as Tk (X11)
+# defines them, so that saved drawings match what the window shows.
+COLOR_NAMES = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "red": (255, 0, 0),
+    "green": (0, 255, 0),
+    "blue": (0, 0, 255),
+    "yellow": (255, 255, 0),
+    "cyan": (0, 255, 255),
+    "magenta": (255, 0, 255),
+    "pink": (255, 192, 203),
+    "orange": (255, 165, 0),
+    "purple": (160, 32, 240),
+    "violet": (238, 130, 238),
+    "brown": (165, 42, 42),
+    "gold": (255, 215, 0),
+    "navy": (0, 0, 128),
+    "maroon": (176, 48, 96),
+    "gray": (190, 190, 190),
+    "grey": (190, 190, 190),
+}
+
+def color_rgb(color):
+    """The (red, green, blue) triple denoted by COLOR, either a name in
+    COLOR_NAMES or a hexadecimal #rgb or #rrggbb string."""
+    rgb = COLOR_NAMES.get(color.lower())
+    if rgb is not None:
+        return rgb
+    digits = color[1:]
+    if color.startswith("#") and len(digits) in (3, 6):
+        try:
+            if len(digits) == 3:
+                return tuple(int(d, 16) * 17 for d in digits)
+            return tuple(int(digits[k:k+2], 16) for k in range(0, 6, 2))
+        except ValueError:
+            pass
+    raise ValueError("unknown color: {0}".format(color))
+
+class _Canvas:
+    """The mapping from turtle coordinates (y upward) to image coordinates
+    (y downward) for DISPLAY_LIST, leaving MARGIN pixels around the
+    drawing."""
+
+    def __init__(self, display_list, margin):
+        bounds = display_list.bounds() or (0, 0, 0, 0)
+        if not all(isfinite(b) for b in bounds):
+            raise ValueError("cannot save a drawing that goes to infinity")
+        self.xmin, ymin, xmax, self.ymax = bounds
+        self.margin = margin
+        self.width = int(ceil(xmax - self.xmin)) + 2 * margin + 1
+        self.height = int(ceil(self.ymax - ymin)) + 2 * margin + 1
+
+    def x(self, x):
+        return x - self.xmin + self.margin
+
+    def y(self, y):
+        return self.ymax - y + self.margin
+
+def _layers(display_list):
+    """Yield the drawing in painting order: ("fill", COLOR, POINTS) for
+    each polygon and ("lines", COLOR, START, END) for each run of segments
+    between fills, the latter indexing segments START to END-1."""
+    start = 0
+    for count, color, points in display_list.fills:
+        if count > start:
+            yield "lines", None, start, count
+        yield "fill", color, points
+        start = count
+    if len(display_list) > start:
+        yield "lines", None, start, len(display_list)
+
+def write_svg(display_list, out, margin=10):
+    """Write DISPLAY_LIST to the text file OUT as an SVG image.  Segments
+    that continue one another in the same color are joined into a single
+    path."""
+    canvas = _Canvas(display_list, margin)
+    colors = ["#{0:02x}{1:02x}{2:02x}".format(*color_rgb(c))
+              for c in display_list.colors]
+    segs, seg_colors = display_list.segments, display_list.segment_colors
+
+    def coord(x, y):
+        return "{0:.2f},{1:.2f}".format(canvas.x(x), canvas.y(y))
+
+    print('<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">'
+          .format(canvas.width, canvas.height), file=out)
+    print('<rect width="100%" height="100%" fill="white"/>', file=out)
+    for layer in _layers(display_list):
+        if layer[0] == "fill":
+            _, color, points = layer
+            print('<polygon fill="{0}" fill-rule="evenodd" points="{1}"/>'
+                  .format(colors[color],
+                          " ".join(coord(points[k], points[k+1])
+                                   for k in range(0, len(points), 2))),
+                  file=out)
+            continue
+        _, _, start, end = layer
+        k = start
+        while k < end:
+            color = seg_colors[k]
+            path = ["M", coord(segs[4*k], segs[4*k+1]),
+                    "L", coord(segs[4*k+2], segs[4*k+3])]
+            k += 1
+            while (k < end and seg_colors[k] == color
+                   and segs[4*k] == segs[4*k-2]
+                   and segs[4*k+1] == segs[4*k-1]):
+                path.append(coord(segs[4*k+2], segs[4*k+3]))
+                k += 1
+            print('<path fill="none" stroke="{0}" d="{1}"/>'
+                  .format(colors[color], " ".join(path)), file=out)
+    print('</svg>', file=out)
+
+def _draw_line(pixels, width, height, x0, y0, x1, y1, rgb):
+    """Set the pixels on the line from (X0, Y0) to (X1, Y1) (Bresenham's
+    algorithm) in the row-major RGB bytearray PIXELS.  The pixels chosen do
+    not depend on the direction of the line, so retracing a line in a new
+    color covers it exactly."""
+    x0, y0, x1, y1 = int(round(x0)), int(round(y0)), int(round(x1)), int(round(y1))
+    if (x1, y1) < (x0, y0):
+        x0, y0, x1, y1 = x1, y1, x0, y0
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+    while True:
+        if 0 <= x0 < width and 0 <= y0 < height:
+            k = 3 * (y0 * width + x0)
+            pixels[k:k+3] = rgb
+        if x0 == x1 and y0 == y1:
+            return
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+
+def _fill_polygon(pixels, width, height, xs, ys, rgb):
+    """Fill the polygon with vertices XS, YS (image coordinates) in PIXELS,
+    using the even-odd rule and sampling each pixel at its center."""
+    n = len(xs)
+    edges = [(xs[k], ys[k], xs[k-1], ys[k-1]) for k in range(n)
+             if ys[k] != ys[k-1]]
+    top = max(0, int(min(ys)))
+    bottom = min(height - 1, int(ceil(max(ys))))
+    for row in range(top, bottom + 1):
+        y = row + 0.5
+        crossings = sorted(x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+                           for x0, y0, x1, y1 in edges
+                           if (y0 <= y) != (y1 <= y))
+        for k in range(0, len(crossings) - 1, 2):
+            left = max(0, int(ceil(crossings[k] - 0.5)))
+            right = min(width - 1, int(ceil(crossings[k+1] - 0.5)) - 1)
+            if left <= right:
+                base = 3 * (row * width)
+                pixels[base + 3*left:base + 3*right + 3] = rgb * (right - left + 1)
+
+# The largest width and height, in pixels, of the PNG images that
+# write_png makes.  Their pixels are all held in memory, 3 bytes each.
+MAX_PNG_SIZE = 4096
+
+def write_png(display_list, out, margin=10):
+    """Write DISPLAY_LIST to the binary file OUT as a PNG image, rasterized
+    with 1-pixel lines on a white background.  It is an error if the image
+    would be wider or taller than MAX_PNG_SIZE pixels."""
+    canvas = _Canvas(display_list, margin)
+    width, height = canvas.width, canvas.height
+    if width > MAX_PNG_SIZE or height > MAX_PNG_SIZE:
+        raise ValueError("drawing is too large for a PNG image ({0} x {1} "
+                         "pixels; at most {2} x {2}); save it as SVG instead"
+                         .format(width, height, MAX_PNG_SIZE))
+    pixels = bytearray(b"\xff" * (3 * width * height))
+    colors = [bytes(color_rgb(c)) for c in display_list.colors]
+    segs, seg_colors = display_list.segments, display_list.segment_colors
+    for layer in _layers(display_list):
+        if layer[0] == "fill":
+            _, color, points = layer
+            _fill_polygon(pixels, width, height,
+                          [canvas.x(x) for x in points[0::2]],
+                          [canvas.y(y) for y in points[1::2]],
+                          colors[color])
+            continue
+        _, _, start, end = layer
+        for k in range(start, end):
+            _draw_line(pixels, width, height,
+                       canvas.x(segs[4*k]), canvas.y(segs[4*k+1]),
+                       canvas.x(segs[4*k+2]), canvas.y(segs[4*k+3]),
+                       colors[seg_colors[k]])
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    stride = 3 * width
+    raw = b"".join(b"\x00" + pixels[row * stride:(row + 1) * stride]
+                   for row in range(height))
+    out.write(b"\x89PNG\r\n\x1a\n")
+    out.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height,
+                                         8, 2, 0, 0, 0)))
+    out.write(chunk(b"IDAT", zlib.compress(raw, 9)))
+    out.write(chunk(b"IEND", b""))
+
+def save_drawing(display_list, filename):
+    """Save DISPLAY_LIST to FILENAME, as SVG or PNG according to its
+    extension.  The image is made before the file is opened, so that a
+    drawing that cannot be saved leaves no file behind."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".svg":
+        image = io.StringIO()
+        write_svg(display_list, image)
+        mode = "w"
+    elif ext == ".png":
+        image = io.BytesIO()
+        write_png(display_list, image)
+        mode = "wb"
+    else:
+        raise ValueError("cannot save a drawing as {0!r} (use .svg or .png)"
+                         .format(filename))
+    with open(filename, mode) as out:
+        out.write(image.getvalue())
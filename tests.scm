@@ -1,7 +1,9 @@
 ;;; Test Cases for the Scheme Project 
 
-;; To run all tests:
+;; To run all tests (with the bytecode virtual machine):
 ;;     python3 scheme_test.py tests.scm
+;; and with the analyzing evaluator:
+;;     python3 scheme_test.py --engine analyze tests.scm
 ;;
 
 
@@ -352,4 +354,340 @@ LR
 (list-partitions 5 2 4)
 ; expect ((4 1) (3 2))
 (list-partitions 7 3 5)
-; expect ((5 2) (5 1 1) (4 3) (4 2 1) (3 3 1) (3 2 2))
\ No newline at end of file
+; expect ((5 2) (5 1 1) (4 3) (4 2 1) (3 3 1) (3 2 2))
+
+; The reader: lists longer and deeper than the Python recursion limit
+
+(length '(
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+  0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0
+))
+; expect 1520
+
+(define (nesting x n) (if (pair? x) (nesting (car x) (+ n 1)) n))
+(nesting '
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  (((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((((
+  x
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  )))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))))
+  0)
+; expect 1500
+
+; Syntax errors are reported, and reading carries on after them, with the
+; token after the error (here, the last ')' of '(1 . 2 3))
+)
+; expect Error
+'(1 2 .)
+; expect Error
+'(1 . 2 3)
+; expect Error
+; expect Error
+(+ 1 2)
+; expect 3
+'(1 . (2 3))
+; expect (1 2 3)
+
+; equal? on cyclic, long and shared structure
+
+(define (numbers n rest)
+  (if (= n 0) rest (numbers (- n 1) (cons n rest))))
+(equal? (numbers 100000 '()) (numbers 100000 '()))
+; expect #t
+(equal? (numbers 100000 '()) (numbers 100000 '(0)))
+; expect #f
+
+(define cycle-1 (list 1 2))
+(set-cdr! (cdr cycle-1) cycle-1)
+(define cycle-2 (list 1 2 1 2))
+(set-cdr! (cdr (cdr (cdr cycle-2))) cycle-2)
+(define cycle-3 (list 1 2 1))
+(set-cdr! (cdr (cdr cycle-3)) cycle-3)
+(equal? cycle-1 cycle-2)
+; expect #t
+(equal? cycle-1 cycle-3)
+; expect #f
+
+(define (shared-tree depth leaf)
+  (if (= depth 0)
+      leaf
+      (let ((subtree (shared-tree (- depth 1) leaf)))
+        (cons subtree subtree))))
+(equal? (shared-tree 100 'leaf) (shared-tree 100 'leaf))
+; expect #t
+(equal? (shared-tree 100 'leaf) (shared-tree 100 'other))
+; expect #f
+
+; Memoization
+
+(define-memo (fib n)
+  (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+(fib 80)
+; expect 23416728348467685
+(memo-stats fib)
+; expect (78 81 81)
+(fib 80)
+; expect 23416728348467685
+(memo-stats fib)
+; expect (79 81 81)
+
+; A memoized procedure forgets the argument lists used least recently
+(define square-calls 0)
+(define (counted-square x) (set! square-calls (+ square-calls 1)) (* x x))
+(define square-2 (memoize counted-square 2))
+(list (square-2 1) (square-2 2) (square-2 1) (square-2 3) (square-2 1)
+      (square-2 2))
+; expect (1 4 1 9 1 4)
+(memo-stats square-2)
+; expect (2 4 2)
+square-calls
+; expect 4
+
+; Vectors
+
+(define v (make-vector 3 0))
+v
+; expect #(0 0 0)
+(vector-set! v 1 'x)
+(vector-ref v 1)
+; expect x
+(vector-length v)
+; expect 3
+(vector-ref v 3)
+; expect Error
+(vector-set! v -1 'y)
+; expect Error
+'#(1 2 (3 4))
+; expect #(1 2 (3 4))
+(vector-ref #(1 2 (3 4)) 2)
+; expect (3 4)
+(equal? (vector 1 (list 2 3) #(4)) #(1 (2 3) #(4)))
+; expect #t
+(equal? #(1 2) #(1 2 3))
+; expect #f
+(eq? #(1 2) #(1 2))
+; expect #f
+
+(define f (f64vector 1 2.5))
+f
+; expect #f64(1.0 2.5)
+(list (vector? f) (f64vector? f) (vector? #(1)) (f64vector? #(1)))
+; expect (#f #t #t #f)
+(vector-length f)
+; expect 2
+(vector-set! f 0 -3)
+(vector->list f)
+; expect (-3.0 2.5)
+(vector-set! f 0 'x)
+; expect Error
+(equal? f (list->f64vector '(-3 2.5)))
+; expect #t
+
+; Hash tables
+
+(define table (make-hash-table))
+(hash-table-set! table '(1 2) 'list)
+(hash-table-set! table 'ada 36)
+(hash-table-set! table "ada" 'string)
+(hash-table-ref table (list 1 2))
+; expect list
+(hash-table-ref table 'ada)
+; expect 36
+(hash-table-ref table (string-append "a" "da"))
+; expect string
+(hash-table-ref table 'bob)
+; expect Error
+(hash-table-ref table 'bob 'none)
+; expect none
+(hash-table-set! table 'ada 37)
+(hash-table-count table)
+; expect 3
+(hash-table->alist table)
+; expect (((1 2) . list) (ada . 37) ("ada" . string))
+(hash-table-delete! table '(1 2))
+(hash-table-contains? table '(1 2))
+; expect #f
+(hash-table-keys table)
+; expect (ada "ada")
+
+(define big (* 1000000 1000000))
+(define eqv-table (make-hash-table eqv?))
+(hash-table-set! eqv-table big 'big)
+(hash-table-set! eqv-table '(1 2) 'list)
+(hash-table-ref eqv-table (* 1000000 1000000) 'none)
+; expect big
+(hash-table-ref eqv-table 1000000000000.0 'none)
+; expect none
+(hash-table-ref eqv-table (list 1 2) 'none)
+; expect none
+
+(define eq-table (make-hash-table eq?))
+(hash-table-set! eq-table 'ada 1)
+(hash-table-set! eq-table big 2)
+(hash-table-ref eq-table 'ada)
+; expect 1
+(hash-table-ref eq-table big)
+; expect 2
+(hash-table-ref eq-table (* 1000000 1000000) 'none)
+; expect none
+(hash-table-values eq-table)
+; expect (1 2)
+
+; Strings, characters and string ports
+
+"say \"hi\"\n"
+; expect "say \"hi\"\n"
+(string-length "say \"hi\"\n")
+; expect 9
+(begin (display "say \"hi\"") (newline))
+; expect say "hi"
+"a\qb"
+; expect Error
+"never ends
+; expect Error
+(string-append "ab" "" "cd")
+; expect "abcd"
+(substring "hello" 1 3)
+; expect "el"
+(substring "hello" 2 9)
+; expect Error
+(string->symbol "Hello")
+; expect Hello
+(eq? (string->symbol "Hello") 'Hello)
+; expect #f
+(eq? (string->symbol "hello") 'Hello)
+; expect #t
+(symbol->string 'Hello)
+; expect "hello"
+
+#\a
+; expect #\a
+#\space
+; expect #\space
+(list (char->integer #\a) (char->integer #\space))
+; expect (97 32)
+(string #\a #\space #\b)
+; expect "a b"
+(string-ref "abc" 1)
+; expect #\b
+
+(define out (open-output-string))
+(write-string "x = " out)
+(write "y" out)
+(write-char #\space out)
+(display 42 out)
+(get-output-string out)
+; expect "x = \"y\" 42"
+
+(word "ab" "cd")
+; expect "abcd"
+(first "hello")
+; expect "h"
+(butfirst "hello")
+; expect "ello"
+(first 'hello)
+; expect h
+
+; parallel-map and parallel-for-each
+
+(define (square x) (* x x))
+(parallel-map square '(1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20))
+; expect (1 4 9 16 25 36 49 64 81 100 121 144 169 196 225 256 289 324 361 400)
+(parallel-map + '(1 2 3) '(10 20 30))
+; expect (11 22 33)
+(parallel-map square '())
+; expect ()
+(parallel-map (lambda (x) (car x)) '(1 2))
+; expect Error
+(define (adder n) (lambda (x) (+ x n)))
+(parallel-map (adder 100) '(1 2 3))
+; expect (101 102 103)
+(define (count-up n)
+  (define (loop i acc) (if (< i 0) acc (loop (- i 1) (cons i acc))))
+  (loop (- n 1) '()))
+(length (car (parallel-map count-up '(5000))))
+; expect 5000
+(define unrelated (count-up 5000))
+(parallel-map square '(1 2 3))
+; expect (1 4 9)
+(parallel-map (lambda (k) (+ k (length unrelated))) '(0 1))
+; expect (5000 5001)
+(parallel-for-each square '(1 2 3))
+
+; The end of the file inside a list is an error (this test must come last)
+(+ 1
+; expect Error